@@ -0,0 +1,174 @@
+#! /usr/bin/python3
+"""
+title: bench tokenizer
+author: qkzk
+
+Micro benchmark of the tokenizer of the week files : the split based
+functions it replaced, copied below, against the precompiled patterns of
+`src.explore_md_file`. Reading a week file with mmap is measured too.
+
+Run from the root of the repository :
+
+    python -m benchmarks.bench_tokenizer
+"""
+from __future__ import annotations
+
+import datetime
+import mmap
+import os
+import tempfile
+import timeit
+
+from src.explore_md_file import TIME_RANGE_PATTERN, parse_date_text
+
+NUMBER = 20_000
+
+DATE_LINES = ["## Lundi 04 septembre", "## Mardi 05 septembre", "## Jeudi 07 mars"]
+END_DATES = ["Jeudi 07 septembre", "Vendredi 8 mars"]
+TIME_RANGES = ["8h55-9h50", "10h00-11h55", "14h-15h"]
+
+WEEK_CONTENT = "# Semaine 36\n\n" + "\n".join(
+    f"## Lundi {day:02d} septembre\n\n"
+    "- 8h55-9h50 - B204 - tnsi\n    cours sur les **listes**\n"
+    "- 10h00-11h55 - B107 - 2nd\n- lycée - Rentrée\n"
+    for day in range(4, 9)
+)
+
+# --- the split based functions, before the compiled tokenizer --------------
+
+LEGACY_TRADUCTION_MONTH = {
+    "janvier": "January",
+    "février": "February",
+    "mars": "March",
+    "avril": "April",
+    "mai": "May",
+    "juin": "June",
+    "juillet": "July",
+    "août": "August",
+    "septembre": "September",
+    "octobre": "October",
+    "novembre": "November",
+    "décembre": "December",
+}
+
+LEGACY_MONTHES_END_YEAR = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+]
+
+
+def legacy_get_current_year(md_month: str) -> int:
+    now = datetime.datetime.now()
+    current_year = now.year
+    if md_month in LEGACY_MONTHES_END_YEAR and now.month in range(8, 13):
+        current_year += 1
+    return current_year
+
+
+def legacy_parse_date_list(date_list: list[str]) -> datetime.datetime:
+    # depends on the locale : %B only reads english months in the C locale
+    month = LEGACY_TRADUCTION_MONTH[date_list[2]]
+    year = legacy_get_current_year(month)
+    return datetime.datetime.strptime(f"{year}-{month}-{date_list[1]}", "%Y-%B-%d")
+
+
+def legacy_parse_date_line(line: str) -> datetime.datetime:
+    return legacy_parse_date_list(line[3:].strip().split(" "))
+
+
+def legacy_parse_end_date(text: str) -> datetime.datetime:
+    return legacy_parse_date_list(text.strip().strip("-").split(" "))
+
+
+def legacy_get_hours_minute(time_str: str) -> tuple[int, int]:
+    time_list = time_str.split("h")
+    return int(time_list[0]), 0 if time_list[1] == "" else int(time_list[1])
+
+
+def legacy_parse_time_range(text: str) -> tuple[tuple[int, int], tuple[int, int]]:
+    hours_list = text.strip("*").strip().split("-")
+    return legacy_get_hours_minute(hours_list[0]), legacy_get_hours_minute(
+        hours_list[1]
+    )
+
+
+# --- the compiled tokenizer -------------------------------------------------
+
+
+def parse_time_range(text: str) -> tuple[tuple[int, int], tuple[int, int]]:
+    start_hour, start_minute, end_hour, end_minute = TIME_RANGE_PATTERN.search(
+        text
+    ).groups()
+    return (int(start_hour), int(start_minute or 0)), (
+        int(end_hour),
+        int(end_minute or 0),
+    )
+
+
+# --- reading a file ---------------------------------------------------------
+
+
+def read_lines(path: str) -> list[str]:
+    with open(path, mode="r", encoding="utf-8") as md_file:
+        return list(md_file)
+
+
+def read_mapped_lines(path: str) -> list[str]:
+    with open(path, mode="rb") as md_file:
+        with mmap.mmap(md_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return [line.decode("utf-8") for line in iter(mapped.readline, b"")]
+
+
+def legacy_school_year() -> int:
+    """The school year the legacy functions read from the current date."""
+    now = datetime.datetime.now()
+    return now.year if now.month >= 8 else now.year - 1
+
+
+def check() -> None:
+    """The compiled tokenizer reads the same values as the legacy functions."""
+    year = legacy_school_year()
+    for line in DATE_LINES:
+        assert parse_date_text(line, year) == legacy_parse_date_line(line), line
+    for line in END_DATES:
+        assert parse_date_text(line, year) == legacy_parse_end_date(line), line
+    for text in TIME_RANGES:
+        assert parse_time_range(text) == legacy_parse_time_range(text), text
+
+
+def bench(name: str, function, arguments: list) -> float:
+    """Returns the time of a call in microseconds, and prints it."""
+    elapsed = timeit.timeit(
+        lambda: [function(argument) for argument in arguments], number=NUMBER
+    )
+    per_call = elapsed / (NUMBER * len(arguments)) * 1e6
+    print(f"{name:<28} {per_call:8.3f} µs")
+    return per_call
+
+
+def main() -> None:
+    check()
+    bench("legacy date header", legacy_parse_date_line, DATE_LINES)
+    bench("compiled date header", parse_date_text, DATE_LINES)
+    bench("legacy end date", legacy_parse_end_date, END_DATES)
+    bench("compiled end date", parse_date_text, END_DATES)
+    bench("legacy time range", legacy_parse_time_range, TIME_RANGES)
+    bench("compiled time range", parse_time_range, TIME_RANGES)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".md", delete=False) as week:
+        week.write(WEEK_CONTENT)
+    try:
+        assert read_lines(week.name) == read_mapped_lines(week.name)
+        bench("read week file", read_lines, [week.name])
+        bench("read week file with mmap", read_mapped_lines, [week.name])
+    finally:
+        os.remove(week.name)
+
+
+if __name__ == "__main__":
+    main()
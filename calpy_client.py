@@ -0,0 +1,73 @@
+#! /usr/bin/python3
+"""
+title: calpy client
+author: qkzk
+
+Send week files to the sync daemon started with `calpy --daemon`.
+Only the standard library is imported : the client starts instantly.
+
+    $ ./calpy_client.py semaine_36.md semaine_37.md
+    $ ./calpy_client.py -a sadia --no-wait semaine_36.md
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# same default as src/daemon.py
+SOCKET_PATH = os.environ.get(
+    "CALPY_SOCKET", os.path.join(tempfile.gettempdir(), f"calpy-{os.getuid()}.sock")
+)
+
+
+def read_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Send week files to the calpy daemon.")
+    parser.add_argument("paths", help="week files to sync", nargs="+")
+    parser.add_argument("-a", "--agenda", help="short or long name of the agenda")
+    parser.add_argument(
+        "--no-wait",
+        dest="wait",
+        help="don't wait for the syncs to end",
+        default=True,
+        action="store_false",
+    )
+    parser.add_argument("--socket", help="path of the daemon socket", default=SOCKET_PATH)
+    return parser.parse_args()
+
+
+def send_jobs(arguments: argparse.Namespace) -> int:
+    """
+    Send a job per week file and print the answers.
+
+    @return: (int) exit status, 1 if a job failed or was refused
+    """
+    status = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(arguments.socket)
+        answers = client.makefile("r", encoding="utf-8")
+        for path in arguments.paths:
+            request = {
+                "agenda": arguments.agenda,
+                "path": os.path.abspath(path),
+                "wait": arguments.wait,
+            }
+            client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            answer = json.loads(answers.readline())
+            print(" - ".join(str(value) for value in answer.values()))
+            if answer["status"] in ("failed", "refused"):
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    arguments = read_arguments()
+    try:
+        sys.exit(send_jobs(arguments))
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(
+            f"calpy daemon isn't running on {arguments.socket}, "
+            "start it with calpy --daemon"
+        )
+        sys.exit(2)
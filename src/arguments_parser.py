@@ -13,6 +13,37 @@ def read_arguments() -> argparse.Namespace:
         The user can also review the content.
     -v, -- view_content: display the markdown content
     -y, --yes: Don't ask confirmation
+    --no_prefetch: query the API for every event instead of once per week file
+    --no_parse_cache: parse every week file, even if it didn't change since
+        the last run
+    -a, --agenda: ([str]) agendas to sync, short or long names, or "all".
+        Several agendas are synced in parallel, one process per agenda.
+    -m, --mirror: match the events against the local mirror of the agenda.
+        Can't be combined with --apply, --watch, --changed-since or --daemon.
+    -w, --workers: ([int]) 4 thread counts for the read, parse, match and write
+        stages. Sync the weeks through a pipeline instead of one after another.
+    --asynchronous: sync every event of every week concurrently, with asyncio
+    --concurrency: (int) maximum number of requests in flight with --asynchronous
+    -u, --upsert: write every event by its stable id, without looking it up.
+        Can't be combined with -w, --asynchronous, -r, --plan or --apply.
+    -j, --journal: skip the events recorded unchanged in the local journal
+        and update the changed ones by id, without any lookup.
+        Can't be combined with -w, --asynchronous, --plan or --apply.
+    -r, --reconcile: compare whole weeks, delete the remote events removed
+        from the files. Only the events written by calpy are deleted.
+        Can't be combined with --apply, --watch, --changed-since or --daemon.
+    --plan: write the operations needed to sync the weeks to
+        tokens/<agenda>/plan.json, without writing anything to the calendar
+    --apply: send the writes of the stored plan, no week file is read
+    --watch: keep running and sync the week files of the current year as soon
+        as they change
+    --changed-since: ([str]) sync the week files changed in the git repository
+        of the agenda since this reference. Without reference, since the last
+        commit synced without failure.
+    --daemon: keep running and sync the week files sent by calpy_client.py
+        over a Unix socket
+    --year: (int) the school year of the week files, 2023 for 2023-2024.
+        Defaults to CURRENT_YEAR.
     [period_number]: (int) between 1 and 5
     [week_numbers]: ([int]) corresponding week numbers. Must belong to that period
     """
@@ -57,15 +88,166 @@ def read_arguments() -> argparse.Namespace:
     parser.add_argument(
         "-a",
         "--agenda",
-        default="quentin",
+        help="one or more agendas, short or long names, or 'all'",
+        default=["quentin"],
+        nargs="+",
         type=str,
     )
 
+    parser.add_argument(
+        "--no_prefetch",
+        dest="prefetch",
+        help="query the API for every event instead of once per week file",
+        default=True,
+        action="store_false",
+    )
+
+    parser.add_argument(
+        "--no_parse_cache",
+        dest="parse_cache",
+        help="parse every week file, even if it didn't change since the last run",
+        default=True,
+        action="store_false",
+    )
+
+    parser.add_argument(
+        "-m",
+        "--mirror",
+        help="match the events against the local mirror of the agenda",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="thread counts of the read, parse, match and write stages",
+        nargs=4,
+        type=int,
+        metavar=("READ", "PARSE", "MATCH", "WRITE"),
+        default=None,
+    )
+
+    parser.add_argument(
+        "--asynchronous",
+        help="sync every event of every week concurrently, with asyncio",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        help="maximum number of requests in flight with --asynchronous",
+        default=20,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-u",
+        "--upsert",
+        help="write every event by its stable id, without looking it up",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--journal",
+        help="skip the events recorded unchanged in the local journal",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--reconcile",
+        help="delete the events of the weeks which were removed from the files",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--year",
+        help="the school year of the week files, 2023 for 2023-2024",
+        default=None,
+        type=int,
+    )
+
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--plan",
+        help="write the operations needed to sync the weeks, without syncing",
+        default=False,
+        action="store_true",
+    )
+    modes.add_argument(
+        "--apply",
+        help="send the writes of the stored plan",
+        default=False,
+        action="store_true",
+    )
+
+    modes.add_argument(
+        "--watch",
+        help="keep running and sync the week files as soon as they change",
+        default=False,
+        action="store_true",
+    )
+
+    modes.add_argument(
+        "--changed-since",
+        help="sync the week files changed in git since REF, or since the last sync",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="REF",
+    )
+
+    modes.add_argument(
+        "--daemon",
+        help="keep running and sync the week files sent by calpy_client.py",
+        default=False,
+        action="store_true",
+    )
+
     arguments = parser.parse_args()
+    reject_incompatible(parser, arguments)
 
     return arguments
 
 
+# options and the options they can't be combined with : they're only
+# implemented by the sequential sync
+INCOMPATIBLE_OPTIONS = {
+    "upsert": ("workers", "asynchronous", "reconcile", "plan", "apply"),
+    "journal": ("workers", "asynchronous", "plan", "apply"),
+    "reconcile": ("apply", "watch", "changed_since", "daemon"),
+    "mirror": ("apply", "watch", "changed_since", "daemon"),
+}
+
+
+def reject_incompatible(
+    parser: argparse.ArgumentParser,
+    arguments: argparse.Namespace,
+) -> None:
+    """
+    Exit with an usage message if an option is combined with an option
+    which would ignore it.
+
+    @param parser: (argparse.ArgumentParser) the parser of the arguments
+    @param arguments: (argparse.Namespace) the parsed arguments
+    """
+    for option, incompatibles in INCOMPATIBLE_OPTIONS.items():
+        if not getattr(arguments, option):
+            continue
+        for incompatible in incompatibles:
+            if getattr(arguments, incompatible) not in (None, False):
+                parser.error(
+                    f"--{option} can't be combined with "
+                    f"--{incompatible.replace('_', '-')}"
+                )
+
+
 def test():
     arguments = read_arguments()
     print(arguments)
@@ -0,0 +1,120 @@
+"""
+title: async calendar
+author: qkzk
+
+An asyncio client for the events of the Calendar API.
+
+The requests are the ones of the google api client, run in a pool of threads
+so many of them can be in flight while the coroutines wait. Every thread
+builds its own service : the http transport isn't thread safe. The authorized
+http session of a thread keeps its connections alive and refreshes the
+credentials when the API answers 401 Unauthorized.
+Every request goes through the scheduler, like the requests of the other
+sync modes : token bucket, adaptive concurrency and retries. The client
+allows the scheduler as many requests in flight as its threads.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+import asyncio
+import threading
+
+from googleapiclient.discovery import Resource
+
+from .config import Agenda
+from .google_interaction import build_service, iter_event_pages
+from .rate_limiter import scheduler
+
+T = TypeVar("T")
+
+DEFAULT_CONCURRENCY = 20
+
+
+class AsyncCalendarClient:
+    """
+    Send the requests of a calendar from coroutines, at most `concurrency`
+    at once.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param concurrency: (int) maximum number of requests in flight
+    @param service_factory: (Optional[Callable[[], Resource]]) builds the
+        service of a thread. Defaults to the google api service of the agenda.
+    """
+
+    def __init__(
+        self,
+        agenda: Agenda,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        service_factory: Optional[Callable[[], Resource]] = None,
+    ):
+        self.agenda = agenda
+        self.concurrency = concurrency
+        scheduler.set_concurrency(concurrency)
+        self._service_factory = service_factory or (
+            lambda: build_service(agenda, shared=False)
+        )
+        self._services = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency,
+            thread_name_prefix=f"async-{agenda.longname}",
+        )
+
+    @property
+    def service(self) -> Resource:
+        """The service of the current thread, built on first use."""
+        service = getattr(self._services, "service", None)
+        if service is None:
+            service = self._service_factory()
+            self._services.service = service
+        return service
+
+    async def list_events(self, **parameters) -> list[dict]:
+        """
+        Returns every event of a listing, following `nextPageToken`.
+        Only the fields used by Event are requested.
+
+        @param parameters: parameters of the listing, like timeMin and timeMax
+        @return: (list[dict]) the events, as returned by the API
+        """
+
+        def list_events() -> list[dict]:
+            return [
+                item
+                for page in iter_event_pages(self.agenda, self.service, **parameters)
+                for item in page.get("items", [])
+            ]
+
+        return await self.run(list_events)
+
+    async def insert_event(self, body: dict) -> dict:
+        return await self.run(
+            lambda: scheduler.execute(
+                self.service.events().insert(
+                    calendarId=self.agenda.calendar_id, body=body
+                )
+            )
+        )
+
+    async def update_event(self, event_id: str, body: dict) -> dict:
+        return await self.run(
+            lambda: scheduler.execute(
+                self.service.events().update(
+                    calendarId=self.agenda.calendar_id, eventId=event_id, body=body
+                )
+            )
+        )
+
+    async def run(self, call: Callable[[], T]) -> T:
+        """
+        Call a function in a thread of the pool and wait for its result.
+
+        @param call: (Callable[[], T]) sends requests through the scheduler
+        @return: (T) what the function returned
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def close(self) -> None:
+        """Stop the threads of the client."""
+        self._executor.shutdown()
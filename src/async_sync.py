@@ -0,0 +1,214 @@
+"""
+title: async sync
+author: qkzk
+
+Asyncio counterpart of `sync_event_from_md` and `update_or_create_event`.
+
+The lookups and writes of every event of a week run as coroutines, the
+client limiting the number of requests in flight.
+It can be awaited from any asyncio application or run from the CLI.
+"""
+from __future__ import annotations
+
+from dataclasses import replace
+from functools import partial
+from typing import Collection, Optional
+
+import asyncio
+
+from googleapiclient.errors import HttpError
+
+from .async_calendar import AsyncCalendarClient
+from .batch_writes import (
+    report_created,
+    report_failure,
+    report_unchanged,
+    report_updated,
+)
+from .config import Agenda
+from .event_index import EventIndex, window_of
+from .explore_md_file import parse_events
+from .model import Event
+from .parse_cache import parse_events_cached
+from .report import SyncReport
+
+
+async def sync_event_from_md_async(
+    agenda: Agenda,
+    client: AsyncCalendarClient,
+    path: str,
+    prefetch: bool = True,
+    report: Optional[SyncReport] = None,
+    index: Optional[EventIndex] = None,
+    parse_cache: bool = False,
+) -> SyncReport:
+    """
+    Create or update events from md file, concurrently.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param client: (AsyncCalendarClient) the client of the agenda calendar
+    @param path: (str) path to the md file
+    @param prefetch: (bool) fetch the window of the whole file once instead of
+        looking up every event. Ignored if an index is given.
+    @param report: (Optional[SyncReport]) counters to update
+    @param index: (Optional[EventIndex]) already known remote events
+    @param parse_cache: (bool) read the events from the parse cache if the
+        file didn't change
+    @returns: (SyncReport) what was created, updated or left unchanged
+    """
+    if report is None:
+        report = SyncReport()
+    # parsing reads the file and blocks : it runs in a thread of the client
+    if parse_cache:
+        event_list = await client.run(partial(parse_events_cached, agenda, path))
+    else:
+        event_list = await client.run(partial(parse_events, agenda, path))
+    if index is None and prefetch:
+        index = await retrieve_index_async(client, event_list)
+    if index is None:
+        excluded_ids = {event_details.id for event_details in event_list}
+        await asyncio.gather(
+            *(
+                update_or_create_event_async(
+                    agenda,
+                    client,
+                    event_details,
+                    report=report,
+                    excluded_ids=excluded_ids,
+                )
+                for event_details in event_list
+            )
+        )
+        return report
+    await asyncio.gather(
+        *(
+            write_event_async(client, event_details, existing_event, report=report)
+            for event_details, existing_event in index.match(event_list)
+        )
+    )
+    return report
+
+
+async def retrieve_index_async(
+    client: AsyncCalendarClient,
+    event_list: list[Event],
+) -> EventIndex:
+    """
+    Retrieve the remote events in the window of the given events.
+
+    @param client: (AsyncCalendarClient) the client of the agenda calendar
+    @param event_list: (list[Event]) parsed events
+    @returns: (EventIndex) the remote events of the window
+    """
+    window = window_of(event_list)
+    if window is None:
+        return EventIndex()
+    timeMin, timeMax = window
+    items = await client.list_events(
+        timeMin=timeMin, timeMax=timeMax, orderBy="startTime"
+    )
+    return EventIndex(Event.from_dict(item) for item in items)
+
+
+async def update_or_create_event_async(
+    agenda: Agenda,
+    client: AsyncCalendarClient,
+    event_details: Event,
+    index: Optional[EventIndex] = None,
+    report: Optional[SyncReport] = None,
+    excluded_ids: Collection[str] = (),
+) -> None:
+    """
+    Sync a single event read from a .md file.
+    Look for the existing event, then create it, update it or leave it
+    untouched if nothing changed.
+    API errors are reported, they don't stop the other events.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param client: (AsyncCalendarClient) the client of the agenda calendar
+    @param event_details: (Event) the description of an event
+    @param index: (Optional[EventIndex]) prefetched remote events. If None,
+        the API is queried for this event.
+    @param report: (Optional[SyncReport]) counters of the run, if any.
+    @param excluded_ids: (Collection[str]) ids of remote events which belong
+        to other parsed events
+    @returns: (None)
+    """
+    try:
+        if index is None:
+            index = await retrieve_index_async(client, [event_details])
+    except HttpError as error:
+        report_failure(event_details, error, report)
+        return
+    existing_event = index.find(event_details, excluded_ids)
+    await write_event_async(client, event_details, existing_event, report=report)
+
+
+async def write_event_async(
+    client: AsyncCalendarClient,
+    event_details: Event,
+    existing_event: Optional[Event],
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Create the event if there's no existing event, update it if it changed.
+    API errors are reported, they don't stop the other events.
+
+    @param client: (AsyncCalendarClient) the client of the agenda calendar
+    @param event_details: (Event) the description of an event
+    @param existing_event: (Optional[Event]) the matching remote event
+    @param report: (Optional[SyncReport]) counters of the run, if any.
+    @returns: (None)
+    """
+    try:
+        if existing_event is None:
+            response = await client.insert_event(event_details.__dict__)
+            report_created(event_details, response, report)
+        elif existing_event.has_same_content(event_details):
+            report_unchanged(event_details, report)
+        else:
+            updated_event = replace(existing_event)
+            updated_event.update(event_details)
+            response = await client.update_event(
+                existing_event.id, updated_event.__dict__
+            )
+            report_updated(event_details, response, report)
+    except HttpError as error:
+        report_failure(event_details, error, report)
+
+
+async def sync_weeks_async(
+    agenda: Agenda,
+    client: AsyncCalendarClient,
+    path_list: list[str],
+    prefetch: bool = True,
+    index: Optional[EventIndex] = None,
+    parse_cache: bool = False,
+) -> SyncReport:
+    """
+    Sync every week file concurrently.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param client: (AsyncCalendarClient) the client of the agenda calendar
+    @param path_list: (list[str]) the week files
+    @param prefetch: (bool) prefetch the window of every file
+    @param index: (Optional[EventIndex]) already known remote events
+    @param parse_cache: (bool) read the unchanged files from the parse cache
+    @returns: (SyncReport) the report of every week
+    """
+    report = SyncReport()
+    await asyncio.gather(
+        *(
+            sync_event_from_md_async(
+                agenda,
+                client,
+                path,
+                prefetch=prefetch,
+                report=report,
+                index=index,
+                parse_cache=parse_cache,
+            )
+            for path in path_list
+        )
+    )
+    return report
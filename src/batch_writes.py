@@ -0,0 +1,403 @@
+"""
+title: batch writes
+author: qkzk
+
+Group the insertions, updates and deletions of events into batch http requests.
+Google Calendar accepts at most 50 requests per batch.
+"""
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import Any, Callable, Optional
+
+from googleapiclient.discovery import Resource
+from googleapiclient.http import HttpRequest
+
+from .colors import color_text
+from .config import Agenda
+from .logger import logger
+from .model import Event
+from .rate_limiter import (
+    error_status,
+    is_idempotent,
+    is_retryable,
+    is_throttling,
+    may_retry,
+    scheduler,
+)
+from .report import SyncReport
+
+BATCH_SIZE = 50
+
+# an http status and the function queuing the request to send instead
+Fallback = tuple[int, Callable[[], None]]
+# request, event, success callback and fallback of a queued write
+PendingWrite = tuple[HttpRequest, Event, Callable[[dict], Any], Optional[Fallback]]
+
+
+def report_created(
+    event_details: Event,
+    response: dict,
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Print and log the creation of an event.
+
+    @param event_details: (Event) the created event
+    @param response: (dict) the API response
+    @param report: (Optional[SyncReport]) counters of the run, if any
+    """
+    if report is not None:
+        report.created += 1
+    creation_event_msg = f"Event created: {event_details.readable_start_date()} {response.get('htmlLink')}"
+    print(color_text(creation_event_msg, "YELLOW"))
+    logger.warning(creation_event_msg)
+
+
+def report_updated(
+    new_event: Event,
+    response: dict,
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Print and log the update of an event.
+
+    @param new_event: (Event) the pushed event
+    @param response: (dict) the API response
+    @param report: (Optional[SyncReport]) counters of the run, if any
+    """
+    if report is not None:
+        report.updated += 1
+    update_event_msg = (
+        f"Event updated: {new_event.readable_start_date()} {response['htmlLink']}"
+    )
+    print(color_text(update_event_msg, "CYAN"))
+    logger.warning(update_event_msg)
+
+
+def report_unchanged(
+    event_details: Event,
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Log an event which doesn't need any update.
+
+    @param event_details: (Event) the parsed event
+    @param report: (Optional[SyncReport]) counters of the run, if any
+    """
+    if report is not None:
+        report.unchanged += 1
+    logger.info(f"Event unchanged: {event_details.readable_start_date()}")
+
+
+def report_deleted(
+    event_details: Event,
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Print and log the deletion of an event.
+
+    @param event_details: (Event) the deleted event
+    @param report: (Optional[SyncReport]) counters of the run, if any
+    """
+    if report is not None:
+        report.deleted += 1
+    deletion_event_msg = f"Event deleted: {event_details.readable_start_date()} {event_details.summary}"
+    print(color_text(deletion_event_msg, "PURPLE"))
+    logger.warning(deletion_event_msg)
+
+
+def report_failure(
+    event_details: Event,
+    exception: Exception,
+    report: Optional[SyncReport] = None,
+) -> None:
+    """
+    Print and log a failed write.
+
+    @param event_details: (Event) the event we tried to push
+    @param exception: (Exception) the error returned for this request
+    @param report: (Optional[SyncReport]) counters of the run, if any
+    """
+    if report is not None:
+        report.failed += 1
+    failure_msg = f"Event failed: {event_details.readable_start_date()} {exception}"
+    print(color_text(failure_msg, "RED"))
+    logger.error(failure_msg)
+
+
+class EventWriteBatch:
+    """
+    Collect the writes of a sync and send them in batch requests.
+
+    Every queued request comes with its own callback, called with the API
+    response once the batch is executed. A batch is sent as soon as it's full,
+    the remaining requests are sent by `flush`.
+
+    `on_written` is called with the event and the API response after every
+    successful creation or update, `on_deleted` with the remote event after
+    every successful deletion.
+
+    A request may come with a fallback : if the API answers with the given
+    status, the fallback queues another request instead of reporting a failure.
+
+    With `conditional`, updates and deletions of remote events are only done
+    if the event didn't change since it was read : its etag is sent in an
+    If-Match header, the API answers 412 Precondition Failed otherwise.
+
+    With `hold`, nothing is sent before `flush`, even by a full batch : the
+    writes of a week file are queued while it's parsed and sent only if the
+    whole file could be read.
+    """
+
+    def __init__(
+        self,
+        agenda: Agenda,
+        service: Resource,
+        report: Optional[SyncReport] = None,
+        size: int = BATCH_SIZE,
+        on_written: Optional[Callable[[Event, dict], Any]] = None,
+        conditional: bool = False,
+        on_deleted: Optional[Callable[[Event], Any]] = None,
+        hold: bool = False,
+    ):
+        self.agenda = agenda
+        self.service = service
+        self.report = report
+        self.size = size
+        self.on_written = on_written
+        self.conditional = conditional
+        self.on_deleted = on_deleted
+        self.hold = hold
+        self.failures: list[tuple[Event, Exception]] = []
+        self._pending: list[PendingWrite] = []
+
+    def insert(self, event_details: Event) -> None:
+        """
+        Queue the creation of an event.
+        An event with a client supplied id may already exist, deleted or not.
+        If the API answers 409 Conflict, the event is updated by id instead.
+
+        @param event_details: (Event) the event to create
+        """
+        fallback = None
+        if event_details.id:
+            fallback = (409, lambda: self._queue_update_by_id(event_details))
+        self._add(
+            self._insert_request(event_details),
+            event_details,
+            self._reporter(report_created, event_details),
+            fallback,
+        )
+
+    def upsert(
+        self,
+        event_details: Event,
+        on_missing: Optional[Callable[[Event], None]] = None,
+    ) -> None:
+        """
+        Queue the update of an event by its id, without looking it up.
+        If the API answers 404 Not Found, `on_missing` is called with the
+        event : the event may exist with another id, written before it had a
+        stable one. Without `on_missing`, the event is created with this id.
+
+        @param event_details: (Event) a parsed event, with a stable id
+        @param on_missing: (Optional[Callable[[Event], None]]) queues the
+            writes of an event unknown by its id
+        """
+        if on_missing is None:
+            fallback = (404, lambda: self._queue(self._insert_write(event_details)))
+        else:
+            fallback = (404, lambda: on_missing(event_details))
+        self._queue_update_by_id(event_details, fallback=fallback)
+        self._flush_if_full()
+
+    def update(self, new_event: Event, old_event: Event) -> None:
+        """
+        Queue the update of an existing event.
+        The old event isn't modified : it may be indexed by its start.
+
+        @param new_event: (Event) the new event to push
+        @param old_event: (Event) the old event to update
+        """
+        updated_event = replace(old_event)
+        updated_event.update(new_event)
+        request = self.service.events().update(
+            calendarId=self.agenda.calendar_id,
+            eventId=old_event.id,
+            body=updated_event.__dict__,
+        )
+        self._match_version(request, old_event)
+        self._add(
+            request,
+            new_event,
+            self._reporter(report_updated, new_event),
+        )
+
+    def delete(self, old_event: Event) -> None:
+        """
+        Queue the deletion of an existing event.
+
+        @param old_event: (Event) the remote event to delete
+        """
+        request = self.service.events().delete(
+            calendarId=self.agenda.calendar_id,
+            eventId=old_event.id,
+        )
+        self._match_version(request, old_event)
+
+        def on_success(_: dict) -> None:
+            report_deleted(old_event, self.report)
+            if self.on_deleted is not None:
+                self.on_deleted(old_event)
+
+        self._add(request, old_event, on_success)
+
+    def _match_version(self, request: HttpRequest, old_event: Event) -> None:
+        """Make a conditional request sent only if the event is unchanged."""
+        if self.conditional and old_event.etag:
+            request.headers["If-Match"] = old_event.etag
+
+    def _reporter(
+        self,
+        report_function: Callable[[Event, dict, Optional[SyncReport]], None],
+        event_details: Event,
+    ) -> Callable[[dict], None]:
+        """Returns the success callback of a creation or an update."""
+
+        def on_success(response: dict) -> None:
+            report_function(event_details, response, self.report)
+            if self.on_written is not None:
+                self.on_written(event_details, response)
+
+        return on_success
+
+    def _insert_request(self, event_details: Event) -> HttpRequest:
+        return self.service.events().insert(
+            calendarId=self.agenda.calendar_id,
+            body=event_details.__dict__,
+        )
+
+    def _insert_write(self, event_details: Event) -> PendingWrite:
+        return (
+            self._insert_request(event_details),
+            event_details,
+            self._reporter(report_created, event_details),
+            None,
+        )
+
+    def _queue_update_by_id(
+        self,
+        event_details: Event,
+        fallback: Optional[Fallback] = None,
+    ) -> None:
+        """
+        Queue the update of the event having the same id. A deleted event is
+        restored.
+        """
+        request = self.service.events().update(
+            calendarId=self.agenda.calendar_id,
+            eventId=event_details.id,
+            body=dict(event_details.__dict__, status="confirmed"),
+        )
+        self._queue(
+            (
+                request,
+                event_details,
+                self._reporter(report_updated, event_details),
+                fallback,
+            )
+        )
+
+    def _add(
+        self,
+        request: HttpRequest,
+        event_details: Event,
+        on_success: Callable[[dict], Any],
+        fallback: Optional[Fallback] = None,
+    ) -> None:
+        self._queue((request, event_details, on_success, fallback))
+        self._flush_if_full()
+
+    def _queue(self, write: PendingWrite) -> None:
+        self._pending.append(write)
+
+    def _flush_if_full(self) -> None:
+        if not self.hold and len(self._pending) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Send every pending request, in chunks of at most `size` requests.
+        Requests queued by fallbacks are sent in the following chunks.
+        """
+        while self._pending:
+            chunk = self._pending[: self.size]
+            self._pending = self._pending[self.size :]
+            self._execute(chunk)
+
+    def _execute(self, chunk: list[PendingWrite]) -> None:
+        """
+        Send a chunk through the scheduler.
+        Requests refused because of rate limits or server errors are sent again
+        in a smaller batch, after a backoff. Only the failed requests are sent
+        again, and a creation without id only after a rate limit : after a
+        server error, it may have been done.
+        """
+        attempt = 0
+        while chunk:
+            last_attempt = attempt >= scheduler.max_retries
+            retries = self._execute_once(chunk, last_attempt)
+            if not retries:
+                return
+            if any(is_throttling(error) for _, error in retries):
+                scheduler.throttled(retries[0][1])
+            scheduler.backoff(attempt)
+            attempt += 1
+            chunk = [item for item, _ in retries]
+
+    def _execute_once(
+        self,
+        chunk: list[PendingWrite],
+        last_attempt: bool,
+    ) -> list[tuple[PendingWrite, Exception]]:
+        """
+        Send a chunk in a single batch request.
+        If the whole batch fails, every request without an answer failed with
+        this error.
+
+        @return: the items to send again, with their error.
+        """
+        retries = []
+        answered: set[str] = set()
+
+        def callback(
+            request_id: str, response: dict, exception: Optional[Exception]
+        ) -> None:
+            answered.add(request_id)
+            item = chunk[int(request_id)]
+            request, event_details, on_success, fallback = item
+            if exception is None:
+                on_success(response)
+            elif may_retry(exception, is_idempotent(request)) and not last_attempt:
+                retries.append((item, exception))
+            elif fallback is not None and error_status(exception) == fallback[0]:
+                fallback[1]()
+            else:
+                self.failures.append((event_details, exception))
+                report_failure(event_details, exception, self.report)
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for request_id, (request, _, _, _) in enumerate(chunk):
+            batch.add(request, request_id=str(request_id))
+        try:
+            # only the failed requests are sent again, never the whole batch
+            scheduler.run(batch.execute, cost=len(chunk), idempotent=False)
+        except Exception as error:
+            if not is_retryable(error):
+                raise
+            for request_id in map(str, range(len(chunk))):
+                if request_id not in answered:
+                    callback(request_id, {}, error)
+        logger.debug(f"Batch of {len(chunk)} requests sent, {len(retries)} to retry")
+        return retries
@@ -8,17 +8,46 @@ description:
 événements dans google calendar'
 ---
 """
-from os.path import exists
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from os.path import exists, join
+
+import argparse
+import asyncio
 
 from googleapiclient.discovery import Resource
 
 from src.config import agendas, default_agenda, Agenda
 
 from .arguments_parser import read_arguments
+from .async_calendar import AsyncCalendarClient
+from .async_sync import sync_weeks_async
 from .colors import color_text
+from .credentials import credentials_manager
+from .daemon import SyncDaemon
+from .git_changes import (
+    changed_week_files,
+    last_synced_commit,
+    read_files_at,
+    resolve_commit,
+    store_synced_commit,
+)
 from .google_interaction import build_service, sync_event_from_md
+from .journal import SyncJournal, journaled_ids
 from .logger import logger
-from .user_interaction import warn_and_get_path, WRONG_PATH_MSG
+from .mirror import refreshed_mirror
+from .plan import (
+    NOOP,
+    SyncPlan,
+    apply_plan,
+    parse_weeks,
+    plan_weeks,
+    snapshot_of,
+)
+from .pipeline import PipelineWorkers, sync_weeks_pipelined
+from .report import SyncReport
+from .watch import watch_agendas
+from .user_interaction import warn_and_get_paths, WRONG_PATH_MSG
 
 STARTING_APPLICATION_MSG = "Calendar Python started !"
 EXPLORING_MSG = """
@@ -30,10 +59,25 @@ DONE ADDING THE EVENTS TO GOOGLE CALENDAR !
 
 """
 
+SUMMARY_MSG = "SUMMARY - {}"
+AGENDA_SUMMARY_MSG = "AGENDA {} - {}"
+AGENDA_FAILED_MSG = "AGENDA {} - FAILED : {}"
+WEEK_SUMMARY_MSG = "{} - {}"
+WEEK_FAILED_MSG = "{} - FAILED : {}"
+
 SELECTED_AGENDA_MSG = """
 YOU PICKED THE AGENDA : {}
 """
 
+CHANGED_WEEKS_MSG = "{} week files changed since {}"
+NO_LAST_SYNC_MSG = """No synced commit stored for {}.
+Give a reference : --changed-since <ref>"""
+PLAN_MSG = "PLAN {} - {} - written to {}"
+NO_PLAN_MSG = """No plan to apply for {}.
+Make one first : --plan"""
+
+ALL_AGENDAS = "all"
+
 
 def pick_agenda(agenda_name_from_args: str) -> Agenda:
     """
@@ -51,6 +95,39 @@ def pick_agenda(agenda_name_from_args: str) -> Agenda:
     return default_agenda
 
 
+def pick_agendas(agenda_names_from_args: list[str]) -> list[Agenda]:
+    """
+    Returns the selected agendas from command line arguments, without
+    duplicates, in the given order.
+    "all" selects every configured agenda.
+
+    @param agenda_names_from_args: (list[str]) the parsed names from command
+        line arguments. They may be short or longnames.
+    """
+    if ALL_AGENDAS in agenda_names_from_args:
+        return list(agendas)
+    picked = []
+    for agenda_name in agenda_names_from_args:
+        agenda = pick_agenda(agenda_name)
+        if agenda not in picked:
+            picked.append(agenda)
+    return picked
+
+
+def raise_if_missing(path: str) -> None:
+    """
+    Raise FileNotFoundError if the week file doesn't exist.
+
+    @param path: (str) path to a week file
+    """
+    if not exists(path):
+        logger.debug("File not found : {}".format(path))
+        raise FileNotFoundError(
+            f"""File not found : {path}
+{WRONG_PATH_MSG}"""
+        )
+
+
 def create_or_update_week_events() -> None:
     """
     The main function.
@@ -79,27 +156,293 @@ def create_or_update_week_events() -> None:
 
     arguments = read_arguments()
 
-    # select the correct agenda and print it
-    agenda = pick_agenda(arguments.agenda)
-    print(color_text(SELECTED_AGENDA_MSG.format(agenda.longname), "YELLOW"))
+    # select the correct agendas and print them
+    selected_agendas = pick_agendas(arguments.agenda)
+    if arguments.year is not None:
+        selected_agendas = [
+            replace(agenda, year=arguments.year) for agenda in selected_agendas
+        ]
+    if arguments.daemon:
+        SyncDaemon(selected_agendas, arguments).serve_forever()
+        return
 
-    # get the path from the user, provided as args or not.
-    path_list = warn_and_get_path(arguments, agenda)
+    if arguments.apply or arguments.watch or arguments.changed_since is not None:
+        if arguments.apply:
+            report = apply_stored_plans(selected_agendas)
+        elif arguments.watch:
+            report = watch_agendas(selected_agendas, arguments)
+        else:
+            report = SyncReport()
+            for agenda in selected_agendas:
+                report += sync_changed_weeks(agenda, arguments)
+        summary_msg = SUMMARY_MSG.format(report.summary())
+        print(color_text(summary_msg, "DARKCYAN"))
+        logger.warning(summary_msg)
+        return
+
+    # get the paths from the user, provided as args or not, once for every
+    # agenda : the processes syncing them never prompt.
+    path_lists = warn_and_get_paths(arguments, selected_agendas)
     # if isn't exited yet, we continue.
+    paths_per_agenda = list(zip(selected_agendas, path_lists))
+    for agenda, path_list in paths_per_agenda:
+        print(color_text(SELECTED_AGENDA_MSG.format(agenda.longname), "YELLOW"))
+        for path in path_list:
+            raise_if_missing(path)
+
+    if arguments.plan:
+        for agenda, path_list in paths_per_agenda:
+            plan_agenda(agenda, path_list, arguments)
+        return
+
+    if len(paths_per_agenda) == 1:
+        agenda, path_list = paths_per_agenda[0]
+        report = sync_agenda(agenda, path_list, arguments)
+    else:
+        report = sync_agendas_in_parallel(paths_per_agenda, arguments)
+
+    summary_msg = SUMMARY_MSG.format(report.summary())
+    print(color_text(summary_msg, "DARKCYAN"))
+    logger.warning(summary_msg)
+
 
+def plan_agenda(
+    agenda: Agenda,
+    path_list: list[str],
+    arguments: argparse.Namespace,
+) -> SyncPlan:
+    """
+    Plan the sync of the week files of an agenda and store the plan.
+    The calendar is only read, nothing is written.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path_list: (list[str]) the week files
+    @param arguments: (argparse.Namespace) provided args
+    @return: (SyncPlan) the stored plan
+    """
     service: Resource = build_service(agenda)
+    parsed_weeks = parse_weeks(agenda, path_list, arguments.parse_cache)
+    if arguments.mirror:
+        snapshot = refreshed_mirror(agenda, service).index()
+    else:
+        snapshot = snapshot_of(
+            agenda, service, parsed_weeks, reconcile=arguments.reconcile
+        )
+    plan = plan_weeks(
+        agenda,
+        parsed_weeks,
+        snapshot,
+        reconcile=arguments.reconcile,
+        journaled_ids=journaled_ids(agenda) if arguments.reconcile else (),
+    )
+    for operation in plan.operations:
+        if operation.action != NOOP:
+            print(operation.describe())
+    plan_path = plan.save()
+    plan_msg = PLAN_MSG.format(agenda.longname, plan.summary(), plan_path)
+    print(color_text(plan_msg, "DARKCYAN"))
+    logger.warning(plan_msg)
+    return plan
 
-    for path in path_list:
-        if not exists(path):
-            logger.debug("File not found : {}".format(path))
-            raise FileNotFoundError(
-                f"""File not found : {path}
-{WRONG_PATH_MSG}"""
+
+def apply_stored_plans(selected_agendas: list[Agenda]) -> SyncReport:
+    """
+    Apply the stored plan of every agenda, one after another.
+    An applied plan is marked as such and can't be applied again.
+
+    @param selected_agendas: (list[Agenda]) the agendas to sync
+    @return: (SyncReport) the sum of the reports of every agenda
+    """
+    report = SyncReport()
+    for agenda in selected_agendas:
+        print(color_text(SELECTED_AGENDA_MSG.format(agenda.longname), "YELLOW"))
+        try:
+            plan = SyncPlan.load(agenda)
+        except FileNotFoundError:
+            no_plan_msg = NO_PLAN_MSG.format(agenda.longname)
+            print(color_text(no_plan_msg, "RED"))
+            logger.error(no_plan_msg)
+            continue
+        report += apply_plan(agenda, build_service(agenda), plan)
+        plan.mark_applied()
+    return report
+
+
+def sync_changed_weeks(agenda: Agenda, arguments: argparse.Namespace) -> SyncReport:
+    """
+    Sync the week files changed in the git repository of the agenda since
+    the given reference, or since the last commit synced without failure.
+    The files are read at HEAD from the git objects.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param arguments: (argparse.Namespace) provided args
+    @return: (SyncReport) what was done in the agenda
+    """
+    print(color_text(SELECTED_AGENDA_MSG.format(agenda.longname), "YELLOW"))
+    repo_path = agenda.git_repo_path
+    since = arguments.changed_since or last_synced_commit(agenda)
+    if since is None:
+        no_last_sync_msg = NO_LAST_SYNC_MSG.format(agenda.longname)
+        print(color_text(no_last_sync_msg, "RED"))
+        logger.error(no_last_sync_msg)
+        return SyncReport()
+    head = resolve_commit(repo_path, "HEAD")
+    changed = changed_week_files(repo_path, since, head, agenda.year)
+    print(color_text(CHANGED_WEEKS_MSG.format(len(changed), since), "DARKCYAN"))
+
+    service: Resource = build_service(agenda)
+    journal = SyncJournal(agenda) if arguments.journal else None
+    report = SyncReport()
+    for path, lines in read_files_at(repo_path, head, changed).items():
+        print(EXPLORING_MSG)
+        sync_event_from_md(
+            agenda,
+            service,
+            join(repo_path, path),
+            prefetch=arguments.prefetch,
+            report=report,
+            upsert=arguments.upsert,
+            journal=journal,
+            lines=lines,
+        )
+    if journal is not None:
+        journal.close()
+    if not report.failed:
+        store_synced_commit(agenda, head)
+    return report
+
+
+def sync_agendas_in_parallel(
+    paths_per_agenda: list[tuple[Agenda, list[str]]],
+    arguments: argparse.Namespace,
+) -> SyncReport:
+    """
+    Sync every agenda in its own process and aggregate their reports.
+    The credentials are refreshed concurrently beforehand and stored, so the
+    processes don't refresh them again. Every process builds its own service.
+    The week files were chosen by the main process : nothing prompts the user
+    from the processes.
+
+    @param paths_per_agenda: (list[tuple[Agenda, list[str]]]) the week files of
+        every agenda
+    @param arguments: (argparse.Namespace) provided args
+    @return: (SyncReport) the sum of the reports of every agenda
+    """
+    report = SyncReport()
+    credentials_manager.get_all([agenda for agenda, _ in paths_per_agenda])
+    with ProcessPoolExecutor(max_workers=len(paths_per_agenda)) as executor:
+        futures = [
+            (agenda, executor.submit(sync_agenda, agenda, path_list, arguments))
+            for agenda, path_list in paths_per_agenda
+        ]
+        for agenda, future in futures:
+            try:
+                agenda_report = future.result()
+            except Exception as error:
+                failed_msg = AGENDA_FAILED_MSG.format(agenda.longname, error)
+                print(color_text(failed_msg, "RED"))
+                logger.error(failed_msg)
+                continue
+            report += agenda_report
+            agenda_msg = AGENDA_SUMMARY_MSG.format(
+                agenda.longname, agenda_report.summary()
             )
+            print(color_text(agenda_msg, "DARKCYAN"))
+            logger.warning(agenda_msg)
+    return report
+
+
+def sync_agenda(
+    agenda: Agenda,
+    path_list: list[str],
+    arguments: argparse.Namespace,
+) -> SyncReport:
+    """
+    Sync the week files of an agenda, one after another, through the
+    pipeline if worker counts were given or concurrently with asyncio.
+    When reconciling, the events removed from the files are deleted too.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path_list: (list[str]) the week files
+    @param arguments: (argparse.Namespace) provided args
+    @return: (SyncReport) what was done in the agenda
+    """
+    service: Resource = build_service(agenda)
+    report = SyncReport()
+    index = refreshed_mirror(agenda, service).index() if arguments.mirror else None
 
+    if arguments.reconcile:
         print(EXPLORING_MSG)
-        sync_event_from_md(agenda, service, path)
+        parsed_weeks = parse_weeks(agenda, path_list, arguments.parse_cache)
+        if index is None:
+            index = snapshot_of(agenda, service, parsed_weeks, reconcile=True)
+        plan = plan_weeks(
+            agenda,
+            parsed_weeks,
+            index,
+            reconcile=True,
+            journaled_ids=journaled_ids(agenda),
+        )
+        journal = SyncJournal(agenda) if arguments.journal else None
+        try:
+            report = apply_plan(agenda, service, plan, journal=journal)
+        finally:
+            if journal is not None:
+                journal.close()
         print(color_text(CONFIRMATION_MSG, "DARKCYAN"))
+    elif arguments.asynchronous:
+        print(EXPLORING_MSG)
+        client = AsyncCalendarClient(agenda, concurrency=arguments.concurrency)
+        try:
+            report = asyncio.run(
+                sync_weeks_async(
+                    agenda,
+                    client,
+                    path_list,
+                    prefetch=arguments.prefetch,
+                    index=index,
+                    parse_cache=arguments.parse_cache,
+                )
+            )
+        finally:
+            client.close()
+        print(color_text(CONFIRMATION_MSG, "DARKCYAN"))
+    elif arguments.workers is not None:
+        print(EXPLORING_MSG)
+        jobs = sync_weeks_pipelined(
+            agenda,
+            path_list,
+            workers=PipelineWorkers.from_list(arguments.workers),
+            prefetch=arguments.prefetch,
+            index=index,
+            parse_cache=arguments.parse_cache,
+        )
+        for job in jobs:
+            report += job.report
+            if job.error is None:
+                print(color_text(WEEK_SUMMARY_MSG.format(job.path, job.report.summary())))
+            else:
+                print(color_text(WEEK_FAILED_MSG.format(job.path, job.error), "RED"))
+        print(color_text(CONFIRMATION_MSG, "DARKCYAN"))
+    else:
+        journal = SyncJournal(agenda) if arguments.journal else None
+        for path in path_list:
+            print(EXPLORING_MSG)
+            sync_event_from_md(
+                agenda,
+                service,
+                path,
+                prefetch=arguments.prefetch,
+                report=report,
+                index=index,
+                upsert=arguments.upsert,
+                journal=journal,
+                parse_cache=arguments.parse_cache,
+            )
+            print(color_text(CONFIRMATION_MSG, "DARKCYAN"))
+        if journal is not None:
+            journal.close()
+    return report
 
 
 if __name__ == "__main__":
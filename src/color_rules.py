@@ -0,0 +1,141 @@
+"""
+title: color rules
+author: qkzk
+
+Pick the color of an event from keywords of its summary.
+
+The rules of an agenda are its `colors` in config.yml, or
+`STUDENT_CLASS_COLORS` : color ids and their keywords, by priority.
+They're compiled once per agenda into a single pattern : the keywords are
+merged in a trie, so the pattern branches on the next char instead of trying
+every keyword. Every position of the summary is tried with a lookahead and
+the longest keyword starting there is captured : the keywords starting at
+the same position are its prefixes, so the priority of a keyword is the best
+priority of its prefixes. The keyword with the highest priority wins, like
+the first match of the rules read in order.
+
+Results are memoized per summary.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+import re
+
+from .config import Agenda
+
+
+class ColorClassifier:
+    """
+    The compiled color rules of an agenda.
+
+    @param rules: (dict[str, list[str]]) color ids and their keywords, the
+        first ones have the highest priority. Keywords ignore the case.
+    @param default_color: (str) the color of the events matching no keyword
+    """
+
+    def __init__(self, rules: dict[str, list[str]], default_color: str):
+        self.rules = rules
+        self.default_color = default_color
+        self._colors: list[str] = []
+        priorities: dict[str, int] = {}
+        for color_id, keywords in rules.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and keyword not in priorities:
+                    priorities[keyword] = len(self._colors)
+                    self._colors.append(color_id)
+        self._priorities = {
+            keyword: min(
+                priority
+                for prefix, priority in priorities.items()
+                if keyword.startswith(prefix)
+            )
+            for keyword in priorities
+        }
+        self._pattern: Optional[re.Pattern] = None
+        if priorities:
+            self._pattern = re.compile(f"(?=({trie_pattern(priorities)}))")
+        self._cache: dict[str, str] = {}
+
+    def color_of(self, summary: str) -> str:
+        """
+        Returns the color of the keyword with the highest priority found in
+        the summary, the default color if there's none.
+
+        @param summary: (str) the summary of the event
+        @return: (str) a color id
+        """
+        color_id = self._cache.get(summary)
+        if color_id is None:
+            color_id = self._classify(summary)
+            self._cache[summary] = color_id
+        return color_id
+
+    def _classify(self, summary: str) -> str:
+        if self._pattern is None:
+            return self.default_color
+        priority = min(
+            (
+                self._priorities[keyword]
+                for keyword in self._pattern.findall(summary.lower())
+            ),
+            default=None,
+        )
+        if priority is None:
+            return self.default_color
+        return self._colors[priority]
+
+
+def trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Returns a pattern matching the longest of the keywords starting at a
+    position.
+
+    trie_pattern(["cp1", "cp2", "cdr"]) -----> "c(?:p(?:1|2)|dr)"
+
+    @param keywords: (Iterable[str]) non empty keywords
+    @return: (str) a regular expression without any capturing group
+    """
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node: dict) -> str:
+    branches = [
+        re.escape(char) + _node_pattern(child) for char, child in node.items() if char
+    ]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    # a keyword ends here : the optional part is greedy, the longest wins
+    return pattern + "?" if "" in node else pattern
+
+
+_classifiers: dict[str, ColorClassifier] = {}
+
+
+def classifier_for(agenda: Agenda) -> ColorClassifier:
+    """
+    Returns the classifier of an agenda, compiled on first use and when the
+    rules of the agenda change.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (ColorClassifier)
+    """
+    classifier = _classifiers.get(agenda.longname)
+    if (
+        classifier is None
+        or classifier.rules != agenda.colors
+        or classifier.default_color != agenda.default_color
+    ):
+        classifier = ColorClassifier(agenda.colors, agenda.default_color)
+        _classifiers[agenda.longname] = classifier
+    return classifier
@@ -21,7 +21,7 @@ COLORS = {
 }
 """
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import yaml
 
@@ -41,6 +41,8 @@ TIMEZONE = "Europe/Paris"
 
 # What colors do you want to use for specific content ?
 # See documentation above
+# The first keywords have the highest priority.
+# An agenda can set its own with a `colors` mapping in config.yml.
 STUDENT_CLASS_COLORS = {
     "2": ["ISN", "tale nsi", "tnsi"],
     "1": ["1ere NSI"],
@@ -67,6 +69,11 @@ class Agenda:
     - git_repo_path : path to the yaml files
     - default_color: integer between 1 and 11 (see above documentation)
     - default : (bool) at least one agenda should have it set to true
+    - colors : color ids and the keywords giving them, by priority.
+        Defaults to STUDENT_CLASS_COLORS.
+    - timezone : IANA timezone of the events, defaults to TIMEZONE
+    - year : the school year of the week files, defaults to CURRENT_YEAR.
+        Set by `--year`.
 
     Agenda objects should be created using the yaml loader and read from a config file.
     """
@@ -77,6 +84,11 @@ class Agenda:
     git_repo_path: str
     default_color: str
     default: bool = False
+    colors: dict[str, list[str]] = field(
+        default_factory=lambda: dict(STUDENT_CLASS_COLORS)
+    )
+    timezone: str = TIMEZONE
+    year: int = CURRENT_YEAR
 
     @classmethod
     def from_yaml(cls, yaml_content: dict) -> Agenda:
@@ -88,9 +100,25 @@ class Agenda:
             git_repo_path=yaml_content["git_repo_path"],
             default_color=yaml_content["default_color"],
             default=yaml_content["default"],
+            colors=read_colors(yaml_content.get("colors", STUDENT_CLASS_COLORS)),
+            timezone=yaml_content.get("timezone", TIMEZONE),
         )
 
 
+def read_colors(colors: dict) -> dict[str, list[str]]:
+    """
+    Read the color rules of an agenda. yaml may read the color ids as int
+    and a single keyword as a string.
+
+    @param colors: (dict) color ids and their keywords
+    @return: (dict[str, list[str]]) in the same order
+    """
+    return {
+        str(color_id): [keywords] if isinstance(keywords, str) else list(keywords)
+        for color_id, keywords in colors.items()
+    }
+
+
 def read_config_file(config_path: str) -> list[Agenda]:
     """
     Read a config file and returns its agenda.
@@ -0,0 +1,248 @@
+"""
+title: credentials
+author: qkzk
+
+Credentials of every agenda, loaded once per process.
+
+* the tokens are stored as json in `tokens/<agenda>/token.json`. An existing
+    `token.pickle` is converted the first time it's read.
+* the access token is refreshed only when it's about to expire, before any
+    request fails with it,
+* several agendas are refreshed concurrently,
+* every thread shares one authorized http session per agenda between all
+    its services. A token refreshed by the session itself, after a 401, is
+    written to the token file too.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import datetime
+import json
+import os.path
+import pickle
+import threading
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+from .config import Agenda
+from .logger import logger
+
+# If modifying these scopes, delete the file token.json.
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+TOKEN_PATH = "tokens/{}/token.json"
+PICKLE_TOKEN_PATH = "tokens/{}/token.pickle"
+CLIENT_SECRETS_PATH = "tokens/{}/credentials.json"
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+# refresh the access token if it expires in less than that
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def credentials_to_dict(creds: Credentials) -> dict:
+    """
+    Returns the content of a token file.
+
+    @param creds: (Credentials) user credentials
+    @return: (dict) json serializable
+    """
+    return {
+        "token": creds.token,
+        "refresh_token": creds.refresh_token,
+        "token_uri": creds.token_uri,
+        "client_id": creds.client_id,
+        "client_secret": creds.client_secret,
+        "scopes": list(creds.scopes or SCOPES),
+        "expiry": creds.expiry.isoformat() if creds.expiry else None,
+    }
+
+
+def credentials_from_dict(info: dict) -> Credentials:
+    """
+    Creates credentials from the content of a token file, access token and
+    expiry included, so a valid token isn't refreshed.
+
+    @param info: (dict) content of a token file
+    @return: (Credentials)
+    """
+    creds = Credentials(
+        info.get("token"),
+        refresh_token=info["refresh_token"],
+        token_uri=info.get("token_uri") or GOOGLE_TOKEN_URI,
+        client_id=info["client_id"],
+        client_secret=info["client_secret"],
+        scopes=info.get("scopes") or SCOPES,
+    )
+    if info.get("expiry"):
+        # google-auth compares naive UTC datetimes
+        creds.expiry = datetime.datetime.fromisoformat(info["expiry"])
+    return creds
+
+
+def expires_soon(creds: Credentials, margin: datetime.timedelta = REFRESH_MARGIN) -> bool:
+    """
+    True if the credentials have no access token or if it expires within margin.
+
+    @param creds: (Credentials)
+    @param margin: (datetime.timedelta)
+    @return: (bool)
+    """
+    if not creds.token or creds.expiry is None:
+        return True
+    # naive UTC, like the expiry
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return creds.expiry - margin <= now
+
+
+class TokenSavingHttp(google_auth_httplib2.AuthorizedHttp):
+    """
+    An authorized http session which calls `on_refresh` whenever a request
+    changed the access token of its credentials.
+    """
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        on_refresh: Callable[[Credentials], None],
+        **kwargs,
+    ):
+        super().__init__(credentials, **kwargs)
+        self.on_refresh = on_refresh
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        token = self.credentials.token
+        response = super().request(uri, method, *args, **kwargs)
+        if self.credentials.token != token:
+            self.on_refresh(self.credentials)
+        return response
+
+
+class CredentialsManager:
+    """
+    Load, refresh and store the credentials of the agendas.
+    Credentials are kept in memory for the whole process.
+    """
+
+    def __init__(self):
+        self._credentials: dict[str, Credentials] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._sessions = threading.local()
+
+    def get(self, agenda: Agenda) -> Credentials:
+        """
+        Returns valid credentials for the agenda.
+        They're loaded from the token file the first time and refreshed if
+        they're about to expire. If there's no token, the user logs in.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @return: (Credentials)
+        """
+        with self._agenda_lock(agenda):
+            creds = self._credentials.get(agenda.longname)
+            if creds is None:
+                creds = self.load(agenda)
+            if creds is None or (expires_soon(creds) and not creds.refresh_token):
+                creds = self.log_in(agenda)
+                self.save(agenda, creds)
+            elif expires_soon(creds):
+                creds.refresh(Request())
+                logger.warning(f"Credentials of {agenda.longname} refreshed")
+                self.save(agenda, creds)
+            self._credentials[agenda.longname] = creds
+            return creds
+
+    def get_all(self, agendas: list[Agenda]) -> list[Credentials]:
+        """
+        Returns the credentials of every agenda, refreshing them concurrently.
+
+        @param agendas: (list[Agenda])
+        @return: (list[Credentials]) in the same order
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(agendas))) as executor:
+            return list(executor.map(self.get, agendas))
+
+    def authorized_http(self, agenda: Agenda) -> google_auth_httplib2.AuthorizedHttp:
+        """
+        Returns the authorized http session of the agenda for this thread.
+        Every service built in the thread for this agenda shares it.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @return: (AuthorizedHttp)
+        """
+        sessions = self._sessions.__dict__.setdefault("by_agenda", {})
+        if agenda.longname not in sessions:
+            sessions[agenda.longname] = TokenSavingHttp(
+                self.get(agenda),
+                lambda creds: self.refreshed(agenda, creds),
+                http=httplib2.Http(),
+            )
+        return sessions[agenda.longname]
+
+    def refreshed(self, agenda: Agenda, creds: Credentials) -> None:
+        """
+        Store credentials refreshed by an authorized http session.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @param creds: (Credentials) with a new access token
+        """
+        with self._agenda_lock(agenda):
+            logger.warning(f"Credentials of {agenda.longname} refreshed")
+            self.save(agenda, creds)
+
+    def load(self, agenda: Agenda) -> Optional[Credentials]:
+        """
+        Read the token file of an agenda. A pickled token is converted to json.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @return: (Optional[Credentials]) None if there's no token file
+        """
+        path = TOKEN_PATH.format(agenda.longname)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as token:
+                return credentials_from_dict(json.load(token))
+        pickle_path = PICKLE_TOKEN_PATH.format(agenda.longname)
+        if os.path.exists(pickle_path):
+            with open(pickle_path, "rb") as token:
+                creds = pickle.load(token)
+            self.save(agenda, creds)
+            logger.warning(f"{pickle_path} converted to {path}")
+            return creds
+        return None
+
+    def save(self, agenda: Agenda, creds: Credentials) -> None:
+        """
+        Write the credentials of an agenda to its json token file.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @param creds: (Credentials)
+        """
+        path = TOKEN_PATH.format(agenda.longname)
+        with open(path, "w", encoding="utf-8") as token:
+            json.dump(credentials_to_dict(creds), token)
+
+    @staticmethod
+    def log_in(agenda: Agenda) -> Credentials:
+        """
+        Let the user log in, in a browser.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @return: (Credentials)
+        """
+        flow = InstalledAppFlow.from_client_secrets_file(
+            CLIENT_SECRETS_PATH.format(agenda.longname), SCOPES
+        )
+        return flow.run_local_server(port=0)
+
+    def _agenda_lock(self, agenda: Agenda) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(agenda.longname, threading.Lock())
+
+
+credentials_manager = CredentialsManager()
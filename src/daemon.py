@@ -0,0 +1,280 @@
+"""
+title: daemon
+author: qkzk
+
+Long running sync server.
+
+`calpy --daemon` builds the services once and accepts sync jobs on a local
+Unix socket, sent by `calpy_client.py`. Every request is a single json line :
+
+    {"agenda": "quentin", "path": "/.../semaine_36.md", "wait": true}
+
+and gets a single json line back.
+
+* every agenda has its own worker thread, which owns its service,
+* a request for a week file already waiting in the queue is merged with it,
+* a request for a week file being synced queues it again : the sync may have
+    read the file before its last save.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+from .colors import color_text
+from .config import Agenda
+from .google_interaction import build_service, sync_event_from_md
+from .journal import SyncJournal
+from .logger import logger
+
+# calpy_client.py computes the same default path
+SOCKET_PATH = os.environ.get(
+    "CALPY_SOCKET", os.path.join(tempfile.gettempdir(), f"calpy-{os.getuid()}.sock")
+)
+
+DAEMON_STARTED_MSG = "Daemon listening on {} for {}"
+DAEMON_JOB_MSG = "{} - {}"
+DAEMON_FAILED_MSG = "{} - FAILED : {}"
+DAEMON_STOPPED_MSG = "Daemon stopped"
+DAEMON_RUNNING_MSG = "A daemon is already listening on {}"
+DAEMON_AGENDA_FAILED_MSG = "AGENDA {} - can't start : {}"
+DAEMON_BAD_REQUEST_MSG = "a request is a json object, got {}"
+
+
+class SyncJob:
+    """
+    A pending sync of a week file, with everyone waiting for its result.
+    """
+
+    def __init__(self, agenda: Agenda, path: str):
+        self.agenda = agenda
+        self.path = path
+        self.requests = 0
+        self.result: Optional[dict[str, Any]] = None
+        self._done = threading.Event()
+
+    def finish(self, result: dict[str, Any]) -> None:
+        self.result = result
+        self._done.set()
+
+    def wait(self) -> dict[str, Any]:
+        self._done.wait()
+        return self.result
+
+
+class SyncDaemon:
+    """
+    Queue the sync jobs of every agenda and run them, one agenda per thread.
+
+    @param agendas: (list[Agenda]) the agendas accepting jobs
+    @param arguments: (argparse.Namespace) provided args
+    """
+
+    def __init__(self, agendas: list[Agenda], arguments: argparse.Namespace):
+        self.agendas = agendas
+        self.arguments = arguments
+        self._pending: dict[tuple[str, str], SyncJob] = {}
+        self._running: set[tuple[str, str]] = set()
+        self._condition = threading.Condition()
+
+    def find_agenda(self, name: Optional[str]) -> Agenda:
+        """
+        Returns the agenda with this short or long name, the first one if
+        no name is given.
+        Raise ValueError if the daemon doesn't serve this agenda.
+        """
+        if not name:
+            return self.agendas[0]
+        for agenda in self.agendas:
+            if name in (agenda.longname, agenda.shortname):
+                return agenda
+        raise ValueError(f"Unknown agenda {name}")
+
+    def submit(self, agenda: Agenda, path: str) -> tuple[SyncJob, bool]:
+        """
+        Queue the sync of a week file, or merge the request with the job
+        already waiting for this file.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @param path: (str) absolute path of the week file
+        @return: (tuple[SyncJob, bool]) the job and True if the request was
+            merged with a waiting one
+        """
+        key = (agenda.longname, path)
+        with self._condition:
+            job = self._pending.get(key)
+            coalesced = job is not None
+            if job is None:
+                job = SyncJob(agenda, path)
+                self._pending[key] = job
+                self._condition.notify_all()
+            job.requests += 1
+            return job, coalesced
+
+    def _next_job(self, agenda: Agenda) -> SyncJob:
+        """
+        Wait for a job of the agenda whose file isn't being synced and take
+        it out of the queue.
+        """
+        with self._condition:
+            while True:
+                for key, job in self._pending.items():
+                    if key[0] == agenda.longname and key not in self._running:
+                        del self._pending[key]
+                        self._running.add(key)
+                        return job
+                self._condition.wait()
+
+    def _job_done(self, job: SyncJob) -> None:
+        with self._condition:
+            self._running.discard((job.agenda.longname, job.path))
+            self._condition.notify_all()
+
+    def work(self, agenda: Agenda) -> None:
+        """
+        Run the jobs of an agenda forever, with a service built once.
+        If the service or the journal can't be built, every job of the agenda
+        fails with this error.
+
+        @param agenda: (Agenda) holds info about the agenda
+        """
+        try:
+            service = build_service(agenda, shared=False)
+            journal = SyncJournal(agenda) if self.arguments.journal else None
+        except Exception as error:
+            failed_msg = DAEMON_AGENDA_FAILED_MSG.format(agenda.longname, error)
+            print(color_text(failed_msg, "RED"))
+            logger.error(failed_msg)
+            self.fail_jobs(agenda, error)
+            return
+        while True:
+            job = self._next_job(agenda)
+            try:
+                report = sync_event_from_md(
+                    agenda,
+                    service,
+                    job.path,
+                    prefetch=self.arguments.prefetch,
+                    upsert=self.arguments.upsert,
+                    journal=journal,
+                    parse_cache=self.arguments.parse_cache,
+                )
+            except Exception as error:
+                failed_msg = DAEMON_FAILED_MSG.format(job.path, error)
+                print(color_text(failed_msg, "RED"))
+                logger.error(failed_msg)
+                job.finish({"status": "failed", "path": job.path, "error": str(error)})
+            else:
+                job_msg = DAEMON_JOB_MSG.format(job.path, report.summary())
+                print(color_text(job_msg, "DARKCYAN"))
+                logger.warning(job_msg)
+                job.finish(
+                    {
+                        "status": "done",
+                        "path": job.path,
+                        "summary": report.summary(),
+                        "requests": job.requests,
+                    }
+                )
+            finally:
+                self._job_done(job)
+
+    def fail_jobs(self, agenda: Agenda, error: Exception) -> None:
+        """
+        Fail every job of an agenda which can't be synced, forever : the
+        clients waiting for them get the error.
+
+        @param agenda: (Agenda) holds info about the agenda
+        @param error: (Exception) why the agenda can't be synced
+        """
+        while True:
+            job = self._next_job(agenda)
+            job.finish({"status": "failed", "path": job.path, "error": str(error)})
+            self._job_done(job)
+
+    def handle(self, request: Any) -> dict[str, Any]:
+        """
+        Answer a request of a client. Anything but a json object with a path
+        is refused.
+
+        @param request: (Any) a dict with keys agenda, path and wait
+        @return: (dict) the result of the job if the client waits for it,
+            an acknowledgement otherwise
+        """
+        if not isinstance(request, dict):
+            return {
+                "status": "refused",
+                "error": DAEMON_BAD_REQUEST_MSG.format(type(request).__name__),
+            }
+        try:
+            agenda = self.find_agenda(request.get("agenda"))
+            path = os.path.abspath(request["path"])
+        except (KeyError, TypeError, ValueError) as error:
+            return {"status": "refused", "error": str(error)}
+        job, coalesced = self.submit(agenda, path)
+        if not request.get("wait", True):
+            return {"status": "queued", "path": path, "coalesced": coalesced}
+        return dict(job.wait(), coalesced=coalesced)
+
+    def serve_forever(self, socket_path: str = SOCKET_PATH) -> None:
+        """
+        Start a worker per agenda and answer the clients until Ctrl+C.
+
+        @param socket_path: (str) path of the Unix socket
+        """
+        if is_listening(socket_path):
+            running_msg = DAEMON_RUNNING_MSG.format(socket_path)
+            print(color_text(running_msg, "RED"))
+            logger.error(running_msg)
+            return
+        if os.path.exists(socket_path):
+            # left by a daemon which didn't stop cleanly
+            os.remove(socket_path)
+        for agenda in self.agendas:
+            threading.Thread(target=self.work, args=(agenda,), daemon=True).start()
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        response = daemon.handle(json.loads(line))
+                    except ValueError as error:
+                        response = {"status": "refused", "error": str(error)}
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as server:
+            server.daemon_threads = True
+            started_msg = DAEMON_STARTED_MSG.format(
+                socket_path, ", ".join(agenda.longname for agenda in self.agendas)
+            )
+            print(color_text(started_msg, "DARKCYAN"))
+            logger.warning(started_msg)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print(color_text(DAEMON_STOPPED_MSG, "DARKCYAN"))
+            finally:
+                os.remove(socket_path)
+
+
+def is_listening(socket_path: str) -> bool:
+    """
+    True if a server accepts connections on the Unix socket.
+
+    @param socket_path: (str) path of the Unix socket
+    @return: (bool) False if there's no socket or nobody listens on it
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,168 @@
+"""
+title: discovery
+author: qkzk
+
+Local cache of the Google API discovery documents.
+
+`build` downloads and parses the discovery document of the API every time a
+service is built. The document is stored once in `cache/discovery/` and read
+from there. A cached document is replaced when the client library changes or
+when it's older than DISCOVERY_MAX_AGE, by the document bundled with the
+client library if there's one (since google-api-python-client 2.0), or by a
+downloaded one. If the API can't be reached, an outdated document is still used.
+"""
+from __future__ import annotations
+
+from importlib.metadata import PackageNotFoundError, version as package_version
+from typing import Optional
+
+import json
+import os
+import threading
+import time
+
+import httplib2
+
+from .logger import logger
+
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+DISCOVERY_CACHE_PATH = "cache/discovery/{api}.{version}.json"
+DISCOVERY_MAX_AGE = 30 * 24 * 3600
+
+_documents: dict[tuple[str, str], dict] = {}
+_lock = threading.Lock()
+
+
+def client_version() -> str:
+    """Returns the version of google-api-python-client, "" if it's unknown."""
+    try:
+        return package_version("google-api-python-client")
+    except PackageNotFoundError:
+        return ""
+
+
+def discovery_document(api: str = "calendar", version: str = "v3") -> dict:
+    """
+    Returns the parsed discovery document of an API.
+    Read once per process : from the cache file, the client library or the
+    network.
+
+    @param api: (str) name of the API
+    @param version: (str) version of the API
+    @return: (dict) the discovery document
+    """
+    key = (api, version)
+    with _lock:
+        if key not in _documents:
+            _documents[key] = load_discovery_document(api, version)
+        return _documents[key]
+
+
+def load_discovery_document(api: str, version: str) -> dict:
+    """
+    Read the document from its cache file if it's still valid. Otherwise use
+    the document bundled with the client or fetch it.
+
+    @param api: (str) name of the API
+    @param version: (str) version of the API
+    @return: (dict) the discovery document
+    """
+    path = DISCOVERY_CACHE_PATH.format(api=api, version=version)
+    cached = read_cache(path)
+    if cached is not None and is_fresh(cached):
+        return cached["document"]
+    document = static_discovery_document(api, version)
+    if document is not None:
+        write_cache(path, document)
+        return document
+    try:
+        document = fetch_discovery_document(api, version)
+    except (httplib2.HttpLib2Error, OSError, ValueError) as error:
+        if cached is None:
+            raise
+        logger.warning(f"Discovery document of {api} {version} not refreshed: {error}")
+        return cached["document"]
+    write_cache(path, document)
+    return document
+
+
+def read_cache(path: str) -> Optional[dict]:
+    """
+    Read a cache file. Returns None if it's missing or unreadable.
+
+    @param path: (str) path of the cache file
+    @return: (Optional[dict]) with keys client_version, fetched_at and document
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        return None
+
+
+def is_fresh(cached: dict) -> bool:
+    """
+    True if the cached document was fetched by the same client version and
+    isn't too old.
+
+    @param cached: (dict) content of a cache file
+    @return: (bool)
+    """
+    return (
+        cached.get("client_version") == client_version()
+        and time.time() - cached.get("fetched_at", 0) < DISCOVERY_MAX_AGE
+    )
+
+
+def write_cache(path: str, document: dict) -> None:
+    """
+    Write a document and its metadata to the cache.
+
+    @param path: (str) path of the cache file
+    @param document: (dict) the discovery document
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as cache_file:
+        json.dump(
+            {
+                "client_version": client_version(),
+                "fetched_at": time.time(),
+                "revision": document.get("revision", ""),
+                "document": document,
+            },
+            cache_file,
+        )
+
+
+def static_discovery_document(api: str, version: str) -> Optional[dict]:
+    """
+    Returns the document bundled with the client library, if any.
+
+    @param api: (str) name of the API
+    @param version: (str) version of the API
+    @return: (Optional[dict]) None if the client doesn't bundle documents
+    """
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:
+        return None
+    content = get_static_doc(api, version)
+    return json.loads(content) if content else None
+
+
+def fetch_discovery_document(api: str, version: str) -> dict:
+    """
+    Download the discovery document of an API.
+
+    @param api: (str) name of the API
+    @param version: (str) version of the API
+    @return: (dict) the discovery document
+    """
+    url = DISCOVERY_URL.format(api=api, version=version)
+    response, content = httplib2.Http(timeout=30).request(url)
+    if response.status >= 400:
+        raise httplib2.HttpLib2Error(f"{url} answered {response.status}")
+    logger.warning(f"Discovery document of {api} {version} downloaded")
+    return json.loads(content)
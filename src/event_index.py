@@ -0,0 +1,385 @@
+"""
+title: event index
+author: qkzk
+
+In memory index of the events already present in Google Calendar.
+
+Instead of asking the API for every parsed event, we fetch the whole
+window of a week file once and match every parsed Event against this index.
+
+* timed events are kept sorted by start time, overlaping slots are found by
+    bisection : only the events starting less than the longest duration
+    before the slot are scanned,
+* all day events are kept in a dict, keyed by every day they cover,
+* a parsed event matches the remote event with its stable id, else a remote
+    event of its slot written with another id, every remote event once,
+* the events written during a run are recorded, so the index stays true
+    for the next week files. The index can be shared by threads.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Collection, Iterable, Optional
+
+import datetime
+import threading
+
+from .model import Event
+
+
+def parse_datetime(dt_str: str) -> datetime.datetime:
+    """
+    Parse a datetime returned by the API or created by the parser.
+
+    "2019-08-09T15:00:00+02:00" -----> datetime.datetime(2019, 8, 9, 15, 0, tzinfo=...)
+    "2019-08-09T13:00:00Z"      -----> datetime.datetime(2019, 8, 9, 13, 0, tzinfo=UTC)
+
+    @param dt_str: (str) isoformated datetime
+    @return: (datetime.datetime) timezone aware datetime
+    """
+    if dt_str.endswith("Z"):
+        dt_str = dt_str[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(dt_str)
+
+
+def parse_date(date_str: str) -> datetime.date:
+    """
+    Parse a date like "2019-08-09".
+
+    @param date_str: (str) formated like "%Y-%m-%d"
+    @return: (datetime.date)
+    """
+    return datetime.date.fromisoformat(date_str)
+
+
+def days_between(first: datetime.date, last: datetime.date) -> Iterable[datetime.date]:
+    """
+    Yields every day from first to last, both included.
+
+    @param first: (datetime.date)
+    @param last: (datetime.date)
+    @return: (Iterable[datetime.date])
+    """
+    day = first
+    while day <= last:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def window_of(events: Iterable[Event]) -> Optional[tuple[str, str]]:
+    """
+    Returns the (timeMin, timeMax) window covering every given event.
+    The window is the one that per event queries would use, only wider :
+    all day events start one day earlier to catch the timezone shift.
+
+    @param events: (Iterable[Event]) parsed events
+    @return: (Optional[tuple[str, str]]) None if there's no event.
+    """
+    starts: list[datetime.datetime] = []
+    ends: list[datetime.datetime] = []
+    for event in events:
+        if event.is_all_day:
+            start_day = parse_date(event.start["date"]) - datetime.timedelta(days=1)
+            end_day = parse_date(event.end["date"])
+            starts.append(
+                datetime.datetime.combine(start_day, datetime.time(), datetime.timezone.utc)
+            )
+            ends.append(
+                datetime.datetime.combine(end_day, datetime.time(), datetime.timezone.utc)
+            )
+        else:
+            starts.append(parse_datetime(event.start["dateTime"]))
+            ends.append(parse_datetime(event.end["dateTime"]))
+    if not starts:
+        return None
+    return min(starts).isoformat(), max(ends).isoformat()
+
+
+def week_window(
+    events: Iterable[Event],
+) -> Optional[tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Returns the weeks of the day headers of a week file : from the monday of
+    the first day at midnight to the monday following the last day.
+    Every parsed event starts on the day of its `## <day>` header, so only
+    the starts are read : a multi day event ending in a later week doesn't
+    widen the window.
+    Midnight is taken in the offset of the timed events, UTC if there's none.
+
+    @param events: (Iterable[Event]) parsed events
+    @return: (Optional[tuple[datetime.datetime, datetime.datetime]]) None if
+        there's no event.
+    """
+    days: list[datetime.date] = []
+    tzinfo = datetime.timezone.utc
+    for event in events:
+        if event.is_all_day:
+            days.append(parse_date(event.start["date"]))
+        else:
+            start = parse_datetime(event.start["dateTime"])
+            tzinfo = start.tzinfo
+            days.append(start.date())
+    if not days:
+        return None
+    first, last = min(days), max(days)
+    monday = first - datetime.timedelta(days=first.weekday())
+    next_monday = last + datetime.timedelta(days=7 - last.weekday())
+    return (
+        datetime.datetime.combine(monday, datetime.time(), tzinfo),
+        datetime.datetime.combine(next_monday, datetime.time(), tzinfo),
+    )
+
+
+def starts_between(
+    event: Event,
+    window_start: datetime.datetime,
+    window_end: datetime.datetime,
+) -> bool:
+    """
+    True if the event starts in the window. An event starting before the
+    window and overlapping it belongs to an earlier week.
+    All day events are compared by date.
+
+    @param event: (Event) an event read from the API
+    @param window_start: (datetime.datetime) aware start of the window
+    @param window_end: (datetime.datetime) aware end of the window, excluded
+    @return: (bool)
+    """
+    if event.is_all_day:
+        start_day = parse_date(event.start["date"])
+        return window_start.date() <= start_day < window_end.date()
+    return window_start <= parse_datetime(event.start["dateTime"]) < window_end
+
+
+class EventIndex:
+    """
+    Holds the remote events of a time window and answers the same questions
+    as `find_timed_event_matching_time` and `retrieve_day_events_matching_date`
+    without any network request.
+    """
+
+    def __init__(self, events: Iterable[Event] = ()):
+        self._timed: list[tuple[datetime.datetime, datetime.datetime, int, Event]] = []
+        self._starts: list[datetime.datetime] = []
+        self._days: dict[datetime.date, list[Event]] = {}
+        self._by_id: dict[str, Event] = {}
+        # never decreases : a bound of the duration of every timed event
+        self._max_duration = datetime.timedelta(0)
+        self._counter = 0
+        self._lock = threading.RLock()
+        for event in events:
+            self.add(event)
+
+    def add(self, event: Event) -> None:
+        """
+        Add a remote event to the index.
+        Timed events are inserted at their place, keeping the start order.
+
+        @param event: (Event) an event read from the API
+        """
+        with self._lock:
+            self._counter += 1
+            if event.id:
+                self._by_id[event.id] = event
+            if event.is_all_day:
+                first = parse_date(event.start["date"])
+                # the API end date is exclusive
+                last = max(
+                    first, parse_date(event.end["date"]) - datetime.timedelta(days=1)
+                )
+                for day in days_between(first, last):
+                    self._days.setdefault(day, []).append(event)
+            else:
+                start = parse_datetime(event.start["dateTime"])
+                end = parse_datetime(event.end["dateTime"])
+                self._max_duration = max(self._max_duration, end - start)
+                position = bisect_left(self._timed, (start, end, self._counter))
+                self._timed.insert(position, (start, end, self._counter, event))
+                self._starts.insert(position, start)
+
+    def remove(self, event: Event) -> None:
+        """
+        Remove an indexed event, like a remote event which was deleted.
+
+        @param event: (Event) an event of the index
+        """
+        with self._lock:
+            if event.id and self._by_id.get(event.id) is event:
+                del self._by_id[event.id]
+            if event.is_all_day:
+                for day_events in self._days.values():
+                    day_events[:] = [
+                        other for other in day_events if other is not event
+                    ]
+                return
+            start = parse_datetime(event.start["dateTime"])
+            position = bisect_left(self._starts, start)
+            while position < len(self._timed) and self._starts[position] == start:
+                if self._timed[position][3] is event:
+                    del self._timed[position]
+                    del self._starts[position]
+                    return
+                position += 1
+
+    def record(self, event: Event) -> None:
+        """
+        Record an event written to the API : it replaces the indexed event
+        with the same id, if any.
+
+        @param event: (Event) the event returned by the API
+        """
+        with self._lock:
+            previous = self._by_id.get(event.id)
+            if previous is not None:
+                self.remove(previous)
+            self.add(event)
+
+    def events(self) -> Iterable[Event]:
+        """
+        Yields every indexed event once : timed events by start time, then
+        all day events.
+        """
+        with self._lock:
+            timed = [event for _, _, _, event in self._timed]
+            day_events = [event for events in self._days.values() for event in events]
+        yield from timed
+        seen: set[int] = set()
+        for event in day_events:
+            if id(event) not in seen:
+                seen.add(id(event))
+                yield event
+
+    def find(
+        self, event: Event, excluded_ids: Collection[str] = ()
+    ) -> Optional[Event]:
+        """
+        Returns the remote event matching a parsed event, like
+        `find_existing_event` does.
+
+        @param event: (Event) a parsed event
+        @param excluded_ids: (Collection[str]) ids of remote events which
+            belong to other parsed events
+        @return: (Optional[Event]) the matching event, if any
+        """
+        if event.is_all_day:
+            return self.find_day(event, excluded_ids)
+        return self.find_timed(event, excluded_ids)
+
+    def match(
+        self, events: Iterable[Event], excluded_ids: Iterable[str] = ()
+    ) -> list[tuple[Event, Optional[Event]]]:
+        """
+        Returns every parsed event with its remote event, if any.
+        A remote event is matched once : the stable ids of the parsed events
+        and the ids already matched aren't candidates of the other events.
+
+        @param events: (Iterable[Event]) the parsed events
+        @param excluded_ids: (Iterable[str]) ids of remote events which belong
+            to events synced otherwise, like the journaled ones
+        @return: (list[tuple[Event, Optional[Event]]]) in the order of events
+        """
+        events = list(events)
+        excluded = {event.id for event in events if event.id}
+        excluded.update(excluded_ids)
+        matches = []
+        for event in events:
+            existing_event = self.find(event, excluded)
+            if existing_event is not None:
+                excluded.add(existing_event.id)
+            matches.append((event, existing_event))
+        return matches
+
+    def find_timed(
+        self, event: Event, excluded_ids: Collection[str] = ()
+    ) -> Optional[Event]:
+        """
+        Returns the remote timed event of a parsed event : the one with its
+        stable id, else a remote event overlaping its slot, chosen like
+        `pick_timed_match` does.
+        Same result as `find_timed_event_matching_time`, the API sorting
+        events by start time.
+
+        @param event: (Event) a parsed timed event
+        @param excluded_ids: (Collection[str]) ids of remote events which
+            belong to other parsed events
+        @return: (Optional[Event]) the matching event, if any
+        """
+        if event.is_all_day:
+            return None
+        start = parse_datetime(event.start["dateTime"])
+        end = parse_datetime(event.end["dateTime"])
+        with self._lock:
+            own_event = self._by_id.get(event.id) if event.id else None
+            if own_event is not None:
+                return own_event
+            # every candidate starts strictly before the end of the event and
+            # ends after its start : it can't start before start - max duration
+            first = bisect_right(self._starts, start - self._max_duration)
+            last = bisect_left(self._starts, end)
+            candidates = [
+                other
+                for _, other_end, _, other in self._timed[first:last]
+                if other_end > start
+            ]
+        return pick_timed_match(event, candidates, excluded_ids)
+
+    def find_day(
+        self, event: Event, excluded_ids: Collection[str] = ()
+    ) -> Optional[Event]:
+        """
+        Returns the remote all day event with the stable id of the given one,
+        else one with the same summary, sharing a day with it.
+        Same result as `retrieve_day_events_matching_date` followed by the
+        equality test.
+
+        @param event: (Event) a parsed all day event
+        @param excluded_ids: (Collection[str]) ids of remote events which
+            belong to other parsed events
+        @return: (Optional[Event]) the matching event, if any
+        """
+        first = parse_date(event.start["date"]) - datetime.timedelta(days=1)
+        last = parse_date(event.end["date"])
+        with self._lock:
+            own_event = self._by_id.get(event.id) if event.id else None
+            if own_event is not None and own_event.is_all_day:
+                return own_event
+            for day in days_between(first, last):
+                for other in self._days.get(day, []):
+                    if other == event and other.id not in excluded_ids:
+                        return other
+        return None
+
+
+def pick_timed_match(
+    event: Event,
+    candidates: Iterable[Event],
+    excluded_ids: Collection[str] = (),
+) -> Optional[Event]:
+    """
+    Returns the remote event of a parsed timed event, among the remote events
+    overlaping its slot sorted by start time :
+
+    * the remote event with the stable id of the parsed event,
+    * else an event written with another id : before events had stable ids,
+        or before the summary or location changed. The first one with the
+        same summary is preferred, then the first one.
+
+    Excluded events aren't candidates : several events may share a slot and
+    every one of them has its own remote event.
+
+    @param event: (Event) a parsed timed event
+    @param candidates: (Iterable[Event]) the remote events overlaping its slot
+    @param excluded_ids: (Collection[str]) ids of remote events which belong
+        to other parsed events
+    @return: (Optional[Event]) the matching event, if any
+    """
+    legacy_events = []
+    for other in candidates:
+        if event.id and other.id == event.id:
+            return other
+        if other.id not in excluded_ids:
+            legacy_events.append(other)
+    for other in legacy_events:
+        if other.summary == event.summary:
+            return other
+    return legacy_events[0] if legacy_events else None
@@ -28,53 +28,51 @@ COLORS = {
 
 """
 
-from typing import Union
+from functools import lru_cache
+from typing import Iterable, Iterator, Union
 import datetime
+import re
+import threading
 
 import markdown
-import pytz
-
-from .model import Event
-from .config import STUDENT_CLASS_COLORS, TIMEZONE, Agenda
-
-TRADUCTION_MONTH = {
-    "janvier": "January",
-    "février": "February",
-    "mars": "March",
-    "avril": "April",
-    "mai": "May",
-    "juin": "June",
-    "juillet": "July",
-    "août": "August",
-    "septembre": "September",
-    "octobre": "October",
-    "novembre": "November",
-    "décembre": "December",
-}
 
-MONTHES_END_YEAR = [
-    "January",
-    "February",
-    "March",
-    "April",
-    "May",
-    "June",
-    "July",
-]
+from .color_rules import classifier_for
+from .model import Event, stable_event_id
+from .school_year import school_year
+from .timezones import offset_table
+from .config import CURRENT_YEAR, TIMEZONE, Agenda
+
+# "## Lundi 02 septembre", "- Lundi 9 Septembre" or "Lundi 9 septembre"
+DATE_PATTERN = re.compile(r"^\s*(?:##|-)?\s*\w+\s+(\d{1,2})\s+(\w+)")
+# "8h55-9h50", "14h-15h30", "* 8h - 9h"
+TIME_RANGE_PATTERN = re.compile(r"(\d{1,2})h(\d{2})?\s*-\s*(\d{1,2})h(\d{2})?")
 
 MD_LI_TOKENS = ("-", "*", "+")
 
+# a single line of words and punctuation, which markdown renders as is
+PLAIN_TEXT_PATTERN = re.compile(r"[\w ,;:'’!?()%.]+")
+ORDERED_LIST_PATTERN = re.compile(r"\d+\.")
+RENDERED_DESCRIPTIONS = 1024
+
+_renderers = threading.local()
+
 
 class AllDayEventsParsers:
     @classmethod
     def parse_time(
-        cls, dt_key: datetime.datetime, summary: list[str]
+        cls,
+        dt_key: datetime.datetime,
+        summary: list[str],
+        timezone: str = TIMEZONE,
+        year: int = CURRENT_YEAR,
     ) -> tuple[dict[str, str], dict[str, str]]:
         """
         Extract the start and end datetime of a given string
 
         @param dt_key: datetime.datetime(2019, 9, 6, 0, 0)
         @param summary: (str) '- Lundi 9 Septembre'
+        @param timezone: (str) the timezone of the agenda
+        @param year: (int) the school year
         @return: (tuple) (start, end)
 
             start = {
@@ -88,12 +86,12 @@ class AllDayEventsParsers:
         """
         has_end_date = len(summary) >= 3
         if has_end_date:
-            end_date = parse_date_list(summary[2].strip().strip("-").split(" "))
+            end_date = parse_date_text(summary[2], year)
         else:
             end_date = dt_key
 
-        start = {"date": cls.format_dt_for_all_day_event(dt_key), "timeZone": TIMEZONE}
-        end = {"date": cls.format_dt_for_all_day_event(end_date), "timeZone": TIMEZONE}
+        start = {"date": cls.format_dt_for_all_day_event(dt_key), "timeZone": timezone}
+        end = {"date": cls.format_dt_for_all_day_event(end_date), "timeZone": timezone}
 
         return start, end
 
@@ -129,13 +127,19 @@ class AllDayEventsParsers:
 class TimedEventsParsers:
     @classmethod
     def parse_time(
-        cls, dt_key: datetime.datetime, summary: list[str]
+        cls,
+        dt_key: datetime.datetime,
+        summary: list[str],
+        timezone: str = TIMEZONE,
+        year: int = CURRENT_YEAR,
     ) -> tuple[dict[str, str], dict[str, str]]:
         """
         Extract the start and end datetime of a given string
 
         @param dt_key: datetime.datetime(2019, 9, 6, 0, 0)
         @param hours: (str) '* 8h55-9h50'
+        @param timezone: (str) the timezone of the agenda
+        @param year: (int) the school year
         @return: (tuple) (start, end)
             example :
             'end': datetime.datetime(2019, 9, 2, 10, 55),
@@ -151,20 +155,30 @@ class TimedEventsParsers:
                 'timeZone': 'Europe/Paris',
             }
         """
-        hours_list = summary[0].strip("*").strip().split("-")
-
-        year = dt_key.year
-        month = dt_key.month
-        day = dt_key.day
-
-        start = cls.create_dict_for_dt(hours_list[0], year, month, day)
-        end = cls.create_dict_for_dt(hours_list[1], year, month, day)
+        time_range = TIME_RANGE_PATTERN.search(summary[0])
+        if time_range is None:
+            raise ValueError(f"Can't read the hours of {summary[0]!r}")
+        start_hour, start_minute, end_hour, end_minute = time_range.groups()
+
+        start = cls.create_dict_for_dt(
+            dt_key.replace(hour=int(start_hour), minute=int(start_minute or 0)),
+            timezone,
+            year,
+        )
+        end = cls.create_dict_for_dt(
+            dt_key.replace(hour=int(end_hour), minute=int(end_minute or 0)),
+            timezone,
+            year,
+        )
 
         return start, end
 
     @classmethod
     def create_dict_for_dt(
-        cls, dt_str: str, year: int, month: int, day: int
+        cls,
+        dt: datetime.datetime,
+        timezone: str = TIMEZONE,
+        year: int = CURRENT_YEAR,
     ) -> dict[str, str]:
         """
         Creates a dict for a given time.
@@ -173,13 +187,15 @@ class TimedEventsParsers:
             'timeZone': 'Europe/Paris',
         }
 
-        @param dt_str: (str) like 8h55
-        @parm year, month, day: (int) describe a date
+        @param dt: (datetime.datetime) naive local time of the event
+        @param timezone: (str) the timezone of the agenda
+        @param year: (int) the school year
         @return: (dict[str, str]) a pair of key:value like described above.
         """
-        hour, minute = cls.get_hours_minute(dt_str)
-        dt = datetime.datetime(year, month, day, hour, minute)
-        return {"dateTime": cls.format_dt_for_event(dt), "timeZone": TIMEZONE}
+        return {
+            "dateTime": cls.format_dt_for_event(dt, timezone, year),
+            "timeZone": timezone,
+        }
 
     @staticmethod
     def parse_location(summary_strings: list[str]) -> str:
@@ -205,47 +221,23 @@ class TimedEventsParsers:
         return summary_strings[2]
 
     @staticmethod
-    def get_hours_minute(time_str: str) -> tuple[int, int]:
-        """
-        Extract an hour a minute from a string
-        we could use datetime.strptime but it's dirtier and quicker (to code)
-        @param time_str: (str) french time format : 8h35
-        @return: (tuple of int) (hour, minute) : (8, 35)
-        """
-        time_list = time_str.split("h")
-        time_hour = int(time_list[0])
-        time_minute = 0 if time_list[1] == "" else int(time_list[1])
-        return time_hour, time_minute
-
-    @staticmethod
-    def get_offset_at_given_date(time_of_event: datetime.datetime) -> int:
-        """
-        Get the offset (1 or 2 at a give date)
-
-        During summer Europe/Paris is +2 hours offset from UTC
-        During winter Europe/Paris is +1 hours offset from UTC
-
-        @param time_of_event: (datetime)
-        @return: (int)
-        """
-        cet = pytz.timezone("CET")
-        offset_delta = cet.utcoffset(time_of_event)
-        if offset_delta is not None:
-            offset_hours = int(offset_delta.total_seconds() / 3600)
-            return offset_hours
-        return 0
-
-    @classmethod
-    def format_dt_for_event(cls, time_of_event: datetime.datetime) -> str:
+    def format_dt_for_event(
+        time_of_event: datetime.datetime,
+        timezone: str = TIMEZONE,
+        year: int = CURRENT_YEAR,
+    ) -> str:
         """
         '2019-08-09T15:00:00+02:00'
 
-        The date is correctly offseted (+1 or +2 according to offset)
-        """
+        The date is correctly offseted, the offsets of the school year are
+        computed once per timezone.
 
-        offset = cls.get_offset_at_given_date(time_of_event)
-        time_format = f"%Y-%m-%dT%H:%M:00+0{offset}:00"
-        return datetime.datetime.strftime(time_of_event, time_format)
+        @param time_of_event: (datetime.datetime) naive local time
+        @param timezone: (str) the timezone of the agenda
+        @param year: (int) the school year
+        @return: (str)
+        """
+        return offset_table(timezone, year).format(time_of_event)
 
 
 def get_lines_from(path: str) -> list[str]:
@@ -259,117 +251,96 @@ def get_lines_from(path: str) -> list[str]:
         return f.readlines()
 
 
-def parse_date_line(line: str) -> datetime.datetime:
+def parse_date_line(line: str, year: int = CURRENT_YEAR) -> datetime.datetime:
     """
     Extract the date from a line :
     ## Lundi 02 septembre   -----> 2019-09-02 00:00:00
     ## Lundi 02 mai         -----> 2020-05-02 00:00:00
 
     @param line: (str) a line from the .md file
+    @param year: (int) the school year, 2019 above
     @return: (datetime.datetime obj) a datetime at midnight (ie a date)
     """
-    date_list = line[3:].strip().split(" ")
-    return parse_date_list(date_list)
-
+    return parse_date_text(line, year)
 
-def parse_date_list(date_list: list[str]) -> datetime.datetime:
-    day = date_list[1]
-    month = TRADUCTION_MONTH[date_list[2]]
-    year = get_current_year(month)
-    date_str = f"{year}-{month}-{day}"
-    date_day = datetime.datetime.strptime(date_str, "%Y-%B-%d")
 
-    return date_day
+def parse_date_text(text: str, year: int = CURRENT_YEAR) -> datetime.datetime:
+    """
+    Extract a french date, without year, from a day header or the end of a
+    multi day event. French month names are read without the locale, the
+    date is looked up in the school year.
 
+    "## Lundi 02 septembre"  -----> 2019-09-02 00:00:00
+    "- Lundi 9 Septembre"    -----> 2019-09-09 00:00:00
 
-def get_current_year(md_month: str) -> int:
-    """
-    Return the correct year.
-    The year is either the current year or the next.
-    It's the next only if we're setting events for
-    after january 1st during the beggining of the current school year
-    ie : today is 2019/09/31 and event is 2020/01/31
-
-    @param md_month: (str)
-    @return: (int)
+    @param text: (str) a weekday, a day number and a french month name
+    @param year: (int) the school year, 2019 above
+    @return: (datetime.datetime obj) a datetime at midnight (ie a date)
     """
-    now = datetime.datetime.now()
-    current_year = now.year
-    current_month = now.month
-    if md_month in MONTHES_END_YEAR and current_month in range(8, 13):
-        # is it before or after the end of civil year ?
-        current_year += 1
-    return current_year
+    date_match = DATE_PATTERN.match(text)
+    if date_match is None:
+        raise ValueError(f"Can't read a date in {text!r}")
+    day, month_name = date_match.groups()
+    return school_year(year).date_of(int(day), month_name)
 
 
 def format_html(description: str) -> str:
     """
     format a string from markdown to html
+    Empty and plain text descriptions don't need markdown, the other ones
+    are rendered once : the html is cached.
+
     @param description: (str) mardkdown formated string
     @return: (str) equivalent string in html format
     """
-    description_html = markdown.markdown(description)
-    return description_html
-
-
-def get_days_indexes(lines: list[str]) -> list[int]:
-    """
-    Returns the line number of line describing a day.
-
-    @param lines: (list[str]) the lines of the .md file
-    @return: (list[int]) list of line indexes
-    """
-    return [line_nr for line_nr, line in enumerate(lines) if line.startswith("## ")]
+    if not description:
+        return ""
+    if is_plain_text(description):
+        return f"<p>{description}</p>"
+    return render_markdown(description)
 
 
-def split_day_lines(lines: list[str]) -> dict[datetime.datetime, list[str]]:
+def is_plain_text(description: str) -> bool:
     """
-    Returns a dict of date : lines
+    True if markdown would render the description as a single paragraph of
+    the same text : a single line of words and punctuation, without
+    underscore and not starting like an ordered list.
 
-    @param lines: (list[str]) whole content of .md file
-    @param days_index: (list[int]) line indexes of days
-    @return: (dict[datetime, list[str]]) the pairs date, lines
+    @param description: (str) a stripped description
+    @return: (bool)
     """
-    days_index = get_days_indexes(lines)
-    dict_day_lines = {}
-    for i in range(len(days_index)):
-        start = days_index[i]
-        end = days_index[i + 1] if i + 1 < len(days_index) else len(lines)
-        day_lines = lines[slice(start + 1, end)]
-        dict_day_lines[parse_date_line(lines[start])] = day_lines
-    return dict_day_lines
+    return (
+        PLAIN_TEXT_PATTERN.fullmatch(description) is not None
+        and "_" not in description
+        and ORDERED_LIST_PATTERN.match(description) is None
+    )
 
 
-def parse_day_events(
-    agenda: Agenda,
-    dict_day_lines: dict[datetime.datetime, list[str]],
-) -> list[Event]:
+@lru_cache(maxsize=RENDERED_DESCRIPTIONS)
+def render_markdown(description: str) -> str:
     """
-    Extract the events for a day.
+    Render a description with the markdown renderer of the thread, built once
+    and reset between two descriptions.
 
-    @param dict_day_lines: (dict[datetime.datetime, list[str]]) strings per day.
-    @return: (list[event])
+    @param description: (str) mardkdown formated string
+    @return: (str) equivalent string in html format
     """
-    events = []
-    for dt, lines in dict_day_lines.items():
-        events.extend(read_day_events(agenda, dt, split_day_events(lines)))
-    return events
+    renderer = getattr(_renderers, "markdown", None)
+    if renderer is None:
+        renderer = _renderers.markdown = markdown.Markdown()
+    return renderer.reset().convert(description)
 
 
 def parse_color_id(agenda: Agenda, summary: str) -> str:
     """
-    Search for keywords in the description of the event.
-    Return the color number (string) if something is found
+    Search for keywords of the color rules of the agenda in the summary.
+    Return the color number (string) of the first rule found, the default
+    color of the agenda otherwise.
 
     @param summary: (str) the description of the event
-    @return: (str or None) the
+    @return: (str) a color id
     """
-    summary = summary.lower()
-    for nb, tags in STUDENT_CLASS_COLORS.items():
-        for tag in tags:
-            if tag.lower() in summary.lower():
-                return nb
-    return agenda.default_color
+    return classifier_for(agenda).color_of(summary)
 
 
 def parse_first_line(
@@ -395,7 +366,9 @@ def parse_first_line(
     else:
         parser = AllDayEventsParsers
 
-    start, end = parser.parse_time(dt, summary_strings)
+    start, end = parser.parse_time(
+        dt, summary_strings, agenda.timezone, agenda.year
+    )
     location = parser.parse_location(summary_strings)
     summary = parser.parse_summary(summary_strings)
 
@@ -439,60 +412,96 @@ def parse_event(
     Parse an event from its line and a date.
     @param dt:(datetime.datetime) the date of the event
     @param lines: (list[str]) lines of the event
-    @return: (Event) Complete Event, ready to be pushed.
+    @return: (Event) Complete Event, ready to be pushed. Its id is derived
+        from the agenda and its slot.
     """
     event_dict = parse_first_line(agenda, dt, lines[0].strip().split(" - "))
     description = parse_description(lines)
     if description is not None:
         event_dict["description"] = description
 
-    return Event.from_dict(event_dict)
+    event = Event.from_dict(event_dict)
+    event.id = stable_event_id(agenda.longname, event)
+    return event
 
 
-def read_day_events(
+def parse_events(
     agenda: Agenda,
-    dt: datetime.datetime,
-    splitted_events: list[list[str]],
+    path: str,
 ) -> list[Event]:
     """
-    Returns a list of Event for that day.
-    @param dt: (datetime.datetime) the day
-    @param split_events: (list[list[str]) event for that day, per day event.
-    @return: (list[Event]) the events of that day
+    Extract all the events of a week, given by a md file
+    see example_week_md_path file for a given format
+
+    @param path: (str) path of the .md file
+    @return : (list[Event]) all the events of a given week
     """
-    return [parse_event(agenda, dt, lines) for lines in splitted_events if lines]
+    return list(iter_file_events(agenda, path))
 
 
-def split_day_events(lines: list[str]) -> list[list[str]]:
+def parse_lines(
+    agenda: Agenda,
+    lines: Iterable[str],
+) -> list[Event]:
     """
-    Split the list of lines per day into lines per event per day.
-    @param lines: (list[str]) lines for a day
-    @return: (list[list[str]]) list of string lines per event
+    Extract all the events of a week from the lines of its md file.
+
+    @param lines: (Iterable[str]) whole content of .md file
+    @return : (list[Event]) all the events of a given week
     """
-    pack = [[]]
-    index = 0
-    while index < len(lines):
-        line = lines[index]
-        if line.startswith(MD_LI_TOKENS):
-            pack.append([line[2:]])
-        elif not line.startswith("\n"):
-            pack[-1].append(line)
-        index += 1
-    return pack
+    return list(iter_events(agenda, lines))
 
 
-def parse_events(
+def iter_file_events(
     agenda: Agenda,
     path: str,
-) -> list[Event]:
+) -> Iterator[Event]:
     """
-    Extract all the events of a week, given by a md file
-    see example_week_md_path file for a given format
+    Yields the events of a md file, read line by line.
 
     @param path: (str) path of the .md file
-    @return : (list[Event]) all the events of a given week
+    @return : (Iterator[Event]) the events, in the order of the file
     """
-    return parse_day_events(agenda, split_day_lines(get_lines_from(path)))
+    with open(path, mode="r", encoding="utf-8") as md_file:
+        yield from iter_events(agenda, md_file)
+
+
+def iter_events(
+    agenda: Agenda,
+    lines: Iterable[str],
+) -> Iterator[Event]:
+    """
+    Single pass parser : yields every event as soon as its block of lines is
+    complete, that is when the next event, the next day or the end is read.
+
+    * "## Lundi 02 septembre" starts a day, the lines before the first day
+        are ignored,
+    * a line starting with "-", "*" or "+" starts an event,
+    * the following lines are its description, blank lines are skipped,
+    * a day written twice keeps the events of both blocks, in the order of
+        the file.
+
+    @param lines: (Iterable[str]) the lines of a .md file, like an open file
+    @return : (Iterator[Event]) the events, in the order of the file
+    """
+    day = None
+    block: list[str] = []
+    for line in lines:
+        if line.startswith("## "):
+            if block:
+                yield parse_event(agenda, day, block)
+            day = parse_date_line(line, agenda.year)
+            block = []
+        elif day is None:
+            continue
+        elif line.startswith(MD_LI_TOKENS):
+            if block:
+                yield parse_event(agenda, day, block)
+            block = [line[2:]]
+        elif not line.startswith("\n"):
+            block.append(line)
+    if block:
+        yield parse_event(agenda, day, block)
 
 
 if __name__ == "__main__":
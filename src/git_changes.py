@@ -0,0 +1,148 @@
+"""
+title: git changes
+author: qkzk
+
+Select the week files to sync from the git history of the agenda repository.
+
+* git lists the `periode_*/semaine_*.md` files of the current year changed
+    between a reference and HEAD. The agenda path may be a subdirectory of
+    the repository : paths are relative to it, not to the top level,
+* their content is read from the object database at HEAD, whatever the state
+    of the checkout,
+* the last commit synced without failure is stored per agenda in
+    `tokens/<agenda>/last_sync_commit`, it's the default reference.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import os.path
+import subprocess
+
+from .config import CURRENT_YEAR, Agenda
+
+LAST_SYNC_PATH = "tokens/{}/last_sync_commit"
+WEEK_PATHSPEC = "{}/periode_*/semaine_*.md"
+
+
+class GitError(Exception):
+    """
+    Raised when a git command fails.
+    """
+
+
+def run_git(repo_path: str, *args: str, stdin: Optional[bytes] = None) -> bytes:
+    """
+    Run a git command in the repository and returns its output.
+    Raise GitError if it fails.
+
+    @param repo_path: (str) path of the repository
+    @param args: (str) the git command and its arguments
+    @param stdin: (Optional[bytes]) sent to the command
+    @return: (bytes) the standard output
+    """
+    completed = subprocess.run(
+        ["git", "-C", repo_path, *args],
+        input=stdin,
+        capture_output=True,
+    )
+    if completed.returncode != 0:
+        raise GitError(completed.stderr.decode("utf-8", "replace").strip())
+    return completed.stdout
+
+
+def resolve_commit(repo_path: str, ref: str) -> str:
+    """
+    Returns the full hash of the commit a reference points to.
+
+    @param repo_path: (str) path of the repository
+    @param ref: (str) like "HEAD", "HEAD~3", a branch, a tag or a hash
+    @return: (str) the commit hash
+    """
+    return run_git(repo_path, "rev-parse", "--verify", f"{ref}^{{commit}}").decode().strip()
+
+
+def changed_week_files(
+    repo_path: str,
+    since: str,
+    until: str = "HEAD",
+    year: int = CURRENT_YEAR,
+) -> list[str]:
+    """
+    Returns the week files of the year added, modified or renamed between two
+    commits. Deleted files are ignored.
+
+    @param repo_path: (str) path of the repository
+    @param since: (str) the older reference
+    @param until: (str) the newer reference
+    @param year: (int) the school year folder
+    @return: (list[str]) paths relative to repo_path, sorted
+    """
+    output = run_git(
+        repo_path,
+        "diff",
+        "--name-only",
+        "--relative",
+        "--diff-filter=AMR",
+        "-z",
+        since,
+        until,
+        "--",
+        WEEK_PATHSPEC.format(year),
+    )
+    return sorted(path for path in output.decode("utf-8").split("\0") if path)
+
+
+def read_files_at(repo_path: str, commit: str, paths: list[str]) -> dict[str, list[str]]:
+    """
+    Read files from the object database, with a single git process.
+
+    @param repo_path: (str) path of the repository
+    @param commit: (str) the commit to read
+    @param paths: (list[str]) paths relative to repo_path
+    @return: (dict[str, list[str]]) the lines of every file, like readlines
+    """
+    if not paths:
+        return {}
+    # "./" : relative to repo_path instead of the top level of the repository
+    requests = "".join(f"{commit}:./{path}\n" for path in paths).encode("utf-8")
+    output = run_git(repo_path, "cat-file", "--batch", stdin=requests)
+    contents = {}
+    offset = 0
+    for path in paths:
+        header_end = output.index(b"\n", offset)
+        header = output[offset:header_end].split()
+        offset = header_end + 1
+        if header[-1] == b"missing":
+            raise GitError(f"{path} doesn't exist at {commit}")
+        size = int(header[2])
+        content = output[offset : offset + size].decode("utf-8")
+        # the content is followed by a newline
+        offset += size + 1
+        contents[path] = content.splitlines(keepends=True)
+    return contents
+
+
+def last_synced_commit(agenda: Agenda) -> Optional[str]:
+    """
+    Returns the last commit synced without failure, None if there's none.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (Optional[str]) a commit hash
+    """
+    path = LAST_SYNC_PATH.format(agenda.longname)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as last_sync:
+        return last_sync.read().strip() or None
+
+
+def store_synced_commit(agenda: Agenda, commit: str) -> None:
+    """
+    Store the last commit synced without failure.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param commit: (str) a commit hash
+    """
+    with open(LAST_SYNC_PATH.format(agenda.longname), "w", encoding="utf-8") as last_sync:
+        last_sync.write(commit + "\n")
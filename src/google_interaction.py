@@ -1,22 +1,31 @@
 from __future__ import annotations
 
+from dataclasses import replace
 from pprint import pprint
-from typing import Any, Optional, Union
+from typing import Collection, Iterable, Iterator, Optional
 
 import datetime
-import pickle
-import os.path
 
-from google.auth.transport.requests import Request
-from google.oauth2.service_account import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import Resource, build
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import Resource, build_from_document
 
-from .explore_md_file import parse_events
+from .explore_md_file import iter_events, iter_file_events
 from .config import Agenda
-from .colors import color_text
+from .credentials import credentials_manager
+from .discovery import discovery_document
+from .batch_writes import (
+    EventWriteBatch,
+    report_created,
+    report_unchanged,
+    report_updated,
+)
+from .event_index import EventIndex, pick_timed_match, window_of
+from .journal import SyncJournal
 from .logger import logger
 from .model import Event
+from .parse_cache import parse_events_cached
+from .rate_limiter import scheduler
+from .report import SyncReport
 
 # Fix AttributeError: module 'collections' has no attribute 'MutableMapping'
 # Python 3.11 is incompatible with google APIs atm (2023/08/25)
@@ -28,48 +37,50 @@ if sys.version_info.major == 3 and sys.version_info.minor >= 10:
 
     setattr(collections, "MutableMapping", collections.abc.MutableMapping)
 
-# If modifying these scopes, delete the file token.pickle.
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
+# Only the fields read by Event.from_dict and the status of deleted events.
+EVENT_FIELDS = (
+    "id,etag,status,start,end,location,summary,description,colorId,htmlLink"
+)
+LIST_FIELDS = f"nextPageToken,nextSyncToken,items({EVENT_FIELDS})"
+PAGE_SIZE = 250
 
+# services already built in this process, per agenda longname
+_services: dict[str, Resource] = {}
 
-def get_credentials(agenda: Agenda) -> Union[Credentials, Any]:
+
+def get_credentials(agenda: Agenda) -> Credentials:
     """
-    Returns the credentials for google calendar api
+    Returns the credentials for google calendar api.
+    They're read once per process and only refreshed when about to expire.
 
-    @return service: (googleapiclient.discovery.Resource) le service passé
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (Credentials) valid credentials
     """
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens/ and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(f"tokens/{agenda.longname}/token.pickle"):
-        with open(f"tokens/{agenda.longname}/token.pickle", "rb") as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                f"tokens/{agenda.longname}/credentials.json", SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open(f"tokens/{agenda.longname}/token.pickle", "wb") as token:
-            pickle.dump(creds, token)
-    return creds
+    return credentials_manager.get(agenda)
 
 
-def build_service(agenda: Agenda) -> Resource:
+def build_service(agenda: Agenda, shared: bool = True) -> Resource:
     """
     Return the google api client service ressource
     with methods for interaction with the service.
-    Start by building the credentials if needed.
-
+    Start by building the credentials if needed. Every service of a thread
+    shares the authorized http session of the agenda.
+    The service is built from the cached discovery document, without any
+    network request.
+
+    @param shared: (bool) reuse the service already built for this agenda in
+        this process. Threads must use their own service : the http transport
+        isn't thread safe.
     @return: (googleapiclient.discovery.Resource)
     """
-    creds = get_credentials(agenda)
-    service = build("calendar", "v3", credentials=creds)
+    if shared and agenda.longname in _services:
+        return _services[agenda.longname]
+    service = build_from_document(
+        discovery_document("calendar", "v3"),
+        http=credentials_manager.authorized_http(agenda),
+    )
+    if shared:
+        _services[agenda.longname] = service
     return service
 
 
@@ -77,25 +88,241 @@ def sync_event_from_md(
     agenda: Agenda,
     service: Resource,
     path: str,
-) -> None:
+    prefetch: bool = True,
+    report: Optional[SyncReport] = None,
+    index: Optional[EventIndex] = None,
+    upsert: bool = False,
+    journal: Optional[SyncJournal] = None,
+    lines: Optional[list[str]] = None,
+    parse_cache: bool = False,
+) -> SyncReport:
     """
     Create or update events from md file
 
     @param service: (Resource) the google api ressource
     @param path: (str) path to the md file
-    @returns: (None)
-    @SE: insert or update events for a given week
+    @param prefetch: (bool) fetch the window of the whole file once and match
+        the events in memory instead of querying the API for every event.
+        Ignored if an index is given.
+    @param report: (Optional[SyncReport]) counters to update. A new one is
+        created if None is given.
+    @param index: (Optional[EventIndex]) already known remote events, like
+        the ones of the local mirror. The API isn't queried before writing.
+        The written events are recorded in it.
+    @param upsert: (bool) write every event by its stable id, without any
+        lookup : updated if it exists, created otherwise. Unchanged events
+        are written too.
+    @param journal: (Optional[SyncJournal]) the journal of the agenda. The
+        recorded events are synced without any lookup, every write is
+        recorded.
+    @param lines: (Optional[list[str]]) the content of the file, if it was
+        already read. The file isn't opened.
+    @param parse_cache: (bool) read the events from the parse cache if the
+        file didn't change. Ignored if lines are given.
+    @returns: (SyncReport) what was created, updated or left unchanged
+    @SE: insert or update events for a given week. The writes are sent
+        in batches.
     """
-    event_list = parse_events(agenda, path)
-    pprint(event_list)
-    for event_details in event_list:
-        update_or_create_event(agenda, service, event_details)
+    if report is None:
+        report = SyncReport()
+    if lines is not None:
+        events = iter_events(agenda, lines)
+    elif parse_cache:
+        events = iter(parse_events_cached(agenda, path))
+    else:
+        events = iter_file_events(agenda, path)
+    synced: set[str] = set()
+    events = remember_synced_ids(map(print_event, events), synced, journal)
+    shared_index = index
+
+    def on_written(event: Event, response: dict) -> None:
+        if journal is not None:
+            journal.record_response(event, path, response)
+        if shared_index is not None:
+            shared_index.record(Event.from_dict(response))
+
+    on_deleted = None
+    if journal is not None:
+
+        def on_deleted(event: Event) -> None:
+            journal.forget(event.id)
+
+    # the writes are held until the whole file is parsed : a malformed line
+    # doesn't leave the week partly synced
+    batch = EventWriteBatch(
+        agenda,
+        service,
+        report,
+        on_written=on_written,
+        on_deleted=on_deleted,
+        hold=True,
+    )
+    if journal is not None:
+        events = write_journaled_events(journal, batch, events, report)
+    if upsert:
+        # nothing has to be looked up
+        missing: list[Event] = []
+        for event_details in events:
+            batch.upsert(event_details, on_missing=missing.append)
+        batch.flush()
+        migrate_events(agenda, service, batch, missing, synced)
+    else:
+        unknown_events = list(events)
+        if index is None and prefetch:
+            index = prefetch_events(agenda, service, unknown_events)
+        matches = match_existing_events(
+            agenda, service, unknown_events, index, synced
+        )
+        for event_details, existing_event in matches:
+            if (
+                journal is not None
+                and existing_event is not None
+                and existing_event.has_same_content(event_details)
+            ):
+                journal.record(event_details, path, existing_event.id)
+            write_event(
+                agenda,
+                service,
+                event_details,
+                existing_event,
+                batch=batch,
+                report=report,
+            )
+    batch.flush()
+    if journal is not None:
+        journal.commit()
+    return report
+
+
+def print_event(event_details: Event) -> Event:
+    """Print a parsed event and returns it."""
+    pprint(event_details)
+    return event_details
+
+
+def remember_synced_ids(
+    events: Iterable[Event],
+    ids: set[str],
+    journal: Optional[SyncJournal] = None,
+) -> Iterator[Event]:
+    """
+    Yields the parsed events and adds to ids the ids of their remote events :
+    their stable ids, and the Google ids recorded in the journal.
+    The remote events with these ids belong to a parsed event, they're never
+    matched by time with another one.
+
+    @param events: (Iterable[Event]) the parsed events of a week file
+    @param ids: (set[str]) updated with the ids of every yielded event
+    @param journal: (Optional[SyncJournal]) the journal of the agenda, if any
+    @returns: (Iterator[Event]) the same events
+    """
+    for event_details in events:
+        if event_details.id:
+            ids.add(event_details.id)
+        if journal is not None:
+            entry = journal.get(event_details)
+            if entry is not None:
+                ids.add(entry.google_id)
+        yield event_details
+
+
+def write_journaled_events(
+    journal: SyncJournal,
+    batch: EventWriteBatch,
+    events: Iterable[Event],
+    report: Optional[SyncReport] = None,
+) -> Iterator[Event]:
+    """
+    Sync the events already recorded in the journal, without any lookup :
+    unchanged events are skipped, changed ones are updated by their Google id.
+
+    @param journal: (SyncJournal) the journal of the agenda
+    @param batch: (EventWriteBatch) collects the writes
+    @param events: (Iterable[Event]) the parsed events
+    @param report: (Optional[SyncReport]) counters of the run, if any.
+    @returns: (Iterator[Event]) the events missing from the journal
+    """
+    for event_details in events:
+        entry = journal.get(event_details)
+        if entry is None:
+            yield event_details
+        elif journal.is_unchanged(event_details, entry):
+            report_unchanged(event_details, report)
+        else:
+            batch.upsert(replace(event_details, id=entry.google_id))
+
+
+def migrate_events(
+    agenda: Agenda,
+    service: Resource,
+    batch: EventWriteBatch,
+    events: list[Event],
+    written_ids: set[str],
+) -> None:
+    """
+    Create the upserted events which are unknown by their stable id.
+
+    Such an event may already exist in its slot with another id : created
+    before events had stable ids, or before its summary or location changed.
+    The remote event found by the usual lookup is deleted and the event is
+    created with its stable id, so the next upsert finds it.
+    Remote events having the id of an event written by this sync aren't
+    candidates : they belong to another event of the same slot.
+
+    @param agenda: (Agenda) holds configured info about the agenda
+    @param service: (Resource) the google api ressource
+    @param batch: (EventWriteBatch) collects the writes
+    @param events: (list[Event]) the events unknown by their id
+    @param written_ids: (set[str]) the stable ids of every upserted event
+    """
+    window = window_of(events)
+    if window is None:
+        return
+    timeMin, timeMax = window
+    index = EventIndex(
+        remote_event
+        for remote_event in retrieve_events(agenda, timeMin, timeMax, service)
+        if remote_event.id not in written_ids
+    )
+    for event_details in events:
+        legacy_event = find_existing_event(agenda, service, event_details, index)
+        if legacy_event is not None:
+            index.remove(legacy_event)
+            batch.delete(legacy_event)
+        batch.insert(event_details)
+    batch.flush()
+
+
+def prefetch_events(
+    agenda: Agenda,
+    service: Resource,
+    event_list: list[Event],
+) -> EventIndex:
+    """
+    Retrieve every event in the window of the parsed events with a single
+    query and index them.
+
+    @param agenda: (Agenda) holds configured info about the agenda
+    @param service: (Resource) the google api ressource
+    @param event_list: (list[Event]) the parsed events
+    @returns: (EventIndex) the remote events of the window
+    """
+    window = window_of(event_list)
+    if window is None:
+        return EventIndex()
+    timeMin, timeMax = window
+    index = EventIndex(retrieve_events(agenda, timeMin, timeMax, service))
+    logger.debug(f"Prefetched events between {timeMin} and {timeMax}")
+    return index
 
 
 def update_or_create_event(
     agenda: Agenda,
     service: Resource,
     event_details: Event,
+    index: Optional[EventIndex] = None,
+    batch: Optional[EventWriteBatch] = None,
+    report: Optional[SyncReport] = None,
 ) -> None:
     """
     Sync a single event read from a .md file.
@@ -105,35 +332,120 @@ def update_or_create_event(
 
     @param service: (Resource) the google api ressource
     @param event_details: (Event) the description of an event
+    @param index: (Optional[EventIndex]) prefetched remote events. If None,
+        the API is queried for this event.
+    @param batch: (Optional[EventWriteBatch]) collects the writes, if any.
+    @param report: (Optional[SyncReport]) counters of the run, if any.
     @returns: (None)
     """
+    existing_event = find_existing_event(agenda, service, event_details, index)
+    write_event(
+        agenda,
+        service,
+        event_details,
+        existing_event,
+        batch=batch,
+        report=report,
+    )
+
+
+def match_existing_events(
+    agenda: Agenda,
+    service: Resource,
+    event_list: list[Event],
+    index: Optional[EventIndex] = None,
+    excluded_ids: Iterable[str] = (),
+) -> list[tuple[Event, Optional[Event]]]:
+    """
+    Returns every parsed event with its remote event, if any.
+    A remote event is matched once : events sharing a slot keep their own
+    remote events.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param service: (Resource) the google api ressource
+    @param event_list: (list[Event]) the parsed events
+    @param index: (Optional[EventIndex]) prefetched remote events. If None,
+        the API is queried for every event.
+    @param excluded_ids: (Iterable[str]) ids of remote events which belong to
+        other parsed events, see `remember_synced_ids`
+    @returns: (list[tuple[Event, Optional[Event]]]) in the order of event_list
+    """
+    if index is not None:
+        return index.match(event_list, excluded_ids)
+    excluded = {event_details.id for event_details in event_list if event_details.id}
+    excluded.update(excluded_ids)
+    matches = []
+    for event_details in event_list:
+        existing_event = find_existing_event(
+            agenda, service, event_details, excluded_ids=excluded
+        )
+        if existing_event is not None:
+            excluded.add(existing_event.id)
+        matches.append((event_details, existing_event))
+    return matches
+
+
+def find_existing_event(
+    agenda: Agenda,
+    service: Resource,
+    event_details: Event,
+    index: Optional[EventIndex] = None,
+    excluded_ids: Collection[str] = (),
+) -> Optional[Event]:
+    """
+    Seek the remote event corresponding to a parsed event.
+    * TIMED events match the event with their stable id, else an event
+        overlaping their time slot, see `pick_timed_match`,
+    * DAY events match an all day event with the same summary.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param service: (Resource) the google api ressource
+    @param event_details: (Event) the description of an event
+    @param index: (Optional[EventIndex]) prefetched remote events. If None,
+        the API is queried for this event.
+    @param excluded_ids: (Collection[str]) ids of remote events which belong
+        to other parsed events
+    @returns: (Optional[Event]) the existing event, if any.
+    """
     if not event_details.is_all_day:
-        create_or_update_timed_event(agenda, service, event_details)
-    else:
-        create_or_update_day_event(agenda, service, event_details)
+        if index is not None:
+            return index.find_timed(event_details, excluded_ids)
+        return find_timed_event_matching_time(
+            agenda, event_details, service, excluded_ids
+        )
+    if index is not None:
+        return index.find_day(event_details, excluded_ids)
+    return find_day_event_matching_summary(
+        agenda, event_details, service, excluded_ids
+    )
 
 
-def create_or_update_timed_event(
+def write_event(
     agenda: Agenda,
     service: Resource,
     event_details: Event,
-):
+    existing_event: Optional[Event],
+    batch: Optional[EventWriteBatch] = None,
+    report: Optional[SyncReport] = None,
+) -> None:
     """
-    Sync a single TIMED event read from a .md file.
-    seek if the event already exists,
-    if there's already an event, it's updated.
-    Else, a new one is created
+    Create the event if there's no existing event, update it otherwise.
 
+    @param agenda: (Agenda) holds info about the agenda
     @param service: (Resource) the google api ressource
     @param event_details: (Event) the description of an event
+    @param existing_event: (Optional[Event]) the matching remote event
+    @param batch: (Optional[EventWriteBatch]) collects the writes, if any.
+    @param report: (Optional[SyncReport]) counters of the run, if any.
     @returns: (None)
     """
-    existing_event = find_timed_event_matching_time(agenda, event_details, service)
     if existing_event is None:
         create_event(
             agenda,
             service=service,
             event_details=event_details,
+            batch=batch,
+            report=report,
         )
     else:
         update_event(
@@ -141,39 +453,44 @@ def create_or_update_timed_event(
             service=service,
             new_event=event_details,
             old_event=existing_event,
+            batch=batch,
+            report=report,
         )
 
 
-def create_or_update_day_event(
+def find_day_event_matching_summary(
     agenda: Agenda,
+    event: Event,
     service: Resource,
-    event_details: Event,
-):
+    excluded_ids: Collection[str] = (),
+) -> Optional[Event]:
     """
-    Sync a single DAY event read from a .md file.
-    seek if the event already exists,
-    if there's already an event, it's updated.
-    Else, a new one is created
+    Look for an all day event with the same summary around the event dates.
+    If one is found, return the event, the one with its stable id first.
+    Else, return None.
 
-    @param agenda: (Agenda) holds info about the agenda
+    @param agenda: (Agenda) holds configured info about the agenda
+    @param event: (Event) event instance
     @param service: (Resource) the google api ressource
-    @param event_details: (Event) the description of an event
-    @returns: (None)
+    @param excluded_ids: (Collection[str]) ids of remote events which belong
+        to other parsed events
+    @return: (Optional[Event]) Already existing event with same summary.
     """
-    timeMin = one_day_earlier(event_details.start["date"])
-    timeMax = event_details.end["date"] + "T00:00:00Z"
-    existing_events = list(
-        retrieve_day_events_matching_date(agenda, timeMin, timeMax, service)
-    )
-    if event_details in existing_events:
-        update_event(
-            agenda,
-            service=service,
-            new_event=event_details,
-            old_event=existing_events[existing_events.index(event_details)],
+    timeMin = one_day_earlier(event.start["date"])
+    timeMax = event.end["date"] + "T00:00:00Z"
+    existing_events = [
+        existing_event
+        for existing_event in retrieve_day_events_matching_date(
+            agenda, timeMin, timeMax, service
         )
-    else:
-        create_event(agenda, service=service, event_details=event_details)
+        if existing_event == event
+    ]
+    for existing_event in existing_events:
+        if event.id and existing_event.id == event.id:
+            return existing_event
+    for existing_event in existing_events:
+        if existing_event.id not in excluded_ids:
+            return existing_event
 
 
 def one_day_earlier(date: str) -> str:
@@ -188,38 +505,71 @@ def one_day_earlier(date: str) -> str:
     ).strftime("%Y-%m-%dT00:00:00Z")
 
 
+def iter_event_pages(
+    agenda: Agenda,
+    service: Resource,
+    page_size: int = PAGE_SIZE,
+    **list_parameters,
+) -> Iterator[dict]:
+    """
+    Yields the pages of an event listing, following `nextPageToken`.
+    The next page is only requested once the previous one is consumed.
+    Only the fields used by Event are requested, the responses are gzipped
+    by the client.
+
+    @param agenda: (Agenda) holds configured info about the agenda
+    @param service: (Resource) the google api ressource
+    @param page_size: (int) maximum number of events per page
+    @param list_parameters: extra parameters of `events().list`, like
+        timeMin, timeMax or syncToken.
+    @returns: (Iterator[dict]) the pages. The last one holds the `nextSyncToken`.
+    """
+    page_token = None
+    while True:
+        page = scheduler.execute(
+            service.events().list(
+                calendarId=agenda.calendar_id,
+                maxResults=page_size,
+                pageToken=page_token,
+                singleEvents=True,
+                fields=LIST_FIELDS,
+                **list_parameters,
+            )
+        )
+        yield page
+        page_token = page.get("nextPageToken")
+        if page_token is None:
+            return
+
+
 def retrieve_events(
     agenda: Agenda, timeMin: str, timeMax: str, service: Resource
-) -> map[Event]:
+) -> Iterator[Event]:
     """
     Returns a generator of Events with time between timeMin and timeMax.
+    Every page of the listing is read, lazily.
 
     @param agenda: (Agenda) holds configured info about the agenda
     @param timeMin: (str)
     @param timeMax: (str)
     @param service: (Resource)
-    @returns: (map[Event]) generator of Event created on the fly.
+    @returns: (Iterator[Event]) generator of Event created on the fly.
     """
-    return map(
-        Event.from_dict,
-        service.events()
-        .list(
-            calendarId=agenda.calendar_id,
-            timeMin=timeMin,
-            timeMax=timeMax,
-            maxResults=200,
-            singleEvents=True,
-            orderBy="startTime",
-        )
-        .execute()
-        .get("items", []),
-    )
+    for page in iter_event_pages(
+        agenda,
+        service,
+        timeMin=timeMin,
+        timeMax=timeMax,
+        orderBy="startTime",
+    ):
+        yield from map(Event.from_dict, page.get("items", []))
 
 
 def find_timed_event_matching_time(
     agenda: Agenda,
     event: Event,
     service: Resource,
+    excluded_ids: Collection[str] = (),
 ) -> Optional[Event]:
     """
     Look for an event by given dates in calendar.
@@ -228,6 +578,8 @@ def find_timed_event_matching_time(
 
     @param agenda: (Agenda) holds configured info about the agenda
     @param event: (Event) event instance
+    @param excluded_ids: (Collection[str]) ids of remote events which belong
+        to other parsed events
     @return: (Optional[Event]) Already existing event with overlaping time.
     """
     if event.is_all_day:
@@ -235,30 +587,27 @@ def find_timed_event_matching_time(
     timeMin = event.start["dateTime"]
     timeMax = event.end["dateTime"]
 
-    events_filtered = list(
-        filter_only_timed_events(
-            retrieve_events(agenda, timeMin, timeMax, service),
-        )
+    events_filtered = filter_only_timed_events(
+        retrieve_events(agenda, timeMin, timeMax, service),
     )
-    if events_filtered and not events_filtered[0].is_all_day:
-        return events_filtered[0]
+    return pick_timed_match(event, events_filtered, excluded_ids)
 
 
-def filter_only_all_day_events(events: map[Event]) -> filter[Event]:
+def filter_only_all_day_events(events: Iterable[Event]) -> filter[Event]:
     """
     Filter a map of Event to only keep all day events.
 
-    @param events: (map[Event])
+    @param events: (Iterable[Event])
     @returns: (filter[Event])
     """
     return filter(lambda event: "date" in event.start, events)
 
 
-def filter_only_timed_events(events: map[Event]) -> filter[Event]:
+def filter_only_timed_events(events: Iterable[Event]) -> filter[Event]:
     """
     Filter a map of Event to only keep timed events.
 
-    @param events: (map[Event])
+    @param events: (Iterable[Event])
     @returns: (filter[Event])
     """
     return filter(lambda event: not "date" in event.start, events)
@@ -288,6 +637,8 @@ def create_event(
     agenda: Agenda,
     service: Resource,
     event_details: Event,
+    batch: Optional[EventWriteBatch] = None,
+    report: Optional[SyncReport] = None,
 ) -> None:
     """
     Create a new event with given details
@@ -295,22 +646,22 @@ def create_event(
     @param agenda: (Agenda) holds info about the agenda
     @param event_details: (dict) description of the event
     @param service: (google api ressource service) the service
+    @param batch: (Optional[EventWriteBatch]) if given, the creation is queued
+        in the batch instead of being sent immediately.
+    @param report: (Optional[SyncReport]) counters of the run, if any.
     @return: (None)
     """
-    event = (
-        service.events()
-        .insert(
+    if batch is not None:
+        batch.insert(event_details)
+        return
+    event = scheduler.execute(
+        service.events().insert(
             calendarId=agenda.calendar_id,
             body=event_details.__dict__,
         )
-        .execute()
     )
 
-    creation_event_msg = (
-        f"Event created: {event_details.readable_start_date()} {event.get('htmlLink')}"
-    )
-    print(color_text(creation_event_msg, "YELLOW"))
-    logger.warning(creation_event_msg)
+    report_created(event_details, event, report)
 
 
 def update_event(
@@ -318,31 +669,38 @@ def update_event(
     service: Resource,
     new_event: Event,
     old_event: Event,
+    batch: Optional[EventWriteBatch] = None,
+    report: Optional[SyncReport] = None,
 ) -> None:
     """
     Update the details of an event.
     The event can be passed or only his id
     If no service is given, will create the service
+    Nothing is sent if the content of the event didn't change.
 
 
     @param event_details: (dict) les attributs de l'événements à mettre à jour
     @param new_event: (Event) the new event to push
     @param old_event: (Event) the old event to update
+    @param batch: (Optional[EventWriteBatch]) if given, the update is queued
+        in the batch instead of being sent immediately.
+    @param report: (Optional[SyncReport]) counters of the run, if any.
     @returns: (None)
     """
-    old_event.update(new_event)
-
-    updated_data = (
-        service.events()
-        .update(
+    if old_event.has_same_content(new_event):
+        report_unchanged(new_event, report)
+        return
+    if batch is not None:
+        batch.update(new_event, old_event)
+        return
+    updated_event = replace(old_event)
+    updated_event.update(new_event)
+
+    updated_data = scheduler.execute(
+        service.events().update(
             calendarId=agenda.calendar_id,
             eventId=old_event.id,
-            body=old_event.__dict__,
+            body=updated_event.__dict__,
         )
-        .execute()
-    )
-    update_event_msg = (
-        f"Event updated: {new_event.readable_start_date()} {updated_data['htmlLink']}"
     )
-    print(color_text(update_event_msg, "CYAN"))
-    logger.warning(update_event_msg)
+    report_updated(new_event, updated_data, report)
@@ -0,0 +1,206 @@
+"""
+title: journal
+author: qkzk
+
+Local journal of the events synced from the md files, one SQLite database per
+agenda, stored in `tokens/<agenda>/journal.sqlite3`.
+
+Every synced event is recorded with its source file and day, its Google id,
+its etag and a hash of its content. On the next sync :
+
+* an event whose hash didn't change needs no request at all,
+* a changed event is updated directly by its Google id,
+* only the events missing from the journal are looked up and created.
+
+The journal only knows what was written from here : an event deleted or
+edited in Google Calendar is restored by the next sync only if its line of
+the md file changes.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from hashlib import sha1
+from typing import Optional
+
+import os
+import sqlite3
+import time
+
+from .config import Agenda
+from .model import Event, stable_event_id
+
+JOURNAL_PATH = "tokens/{}/journal.sqlite3"
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    day TEXT NOT NULL,
+    google_id TEXT NOT NULL,
+    etag TEXT,
+    content_hash TEXT NOT NULL,
+    synced_at REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class JournalEntry:
+    """
+    What we know about an event synced from a md file.
+    """
+
+    key: str
+    path: str
+    day: str
+    google_id: str
+    etag: Optional[str]
+    content_hash: str
+
+
+def content_hash(event: Event) -> str:
+    """
+    Returns a hash of the synced fields of the event.
+    The same event parsed twice or read from the API gives the same hash.
+
+    @param event: (Event)
+    @return: (str) hexadecimal digest
+    """
+    content = "\x1f".join(map(str, event.content_key()))
+    return sha1(content.encode("utf-8")).hexdigest()
+
+
+def event_day(event: Event) -> str:
+    """
+    Returns the day of the event, like "2023-09-04".
+
+    @param event: (Event)
+    @return: (str)
+    """
+    if event.is_all_day:
+        return event.start["date"]
+    return event.start["dateTime"][:10]
+
+
+class SyncJournal:
+    """
+    The journal of an agenda. Changes are written by `commit`.
+
+    @param agenda: (Agenda) the journaled agenda
+    @param path: (Optional[str]) defaults to the journal file of the agenda
+    """
+
+    def __init__(self, agenda: Agenda, path: Optional[str] = None):
+        self.agenda = agenda
+        self.path = path or JOURNAL_PATH.format(agenda.longname)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(CREATE_TABLE)
+        self.connection.commit()
+
+    def key_of(self, event: Event) -> str:
+        """
+        Returns the journal key of a parsed event : the stable id of its slot,
+        whatever the id of the event in Google Calendar.
+        """
+        return stable_event_id(self.agenda.longname, event)
+
+    def get(self, event: Event) -> Optional[JournalEntry]:
+        """
+        Returns the entry of a parsed event, None if it was never synced.
+
+        @param event: (Event) a parsed event
+        @return: (Optional[JournalEntry])
+        """
+        row = self.connection.execute(
+            "SELECT key, path, day, google_id, etag, content_hash FROM events WHERE key = ?",
+            (self.key_of(event),),
+        ).fetchone()
+        return JournalEntry(*row) if row is not None else None
+
+    def is_unchanged(self, event: Event, entry: Optional[JournalEntry]) -> bool:
+        """
+        True if the event was synced with the same content.
+
+        @param event: (Event) a parsed event
+        @param entry: (Optional[JournalEntry]) its entry, if any
+        @return: (bool)
+        """
+        return entry is not None and entry.content_hash == content_hash(event)
+
+    def record(
+        self,
+        event: Event,
+        path: str,
+        google_id: str,
+        etag: Optional[str] = None,
+    ) -> None:
+        """
+        Record an event synced from a md file.
+
+        @param event: (Event) the parsed event
+        @param path: (str) its md file
+        @param google_id: (str) the id of the event in Google Calendar
+        @param etag: (Optional[str]) the etag returned by the API
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.key_of(event),
+                path,
+                event_day(event),
+                google_id,
+                etag,
+                content_hash(event),
+                time.time(),
+            ),
+        )
+
+    def record_response(self, event: Event, path: str, response: dict) -> None:
+        """
+        Record an event written to the API, from the API response.
+
+        @param event: (Event) the parsed event
+        @param path: (str) its md file
+        @param response: (dict) the created or updated event
+        """
+        self.record(event, path, response["id"], response.get("etag"))
+
+    def google_ids(self) -> set[str]:
+        """Returns the Google ids of every recorded event."""
+        return {
+            google_id
+            for (google_id,) in self.connection.execute("SELECT google_id FROM events")
+        }
+
+    def forget(self, google_id: str) -> None:
+        """
+        Remove the entry of a deleted event.
+
+        @param google_id: (str) the id of the event in Google Calendar
+        """
+        self.connection.execute("DELETE FROM events WHERE google_id = ?", (google_id,))
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+
+def journaled_ids(agenda: Agenda) -> set[str]:
+    """
+    Returns the Google ids recorded in the journal of an agenda, an empty set
+    if it has no journal. The journal isn't created.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (set[str])
+    """
+    path = JOURNAL_PATH.format(agenda.longname)
+    if not os.path.exists(path):
+        return set()
+    journal = SyncJournal(agenda, path)
+    try:
+        return journal.google_ids()
+    finally:
+        journal.close()
@@ -0,0 +1,180 @@
+"""
+title: mirror
+author: qkzk
+
+Local mirror of a Google Calendar agenda.
+
+The mirror is stored in `tokens/<agenda>/mirror.json`. It's initialized with
+one full listing of the school year of the agenda and then kept current with
+incremental syncs : the API only returns the events changed since the last
+`nextSyncToken`. The file is replaced atomically.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import datetime
+import json
+import os
+
+from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
+
+from .config import Agenda
+from .event_index import EventIndex
+from .google_interaction import iter_event_pages
+from .logger import logger
+from .model import Event
+from .school_year import SCHOOL_YEAR_START_MONTH
+
+MIRROR_PATH = "tokens/{}/mirror.json"
+MIRROR_PAGE_SIZE = 2500
+
+
+def school_year_window(year: int) -> tuple[str, str]:
+    """
+    Returns the (timeMin, timeMax) window of a school year, in UTC.
+
+    @param year: (int) the school year, 2023 for 2023-2024
+    @return: (tuple[str, str]) isoformated datetimes
+    """
+    utc = datetime.timezone.utc
+    start = datetime.datetime(year, SCHOOL_YEAR_START_MONTH, 1, tzinfo=utc)
+    end = datetime.datetime(year + 1, SCHOOL_YEAR_START_MONTH, 1, tzinfo=utc)
+    return start.isoformat(), end.isoformat()
+
+
+class AgendaMirror:
+    """
+    Events of an agenda, indexed by their id, and the token of the last sync.
+    The full listing covers the school year of the agenda : a mirror of
+    another school year is listed again.
+    """
+
+    def __init__(
+        self,
+        agenda: Agenda,
+        events: Optional[dict[str, dict]] = None,
+        sync_token: Optional[str] = None,
+    ):
+        self.agenda = agenda
+        self.events = events if events is not None else {}
+        self.sync_token = sync_token
+
+    @classmethod
+    def load(cls, agenda: Agenda) -> AgendaMirror:
+        """
+        Read the mirror of an agenda from its file.
+        Returns an empty mirror if the agenda was never mirrored.
+
+        @param agenda: (Agenda) the mirrored agenda
+        @return: (AgendaMirror)
+        """
+        path = MIRROR_PATH.format(agenda.longname)
+        if not os.path.exists(path):
+            return cls(agenda)
+        with open(path, "r", encoding="utf-8") as mirror_file:
+            content = json.load(mirror_file)
+        if content.get("year") != agenda.year:
+            return cls(agenda)
+        return cls(agenda, content["events"], content["sync_token"])
+
+    def save(self) -> None:
+        """
+        Write the mirror to its file. A temporary file replaces it : an
+        interrupted run leaves the previous mirror.
+        """
+        path = MIRROR_PATH.format(self.agenda.longname)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as mirror_file:
+                json.dump(
+                    {
+                        "year": self.agenda.year,
+                        "sync_token": self.sync_token,
+                        "events": self.events,
+                    },
+                    mirror_file,
+                )
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def refresh(self, service: Resource) -> int:
+        """
+        Bring the mirror up to date.
+        Incremental sync if we have a sync token, full listing otherwise or if
+        the token has expired (the API answers 410 Gone).
+
+        @param service: (Resource) the google api ressource
+        @return: (int) number of events read from the API
+        """
+        if self.sync_token is not None:
+            try:
+                return self._sync(service, syncToken=self.sync_token)
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                logger.warning(f"Sync token expired for {self.agenda.longname}")
+        self.events = {}
+        timeMin, timeMax = school_year_window(self.agenda.year)
+        return self._sync(service, timeMin=timeMin, timeMax=timeMax)
+
+    def _sync(self, service: Resource, **list_parameters) -> int:
+        """
+        Read every page of a listing and apply the changes to the mirror.
+        The sync token is given by the last page.
+
+        @param service: (Resource) the google api ressource
+        @param list_parameters: extra parameters of `events().list`
+        @return: (int) number of events read
+        """
+        read = 0
+        for page in iter_event_pages(
+            self.agenda, service, page_size=MIRROR_PAGE_SIZE, **list_parameters
+        ):
+            for item in page.get("items", []):
+                self.apply(item)
+                read += 1
+        self.sync_token = page.get("nextSyncToken")
+        logger.debug(f"Mirror of {self.agenda.longname}: {read} events read")
+        return read
+
+    def apply(self, item: dict) -> None:
+        """
+        Apply a change read from the API : deleted events are removed,
+        others are created or replaced.
+
+        @param item: (dict) an event as returned by the API
+        """
+        if item.get("status") == "cancelled":
+            self.events.pop(item["id"], None)
+        else:
+            self.events[item["id"]] = item
+
+    def index(self) -> EventIndex:
+        """
+        Returns an index of the mirrored events, used for matching.
+        Events without a summary can't be matched and are ignored.
+        """
+        return EventIndex(
+            Event.from_dict(item) for item in self.events.values() if "summary" in item
+        )
+
+
+def refreshed_mirror(agenda: Agenda, service: Resource) -> AgendaMirror:
+    """
+    Load the mirror of an agenda, bring it up to date and save it.
+
+    @param agenda: (Agenda) the mirrored agenda
+    @param service: (Resource) the google api ressource
+    @return: (AgendaMirror)
+    """
+    mirror = AgendaMirror.load(agenda)
+    read = mirror.refresh(service)
+    mirror.save()
+    logger.warning(
+        f"Mirror of {agenda.longname} refreshed: {read} changes, {len(mirror.events)} events"
+    )
+    return mirror
@@ -1,7 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from typing import Union
 
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from hashlib import sha1
 
 
 @dataclass
@@ -15,6 +17,7 @@ class Event:
     * 'summary':str ('%' if no summary were given)
     * 'description':str (possibly empty or multiline)
     * 'colorId':str ('1' to '11')
+    * 'etag':str (the version of a remote event, empty for a parsed event)
 
     """
 
@@ -27,6 +30,7 @@ class Event:
     colorId: str
     htmlLink: str
     is_all_day: bool
+    etag: str = ""
 
     @classmethod
     def from_dict(cls, event_dict: dict) -> Event:
@@ -45,6 +49,7 @@ class Event:
             colorId=event_dict.get("colorId", "11"),
             htmlLink=event_dict.get("htmlLink", ""),
             is_all_day=is_all_day,
+            etag=event_dict.get("etag", ""),
         )
         cls.raise_if_invalid(event)
         return event
@@ -62,7 +67,7 @@ class Event:
     def update(self, event: Event) -> None:
         """
         Update values from new event.
-        Keeps the id and htmlLink untouched.
+        Keeps the id, htmlLink and etag untouched.
         """
         self.start = event.start
         self.end = event.end
@@ -71,6 +76,45 @@ class Event:
         self.description = event.description
         self.colorId = event.colorId
 
+    def content_key(self) -> tuple:
+        """
+        Returns the synced fields of the event, normalized so a parsed event
+        and the same event read from the API give the same key :
+        * timed events are compared by instant, whatever the offset format,
+        * all day events ending on their starting day end the next day, as
+            the API stores them with an exclusive end date.
+        """
+        start = normalize_time(self.start)
+        end = normalize_time(self.end)
+        if self.is_all_day and end <= start:
+            end = start + timedelta(days=1)
+        return (
+            start,
+            end,
+            self.location,
+            self.summary,
+            self.description,
+            self.colorId,
+        )
+
+    def slot_key(self) -> tuple:
+        """
+        Returns the key identifying the place of the event in a week :
+        * timed events are identified by their starting instant,
+        * all day events by their starting day and their summary, as several
+            of them may share a day.
+        """
+        if self.is_all_day:
+            return ("day", normalize_time(self.start), self.summary)
+        return ("timed", normalize_time(self.start))
+
+    def has_same_content(self, other: Event) -> bool:
+        """
+        True if start, end, location, summary, description and colorId are
+        the same for both events. Ids and links aren't compared.
+        """
+        return self.content_key() == other.content_key()
+
     def readable_start_date(self) -> str:
         """
         Transform a dict describing the start time event into a readable string.
@@ -88,3 +132,53 @@ class Event:
 
     def __eq__(self, other: Event) -> bool:
         return self.summary == other.summary
+
+
+def normalize_time(time_dict: dict[str, str]) -> Union[date, datetime]:
+    """
+    Convert the start or end of an event into a comparable object.
+
+    {"date": "2019-08-09"}                          -----> date(2019, 8, 9)
+    {"dateTime": "2019-08-09T15:00:00+02:00", ...}  -----> aware datetime
+
+    @param time_dict: (dict[str, str]) start or end of an event
+    @return: (Union[date, datetime])
+    """
+    if "dateTime" in time_dict:
+        return datetime.fromisoformat(time_dict["dateTime"].replace("Z", "+00:00"))
+    return date.fromisoformat(time_dict["date"])
+
+
+def stable_event_id(namespace: str, event: Event) -> str:
+    """
+    Returns an event id derived from the agenda and the slot of the event.
+    The same slot of the same agenda always gets the same id, so the event
+    can be written by id without looking it up first.
+    Several timed events may start at the same instant, for different groups
+    or rooms : their summary and location are part of the slot.
+
+    Google accepts ids made of the base32hex characters (a-v, 0-9), 5 to 1024
+    long : an hexadecimal digest fits.
+
+    @param namespace: (str) the agenda longname
+    @param event: (Event) a parsed event
+    @return: (str) 40 hexadecimal characters
+    """
+    if event.is_all_day:
+        slot = f"day|{event.start['date']}|{event.summary}"
+    else:
+        start = normalize_time(event.start).astimezone(timezone.utc)
+        slot = f"timed|{start.isoformat()}|{event.summary}|{event.location}"
+    return sha1(f"{namespace}|{slot}".encode("utf-8")).hexdigest()
+
+
+def has_stable_id(namespace: str, event: Event) -> bool:
+    """
+    True if a remote event has the stable id of its own slot : it was written
+    by this application and wasn't moved or renamed in Google Calendar since.
+
+    @param namespace: (str) the agenda longname
+    @param event: (Event) an event read from the API
+    @return: (bool)
+    """
+    return event.id == stable_event_id(namespace, event)
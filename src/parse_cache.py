@@ -0,0 +1,223 @@
+"""
+title: parse cache
+author: qkzk
+
+Local cache of the parsed week files, stored in `cache/parsed/`.
+
+Every entry holds the events parsed from a week file for an agenda, with the
+size, modification time and content hash of the file :
+
+* a file with the same size and modification time is read from the cache,
+    without opening the week file,
+* otherwise the file is hashed and parsed again only if its content changed.
+
+The name of an entry depends on the agenda settings used by the parser (color
+rules, default color, timezone, school year), on the markdown version and on
+PARSE_CACHE_FORMAT, to bump when the parser changes : a change gives new
+entries. The least recently used entries are removed when the cache is bigger
+than PARSE_CACHE_MAX_BYTES.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict
+from hashlib import sha1
+from typing import Optional
+
+import io
+import json
+import os
+import threading
+import time
+
+import markdown
+
+from .config import Agenda
+from .explore_md_file import parse_lines
+from .model import Event
+
+PARSE_CACHE_DIR = "cache/parsed"
+PARSE_CACHE_FORMAT = 3
+PARSE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# a file modified this close to its caching may change again with the same
+# size and modification time : its content is checked
+RACY_DELAY = 2.0
+
+
+def agenda_fingerprint(agenda: Agenda) -> str:
+    """
+    Returns a hash of everything the parsed events depend on, besides the
+    week file.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (str) hexadecimal digest
+    """
+    settings = [
+        PARSE_CACHE_FORMAT,
+        markdown.__version__,
+        agenda.longname,
+        agenda.default_color,
+        agenda.colors,
+        agenda.timezone,
+        agenda.year,
+    ]
+    return sha1(json.dumps(settings).encode("utf-8")).hexdigest()
+
+
+def entry_path(agenda: Agenda, path: str) -> str:
+    """
+    Returns the cache file of a week file parsed for an agenda.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path: (str) the week file
+    @return: (str) like "cache/parsed/<hash>.json"
+    """
+    key = f"{agenda_fingerprint(agenda)}\0{os.path.abspath(path)}"
+    return os.path.join(PARSE_CACHE_DIR, sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+
+def parse_events_cached(agenda: Agenda, path: str) -> list[Event]:
+    """
+    Returns the events of a week file, from the cache if the file didn't
+    change. The cache is updated otherwise.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path: (str) the week file
+    @return: (list[Event]) all the events of the week
+    """
+    cache_path = entry_path(agenda, path)
+    entry = read_entry(cache_path)
+    stat = os.stat(path)
+    if entry is not None and is_same_file(entry, stat):
+        touch(cache_path)
+        return events_of(entry)
+
+    with open(path, "rb") as week_file:
+        content = week_file.read()
+    content_hash = sha1(content).hexdigest()
+    if entry is not None and entry["content_hash"] == content_hash:
+        events = events_of(entry)
+    else:
+        lines = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8")
+        events = parse_lines(agenda, lines)
+    if write_entry(cache_path, stat, content_hash, events):
+        evict()
+    return events
+
+
+def read_entry(cache_path: str) -> Optional[dict]:
+    """
+    Read a cache entry. Returns None if it's missing, unreadable or written
+    in another format.
+
+    @param cache_path: (str) path of the cache file
+    @return: (Optional[dict]) with keys format, size, mtime_ns, content_hash,
+        cached_at and events
+    """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            entry = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if entry.get("format") != PARSE_CACHE_FORMAT:
+        return None
+    return entry
+
+
+def is_same_file(entry: dict, stat: os.stat_result) -> bool:
+    """
+    True if the week file has the size and modification time it had when it
+    was cached, long enough before the caching.
+
+    @param entry: (dict) the cache entry
+    @param stat: (os.stat_result) of the week file
+    @return: (bool)
+    """
+    return (
+        entry["size"] == stat.st_size
+        and entry["mtime_ns"] == stat.st_mtime_ns
+        and stat.st_mtime_ns / 1e9 < entry["cached_at"] - RACY_DELAY
+    )
+
+
+def events_of(entry: dict) -> list[Event]:
+    """Returns the events of a cache entry."""
+    return [Event(**event) for event in entry["events"]]
+
+
+def write_entry(
+    cache_path: str,
+    stat: os.stat_result,
+    content_hash: str,
+    events: list[Event],
+) -> bool:
+    """
+    Write the events of a week file to the cache. The file is replaced
+    atomically : several processes may sync at once.
+    A failed write leaves the cache as it was : the file is parsed again on
+    its next sync.
+
+    @param cache_path: (str) path of the cache file
+    @param stat: (os.stat_result) of the week file
+    @param content_hash: (str) hash of the content of the week file
+    @param events: (list[Event]) its parsed events
+    @return: (bool) True if the entry was written
+    """
+    temporary_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temporary_path, "w", encoding="utf-8") as cache_file:
+            json.dump(
+                {
+                    "format": PARSE_CACHE_FORMAT,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "content_hash": content_hash,
+                    "cached_at": time.time(),
+                    "events": [asdict(event) for event in events],
+                },
+                cache_file,
+            )
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def touch(cache_path: str) -> None:
+    """Mark an entry as recently used."""
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+
+
+def evict(max_bytes: int = PARSE_CACHE_MAX_BYTES) -> None:
+    """
+    Remove the least recently used entries until the cache is smaller than
+    max_bytes. The temporary files are left alone : they're entries being
+    written by another sync.
+
+    @param max_bytes: (int) maximum size of the cache
+    """
+    entries = []
+    for dir_entry in os.scandir(PARSE_CACHE_DIR):
+        if not dir_entry.name.endswith(".json"):
+            continue
+        try:
+            stat = dir_entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
@@ -0,0 +1,230 @@
+"""
+title: pipeline
+author: qkzk
+
+Sync several week files at once with a staged pipeline :
+
+    read -> parse -> match -> write
+
+Every stage runs its own worker threads and stages are linked by bounded
+queues, so a week is parsed while another waits for the API.
+The httplib2 transport isn't thread safe : every worker talking to the API
+builds its own service.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+
+from queue import Queue
+from typing import Any, Callable, Optional
+
+import threading
+
+from googleapiclient.discovery import Resource
+
+from .batch_writes import EventWriteBatch
+from .config import Agenda
+from .event_index import EventIndex
+from .explore_md_file import get_lines_from, parse_lines
+from .google_interaction import (
+    build_service,
+    match_existing_events,
+    prefetch_events,
+    write_event,
+)
+from .logger import logger
+from .model import Event
+from .parse_cache import parse_events_cached
+from .report import SyncReport
+
+# marks the end of the stream of jobs in a queue
+END_OF_JOBS = None
+
+
+@dataclass
+class PipelineWorkers:
+    """
+    Number of worker threads per stage and size of the queues between stages.
+    """
+
+    read: int = 1
+    parse: int = 2
+    match: int = 4
+    write: int = 2
+    queue_size: int = 4
+
+    @classmethod
+    def from_list(cls, counts: list[int]) -> PipelineWorkers:
+        """
+        Creates the workers from a list of 4 counts : read, parse, match, write.
+        Raise ValueError if a count isn't positive.
+        """
+        if len(counts) != 4 or any(count < 1 for count in counts):
+            raise ValueError(f"4 positive worker counts expected, got {counts}")
+        read, parse, match, write = counts
+        return cls(read=read, parse=parse, match=match, write=write)
+
+
+@dataclass
+class WeekJob:
+    """
+    A week file travelling through the pipeline.
+    `position` is the order of the file given by the user.
+    """
+
+    position: int
+    path: str
+    lines: list[str] = field(default_factory=list)
+    events: list[Event] = field(default_factory=list)
+    matches: list[tuple[Event, Optional[Event]]] = field(default_factory=list)
+    report: SyncReport = field(default_factory=SyncReport)
+    error: Optional[Exception] = None
+
+
+class Stage:
+    """
+    A pool of worker threads reading jobs from an inbox, processing them and
+    pushing them to an outbox.
+    A failing job keeps its error and goes through the next stages untouched.
+    When its last worker stops, the stage closes its outbox for the next stage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process: Callable[[WeekJob, threading.local], Any],
+        inbox: Queue,
+        outbox: Queue,
+        workers: int,
+        next_workers: int,
+    ):
+        self.name = name
+        self.process = process
+        self.inbox = inbox
+        self.outbox = outbox
+        self.next_workers = next_workers
+        self._running = workers
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._work, name=f"{name}-{number}", daemon=True)
+            for number in range(workers)
+        ]
+
+    def start(self) -> None:
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self) -> None:
+        local = threading.local()
+        while True:
+            job = self.inbox.get()
+            if job is END_OF_JOBS:
+                break
+            if job.error is None:
+                try:
+                    self.process(job, local)
+                except Exception as error:
+                    logger.error(f"{self.name} failed for {job.path}: {error}")
+                    job.error = error
+            self.outbox.put(job)
+        with self._lock:
+            self._running -= 1
+            if self._running == 0:
+                for _ in range(self.next_workers):
+                    self.outbox.put(END_OF_JOBS)
+
+
+def sync_weeks_pipelined(
+    agenda: Agenda,
+    path_list: list[str],
+    workers: Optional[PipelineWorkers] = None,
+    prefetch: bool = True,
+    index: Optional[EventIndex] = None,
+    parse_cache: bool = False,
+) -> list[WeekJob]:
+    """
+    Sync every week file through the pipeline.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path_list: (list[str]) the week files
+    @param workers: (Optional[PipelineWorkers]) threads per stage
+    @param prefetch: (bool) prefetch the window of every file before matching.
+        Ignored if an index is given.
+    @param index: (Optional[EventIndex]) already known remote events, shared
+        by every match worker.
+    @param parse_cache: (bool) read the events of the unchanged files from the
+        parse cache
+    @return: (list[WeekJob]) the jobs, in the order of path_list, with their
+        reports or errors.
+    """
+    if workers is None:
+        workers = PipelineWorkers()
+
+    def service_of(local: threading.local) -> Resource:
+        if not hasattr(local, "service"):
+            local.service = build_service(agenda, shared=False)
+        return local.service
+
+    def read(job: WeekJob, local: threading.local) -> None:
+        # the parse cache only reads the files which changed
+        if not parse_cache:
+            job.lines = get_lines_from(job.path)
+
+    def parse(job: WeekJob, local: threading.local) -> None:
+        if parse_cache:
+            job.events = parse_events_cached(agenda, job.path)
+            return
+        job.events = parse_lines(agenda, job.lines)
+        job.lines = []
+
+    def match(job: WeekJob, local: threading.local) -> None:
+        service = service_of(local)
+        week_index = index
+        if week_index is None and prefetch:
+            week_index = prefetch_events(agenda, service, job.events)
+        job.matches = match_existing_events(agenda, service, job.events, week_index)
+
+    def record(event: Event, response: dict) -> None:
+        # the next weeks are matched against the written events
+        if index is not None:
+            index.record(Event.from_dict(response))
+
+    def write(job: WeekJob, local: threading.local) -> None:
+        service = service_of(local)
+        batch = EventWriteBatch(agenda, service, job.report, on_written=record)
+        for event, existing_event in job.matches:
+            write_event(
+                agenda, service, event, existing_event, batch=batch, report=job.report
+            )
+        batch.flush()
+
+    counts = [workers.read, workers.parse, workers.match, workers.write]
+    queues = [Queue(maxsize=workers.queue_size) for _ in range(len(counts) + 1)]
+    stages = [
+        Stage(name, process, queues[number], queues[number + 1], count, next_count)
+        for number, (name, process, count, next_count) in enumerate(
+            zip(
+                ("read", "parse", "match", "write"),
+                (read, parse, match, write),
+                counts,
+                counts[1:] + [1],
+            )
+        )
+    ]
+    for stage in stages:
+        stage.start()
+
+    def feed() -> None:
+        for position, path in enumerate(path_list):
+            queues[0].put(WeekJob(position, path))
+        for _ in range(workers.read):
+            queues[0].put(END_OF_JOBS)
+
+    threading.Thread(target=feed, name="feed", daemon=True).start()
+
+    done = []
+    while True:
+        job = queues[-1].get()
+        if job is END_OF_JOBS:
+            break
+        done.append(job)
+    return sorted(done, key=lambda job: job.position)
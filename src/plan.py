@@ -0,0 +1,428 @@
+"""
+title: plan
+author: qkzk
+
+Sync in two steps : plan, then apply.
+
+* `plan_weeks` compares the parsed week files with a snapshot of the calendar
+    and returns the operations to do : create, update, noop or delete.
+    It doesn't send any request.
+* the plan is stored as json in `tokens/<agenda>/plan.json` and can be
+    reviewed before it's applied.
+* `apply_plan` sends exactly the writes of the plan, in batches. Updates and
+    deletions are conditional : a remote event edited since the plan was made
+    isn't overwritten, the write fails with 412 Precondition Failed.
+* a stored plan is applied once : it's renamed `plan.applied.json` afterwards.
+
+With `reconcile`, every week of a file is compared as a whole : the remote
+events of the week which aren't in the file anymore are deleted. Only the
+events written by this application are deleted : the ones with the stable id
+of their slot, or recorded in the journal. Events added by hand or accepted
+invitations are kept.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Collection, Optional
+
+import json
+import os
+
+from googleapiclient.discovery import Resource
+
+from .batch_writes import EventWriteBatch, report_unchanged
+from .colors import color_text
+from .config import Agenda
+from .event_index import EventIndex, starts_between, week_window
+from .explore_md_file import parse_events
+from .google_interaction import prefetch_events, retrieve_events
+from .journal import SyncJournal
+from .logger import logger
+from .model import Event, has_stable_id
+from .parse_cache import parse_events_cached
+from .rate_limiter import error_status
+from .report import SyncReport
+
+PLAN_PATH = "tokens/{}/plan.json"
+APPLIED_PLAN_PATH = "tokens/{}/plan.applied.json"
+
+CONFLICTS_MSG = """{} events were edited in the calendar since the plan was made and were left untouched.
+Make a new plan : --plan"""
+
+KEPT_EVENT_MSG = "Event {} ({}) isn't in {} but wasn't written by calpy : kept"
+
+CREATE = "create"
+UPDATE = "update"
+NOOP = "noop"
+DELETE = "delete"
+ACTIONS = (CREATE, UPDATE, NOOP, DELETE)
+
+
+@dataclass
+class Operation:
+    """
+    A single operation of a plan.
+
+    * action : one of create, update, noop or delete
+    * event : the parsed event, None for a deletion
+    * existing : the remote event, None for a creation
+    * path : the week file the operation comes from
+    """
+
+    action: str
+    event: Optional[Event] = None
+    existing: Optional[Event] = None
+    path: str = ""
+
+    def to_dict(self) -> dict:
+        return {
+            "action": self.action,
+            "event": asdict(self.event) if self.event is not None else None,
+            "existing": asdict(self.existing) if self.existing is not None else None,
+            "path": self.path,
+        }
+
+    @classmethod
+    def from_dict(cls, operation_dict: dict) -> Operation:
+        """
+        Creates an operation read from a plan file.
+        Raise ValueError if the action is unknown.
+        """
+        if operation_dict["action"] not in ACTIONS:
+            raise ValueError(f"Unknown action {operation_dict['action']}")
+        event = operation_dict.get("event")
+        existing = operation_dict.get("existing")
+        return cls(
+            action=operation_dict["action"],
+            event=Event(**event) if event is not None else None,
+            existing=Event(**existing) if existing is not None else None,
+            path=operation_dict.get("path", ""),
+        )
+
+    def describe(self) -> str:
+        """Returns a readable line describing the operation."""
+        event = self.event if self.event is not None else self.existing
+        return f"{self.action:<6} {event.readable_start_date()} {event.summary}"
+
+
+@dataclass
+class SyncPlan:
+    """
+    The operations needed to sync the week files of an agenda.
+    """
+
+    agenda: str
+    paths: list[str] = field(default_factory=list)
+    operations: list[Operation] = field(default_factory=list)
+
+    def counts(self) -> dict[str, int]:
+        """Returns the number of operations of every action."""
+        counts = {action: 0 for action in ACTIONS}
+        for operation in self.operations:
+            counts[operation.action] += 1
+        return counts
+
+    def summary(self) -> str:
+        """Returns a one line readable summary of the plan."""
+        return " - ".join(f"{action}: {count}" for action, count in self.counts().items())
+
+    def save(self, path: Optional[str] = None) -> str:
+        """
+        Write the plan as json.
+
+        @param path: (Optional[str]) defaults to the plan file of the agenda
+        @return: (str) the path of the written file
+        """
+        path = path or PLAN_PATH.format(self.agenda)
+        with open(path, "w", encoding="utf-8") as plan_file:
+            json.dump(
+                {
+                    "agenda": self.agenda,
+                    "paths": self.paths,
+                    "operations": [operation.to_dict() for operation in self.operations],
+                },
+                plan_file,
+                indent=1,
+            )
+        return path
+
+    @classmethod
+    def load(cls, agenda: Agenda, path: Optional[str] = None) -> SyncPlan:
+        """
+        Read the plan of an agenda.
+        Raise FileNotFoundError if there's no plan.
+        Raise ValueError if the plan was made for another agenda.
+
+        @param agenda: (Agenda) the agenda to sync
+        @param path: (Optional[str]) defaults to the plan file of the agenda
+        @return: (SyncPlan)
+        """
+        path = path or PLAN_PATH.format(agenda.longname)
+        with open(path, "r", encoding="utf-8") as plan_file:
+            content = json.load(plan_file)
+        if content["agenda"] != agenda.longname:
+            raise ValueError(f"{path} is a plan of the agenda {content['agenda']}")
+        return cls(
+            agenda=content["agenda"],
+            paths=content["paths"],
+            operations=list(map(Operation.from_dict, content["operations"])),
+        )
+
+    def mark_applied(self) -> str:
+        """
+        Rename the stored plan once it's applied, so it can't be applied
+        twice. The last applied plan is kept for review.
+
+        @return: (str) the new path of the plan
+        """
+        applied_path = APPLIED_PLAN_PATH.format(self.agenda)
+        os.replace(PLAN_PATH.format(self.agenda), applied_path)
+        return applied_path
+
+
+def parse_weeks(
+    agenda: Agenda,
+    path_list: list[str],
+    parse_cache: bool = False,
+) -> list[tuple[str, list[Event]]]:
+    """
+    Parse every week file.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param path_list: (list[str]) the week files
+    @param parse_cache: (bool) read the unchanged files from the parse cache
+    @return: (list[tuple[str, list[Event]]]) the events of every file
+    """
+    parse = parse_events_cached if parse_cache else parse_events
+    return [(path, parse(agenda, path)) for path in path_list]
+
+
+def snapshot_of(
+    agenda: Agenda,
+    service: Resource,
+    parsed_weeks: list[tuple[str, list[Event]]],
+    reconcile: bool = False,
+) -> EventIndex:
+    """
+    Read the remote events of the window of the parsed events, in one listing.
+    When reconciling, the window covers the whole weeks of the files.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param service: (Resource) the google api ressource
+    @param parsed_weeks: (list[tuple[str, list[Event]]]) returned by parse_weeks
+    @param reconcile: (bool) read the whole weeks
+    @return: (EventIndex) the remote events
+    """
+    event_list = [event for _, events in parsed_weeks for event in events]
+    if not reconcile:
+        return prefetch_events(agenda, service, event_list)
+    window = week_window(event_list)
+    if window is None:
+        return EventIndex()
+    timeMin, timeMax = window
+    return EventIndex(
+        retrieve_events(agenda, timeMin.isoformat(), timeMax.isoformat(), service)
+    )
+
+
+def plan_weeks(
+    agenda: Agenda,
+    parsed_weeks: list[tuple[str, list[Event]]],
+    snapshot: EventIndex,
+    reconcile: bool = False,
+    journaled_ids: Collection[str] = (),
+) -> SyncPlan:
+    """
+    Compare the parsed events with the snapshot of the calendar.
+    Pure local computation : nothing is sent to the API.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param parsed_weeks: (list[tuple[str, list[Event]]]) returned by parse_weeks
+    @param snapshot: (EventIndex) the remote events, prefetched or mirrored
+    @param reconcile: (bool) delete the remote events missing from the files
+    @param journaled_ids: (Collection[str]) Google ids recorded in the journal :
+        those events were written by this application and may be deleted
+    @return: (SyncPlan) an operation for every parsed event, and every deletion
+    """
+    plan = SyncPlan(agenda.longname, paths=[path for path, _ in parsed_weeks])
+    if reconcile:
+        is_owned = owned_by_application(agenda, journaled_ids)
+        claimed: set[str] = set()
+        for path, events in parsed_weeks:
+            plan.operations.extend(
+                reconcile_week(path, events, snapshot, is_owned, claimed)
+            )
+        return plan
+    for path, events in parsed_weeks:
+        for event_details, existing_event in snapshot.match(events):
+            plan.operations.append(
+                Operation(
+                    action_for(event_details, existing_event),
+                    event_details,
+                    existing_event,
+                    path,
+                )
+            )
+    return plan
+
+
+def owned_by_application(
+    agenda: Agenda,
+    journaled_ids: Collection[str] = (),
+) -> Callable[[Event], bool]:
+    """
+    Returns the test of the remote events written by this application : they
+    have the stable id of their slot, or their Google id is journaled.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param journaled_ids: (Collection[str]) Google ids recorded in the journal
+    @return: (Callable[[Event], bool])
+    """
+
+    def is_owned(event: Event) -> bool:
+        return event.id in journaled_ids or has_stable_id(agenda.longname, event)
+
+    return is_owned
+
+
+def reconcile_week(
+    path: str,
+    events: list[Event],
+    snapshot: EventIndex,
+    is_owned: Callable[[Event], bool],
+    claimed: Optional[set[str]] = None,
+) -> list[Operation]:
+    """
+    Compare the events of a week file with the remote events starting in the
+    week of its day headers.
+    Both sides are keyed by `Event.slot_key` : a parsed event updates the
+    remote event with the same key, a remote event without any parsed event
+    is deleted if this application wrote it, kept otherwise. A single pass
+    over both sides.
+    A multi day event ending in a later week doesn't extend the week : the
+    events of the later weeks belong to their own files.
+
+    @param path: (str) the week file
+    @param events: (list[Event]) the parsed events of the file
+    @param snapshot: (EventIndex) the remote events, covering the whole weeks
+    @param is_owned: (Callable[[Event], bool]) True for the remote events
+        which may be deleted, see `owned_by_application`
+    @param claimed: (Optional[set[str]]) ids of the remote events already
+        used by the operations of other files, updated with the ones used
+        here. A remote event is never updated by a file and deleted by
+        another.
+    @return: (list[Operation]) creations, updates, noops and deletions
+    """
+    window = week_window(events)
+    if window is None:
+        # an empty file doesn't tell which week it describes
+        return []
+    if claimed is None:
+        claimed = set()
+    remote_by_key: dict[tuple, list[Event]] = {}
+    for remote_event in snapshot.events():
+        if remote_event.id in claimed or not starts_between(remote_event, *window):
+            continue
+        claimed.add(remote_event.id)
+        remote_by_key.setdefault(remote_event.slot_key(), []).append(remote_event)
+
+    operations = []
+    for event_details in events:
+        candidates = remote_by_key.get(event_details.slot_key())
+        existing_event = candidates.pop(0) if candidates else None
+        operations.append(
+            Operation(
+                action_for(event_details, existing_event),
+                event_details,
+                existing_event,
+                path,
+            )
+        )
+    for orphans in remote_by_key.values():
+        for orphan in orphans:
+            if is_owned(orphan):
+                operations.append(Operation(DELETE, existing=orphan, path=path))
+            else:
+                logger.info(KEPT_EVENT_MSG.format(orphan.summary, orphan.id, path))
+    return operations
+
+
+def action_for(event_details: Event, existing_event: Optional[Event]) -> str:
+    """
+    Returns the action syncing a parsed event with its remote event.
+
+    @param event_details: (Event) the parsed event
+    @param existing_event: (Optional[Event]) the matching remote event
+    @return: (str) create, update or noop
+    """
+    if existing_event is None:
+        return CREATE
+    if existing_event.has_same_content(event_details):
+        return NOOP
+    return UPDATE
+
+
+def apply_plan(
+    agenda: Agenda,
+    service: Resource,
+    plan: SyncPlan,
+    report: Optional[SyncReport] = None,
+    journal: Optional[SyncJournal] = None,
+) -> SyncReport:
+    """
+    Send the writes of a plan in batches. Nothing is read from the API.
+    The remote events updated or deleted by the plan must be unchanged since
+    they were read, the others are reported as failed.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param service: (Resource) the google api ressource
+    @param plan: (SyncPlan) the operations to do
+    @param report: (Optional[SyncReport]) counters to update
+    @param journal: (Optional[SyncJournal]) the journal of the agenda, if any.
+        The written events are recorded, the deleted ones are forgotten.
+    @return: (SyncReport) what was created, updated, deleted or left unchanged
+    """
+    if report is None:
+        report = SyncReport()
+    on_written = on_deleted = None
+    if journal is not None:
+        path_of = {
+            id(operation.event): operation.path
+            for operation in plan.operations
+            if operation.event is not None
+        }
+
+        def on_written(event: Event, response: dict) -> None:
+            journal.record_response(event, path_of[id(event)], response)
+
+        def on_deleted(event: Event) -> None:
+            journal.forget(event.id)
+
+    batch = EventWriteBatch(
+        agenda,
+        service,
+        report,
+        on_written=on_written,
+        conditional=True,
+        on_deleted=on_deleted,
+    )
+    for operation in plan.operations:
+        if operation.action == CREATE:
+            batch.insert(operation.event)
+        elif operation.action == UPDATE:
+            batch.update(operation.event, operation.existing)
+        elif operation.action == DELETE:
+            batch.delete(operation.existing)
+        else:
+            report_unchanged(operation.event, report)
+            if journal is not None:
+                journal.record(operation.event, operation.path, operation.existing.id)
+    batch.flush()
+    if journal is not None:
+        journal.commit()
+    conflicts = sum(error_status(error) == 412 for _, error in batch.failures)
+    if conflicts:
+        conflicts_msg = CONFLICTS_MSG.format(conflicts)
+        print(color_text(conflicts_msg, "RED"))
+        logger.error(conflicts_msg)
+    return report
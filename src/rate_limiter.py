@@ -0,0 +1,318 @@
+"""
+title: rate limiter
+author: qkzk
+
+Every request sent to the Calendar API goes through the scheduler.
+
+* a token bucket limits the rate of requests,
+* a request costing more than the bucket, like a batch, takes its tokens
+    in chunks,
+* rate limited (403 rateLimitExceeded, 429) and server errors (5xx) are
+    retried after an exponential backoff with jitter. A server error may
+    come after the request was processed : only idempotent requests are
+    retried, never the creation of an event without a client supplied id,
+* the number of requests in flight and the rate adapt themselves : they
+    grow slowly while the API answers quickly and are halved when the API
+    throttles us or slows down. The latency of a batch is divided by its
+    number of requests.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, TypeVar
+
+import json
+import random
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from .logger import logger
+
+T = TypeVar("T")
+
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+
+def error_reason(content: bytes) -> str:
+    """
+    Returns the reason given by the API for an error, or "" if there's none.
+
+    @param content: (bytes) the body of the error response
+    @return: (str) like "rateLimitExceeded"
+    """
+    try:
+        return json.loads(content.decode("utf-8"))["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+
+def is_retryable_response(status: int, content: bytes) -> bool:
+    """
+    True if a request answered with this status and content may succeed if
+    we retry it later : rate limits, too many requests and server errors.
+
+    @param status: (int) http status of the response
+    @param content: (bytes) body of the response
+    @return: (bool)
+    """
+    if status == 429 or status >= 500:
+        return True
+    return status == 403 and error_reason(content) in RATE_LIMIT_REASONS
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True if the request may succeed if we retry it later.
+
+    @param error: (Exception) an error raised while executing a request
+    @return: (bool)
+    """
+    if not isinstance(error, HttpError):
+        return False
+    return is_retryable_response(error.resp.status, error.content)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """
+    Returns the http status of an API error, None for other errors.
+
+    @param error: (Exception) an error raised while executing a request
+    @return: (Optional[int])
+    """
+    if not isinstance(error, HttpError):
+        return None
+    return error.resp.status
+
+
+def is_idempotent(request: HttpRequest) -> bool:
+    """
+    True if sending the request twice has the same effect as sending it once.
+    Every request is, except the creation of an event without any id : the
+    API would create it twice.
+
+    @param request: (HttpRequest) a request built by the service
+    @return: (bool)
+    """
+    if request.method != "POST":
+        return True
+    try:
+        return bool(json.loads(request.body or "{}").get("id"))
+    except (ValueError, AttributeError):
+        return False
+
+
+def may_retry(error: Exception, idempotent: bool = True) -> bool:
+    """
+    True if a request which failed with this error should be sent again.
+    Throttled requests weren't processed and are always retried, other
+    retryable errors only for idempotent requests.
+
+    @param error: (Exception) an error raised while executing a request
+    @param idempotent: (bool) the request can safely be sent twice
+    @return: (bool)
+    """
+    return is_throttling(error) or (idempotent and is_retryable(error))
+
+
+def is_throttling(error: Exception) -> bool:
+    """
+    True if the API asked us to slow down.
+
+    @param error: (Exception) an error raised while executing a request
+    @return: (bool)
+    """
+    return is_retryable(error) and error.resp.status in (403, 429)
+
+
+class RequestScheduler:
+    """
+    Token bucket, backoff and adaptive concurrency for the API requests.
+
+    @param rate: (float) initial number of requests per second
+    @param max_rate: (float) the rate never grows above this value
+    @param burst: (int) capacity of the bucket
+    @param concurrency: (int) initial number of requests in flight
+    @param max_concurrency: (int) the concurrency never grows above
+    @param max_retries: (int) attempts before giving up a request
+    @param base_delay: (float) first backoff, in seconds
+    @param max_delay: (float) longest backoff, in seconds
+    @param target_latency: (float) above this latency, in seconds, we slow down
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        max_rate: float = 10.0,
+        burst: int = 10,
+        concurrency: int = 4,
+        max_concurrency: int = 16,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 64.0,
+        target_latency: float = 2.0,
+    ):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def execute(self, request: HttpRequest, cost: int = 1) -> Any:
+        """
+        Execute a request of the client, with retries.
+
+        @param request: (HttpRequest) a request built by the service
+        @param cost: (int) number of API calls of the request
+        @return: (Any) the response of the API
+        """
+        return self.run(request.execute, cost, idempotent=is_idempotent(request))
+
+    def run(
+        self,
+        call: Callable[[], T],
+        cost: int = 1,
+        idempotent: bool = True,
+    ) -> T:
+        """
+        Call a function sending requests to the API, with retries.
+        The last error is raised if every attempt failed.
+
+        @param call: (Callable[[], T]) the function to call
+        @param cost: (int) number of API calls made by the function
+        @param idempotent: (bool) the function can safely be called again
+            after a server error. Otherwise, only throttled calls are retried.
+        @return: (T) what the function returned
+        """
+        attempt = 0
+        while True:
+            self._acquire(cost)
+            start = time.monotonic()
+            try:
+                result = call()
+            except Exception as error:
+                self._release()
+                if not may_retry(error, idempotent) or attempt >= self.max_retries:
+                    raise
+                if is_throttling(error):
+                    self.throttled(error)
+                else:
+                    logger.warning(f"Calendar API error, retrying: {error}")
+                self.backoff(attempt)
+                attempt += 1
+                continue
+            self._release()
+            self.succeeded(time.monotonic() - start, cost)
+            return result
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """
+        Allow `concurrency` requests in flight from now on, for a client
+        sending that many requests at once.
+        The concurrency still decreases when the API throttles us or slows
+        down, and the token bucket still limits the rate.
+
+        @param concurrency: (int) the new initial and maximum concurrency
+        """
+        with self._condition:
+            self.max_concurrency = concurrency
+            self.concurrency = float(concurrency)
+            self._condition.notify_all()
+
+    def backoff(self, attempt: int) -> None:
+        """
+        Sleep before a new attempt.
+
+        @param attempt: (int) number of failed attempts, starting at 0
+        """
+        time.sleep(self.backoff_delay(attempt))
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Exponential delay with jitter, in seconds.
+
+        @param attempt: (int) number of failed attempts, starting at 0
+        @return: (float) between half and the whole exponential delay
+        """
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+    def succeeded(self, latency: float, cost: int = 1) -> None:
+        """
+        Additive increase of the rate and concurrency while the API is quick.
+        Multiplicative decrease if it slows down.
+
+        @param latency: (float) duration of the request, in seconds
+        @param cost: (int) number of API calls of the request : a batch is
+            compared by its latency per call
+        """
+        with self._condition:
+            if latency / max(1, cost) > self.target_latency:
+                self._decrease()
+            else:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+                self.concurrency = min(
+                    self.max_concurrency, self.concurrency + 1 / self.concurrency
+                )
+            self._condition.notify_all()
+
+    def throttled(self, error: Optional[Exception] = None) -> None:
+        """
+        Multiplicative decrease after a rate limit.
+
+        @param error: (Optional[Exception]) the error received
+        """
+        with self._condition:
+            self._decrease()
+        logger.warning(
+            f"Calendar API throttled ({error}), rate: {self.rate:.2f}/s, concurrency: {int(self.concurrency)}"
+        )
+
+    def _decrease(self) -> None:
+        self.rate = max(0.5, self.rate / 2)
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+    def _acquire(self, cost: int) -> None:
+        """
+        Wait for a free slot, then for `cost` tokens.
+        A cost larger than the bucket is taken in chunks of at most a full
+        bucket, as the bucket refills.
+        """
+        with self._condition:
+            while self._in_flight >= int(self.concurrency):
+                self._condition.wait()
+            self._in_flight += 1
+            remaining = cost
+            while remaining > 0:
+                self._refill()
+                chunk = min(remaining, self.burst)
+                if self._tokens >= chunk:
+                    self._tokens -= chunk
+                    remaining -= chunk
+                    continue
+                missing = chunk - self._tokens
+                self._condition.wait(timeout=max(0.01, missing / self.rate))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def _release(self) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+
+scheduler = RequestScheduler()
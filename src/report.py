@@ -0,0 +1,44 @@
+"""
+title: report
+author: qkzk
+
+Count what a sync did to the calendar.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+
+
+@dataclass
+class SyncReport:
+    """
+    Counters of a sync run :
+    * created : events inserted in the calendar
+    * updated : existing events whose content changed
+    * unchanged : existing events left untouched, nothing changed
+    * deleted : events removed from the calendar
+    * failed : writes refused by the API
+    """
+
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    failed: int = 0
+
+    def __add__(self, other: SyncReport) -> SyncReport:
+        return SyncReport(
+            created=self.created + other.created,
+            updated=self.updated + other.updated,
+            unchanged=self.unchanged + other.unchanged,
+            deleted=self.deleted + other.deleted,
+            failed=self.failed + other.failed,
+        )
+
+    def summary(self) -> str:
+        """Returns a one line readable summary of the counters."""
+        summary = f"created: {self.created} - updated: {self.updated} - unchanged: {self.unchanged}"
+        if self.deleted:
+            summary += f" - deleted: {self.deleted}"
+        if self.failed:
+            summary += f" - failed: {self.failed}"
+        return summary
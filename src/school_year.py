@@ -0,0 +1,89 @@
+"""
+title: school year
+author: qkzk
+
+The dates of a school year, from august to july.
+
+The week files give dates without year, like "Lundi 04 septembre". The year
+is the one of the school year which is synced : 2023 from august to december
+and 2024 from january to july for the school year 2023. Every date of the
+school year is computed once, reading a date is a dict lookup and doesn't
+depend on the day the sync runs.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+import datetime
+
+from .config import CURRENT_YEAR
+
+MONTH_NUMBERS = {
+    "janvier": 1,
+    "février": 2,
+    "mars": 3,
+    "avril": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "août": 8,
+    "septembre": 9,
+    "octobre": 10,
+    "novembre": 11,
+    "décembre": 12,
+}
+
+# the months before it belong to the second civil year
+SCHOOL_YEAR_START_MONTH = 8
+
+
+class SchoolYear:
+    """
+    Every date of a school year, by day number and french month name.
+
+    @param year: (int) the school year, 2023 for 2023-2024
+    """
+
+    def __init__(self, year: int = CURRENT_YEAR):
+        self.year = year
+        self.days: list[datetime.date] = []
+        self._dates: dict[tuple[int, str], datetime.datetime] = {}
+        month_names = {number: name for name, number in MONTH_NUMBERS.items()}
+        day = datetime.date(year, SCHOOL_YEAR_START_MONTH, 1)
+        end = datetime.date(year + 1, SCHOOL_YEAR_START_MONTH, 1)
+        while day < end:
+            self.days.append(day)
+            self._dates[(day.day, month_names[day.month])] = datetime.datetime(
+                day.year, day.month, day.day
+            )
+            day += datetime.timedelta(days=1)
+
+    def date_of(self, day: int, month_name: str) -> datetime.datetime:
+        """
+        Returns the date of a day of the school year.
+        Raise ValueError if the month is unknown or the day doesn't exist.
+
+        @param day: (int) day of the month
+        @param month_name: (str) french month name, like "septembre"
+        @return: (datetime.datetime obj) a datetime at midnight (ie a date)
+        """
+        date = self._dates.get((day, month_name.lower()))
+        if date is None:
+            if month_name.lower() not in MONTH_NUMBERS:
+                raise ValueError(f"Unknown month {month_name!r}")
+            raise ValueError(f"{day} {month_name} isn't a day of {self}")
+        return date
+
+    def __str__(self) -> str:
+        return f"the school year {self.year}-{self.year + 1}"
+
+
+@lru_cache(maxsize=None)
+def school_year(year: int = CURRENT_YEAR) -> SchoolYear:
+    """
+    Returns the dates of a school year, computed on first use.
+
+    @param year: (int) the school year, 2023 for 2023-2024
+    @return: (SchoolYear)
+    """
+    return SchoolYear(year)
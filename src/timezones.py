@@ -0,0 +1,107 @@
+"""
+title: timezones
+author: qkzk
+
+UTC offsets of the event timestamps, read from zoneinfo.
+
+The offsets of a timezone are computed once for the whole school year, in a
+single pass : one offset per day, formatted like "+02:00". A day where the
+offset changes (a DST transition) and a day outside the school year are
+computed exactly for the given time.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Optional
+
+import datetime
+import zoneinfo
+
+from .config import CURRENT_YEAR
+from .school_year import school_year
+
+
+def format_offset(offset: Optional[datetime.timedelta]) -> str:
+    """
+    Format an UTC offset for the API.
+
+    @param offset: (Optional[datetime.timedelta]) None is read as UTC
+    @return: (str) like "+02:00" or "-03:30"
+    """
+    if offset is None:
+        return "+00:00"
+    minutes = int(offset.total_seconds()) // 60
+    sign = "-" if minutes < 0 else "+"
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+class OffsetTable:
+    """
+    The formatted UTC offsets of a timezone for every day of a school year.
+
+    @param timezone: (str) an IANA timezone like "Europe/Paris"
+    @param year: (int) the school year, 2023 for 2023-2024
+    """
+
+    def __init__(self, timezone: str, year: int = CURRENT_YEAR):
+        self.timezone = timezone
+        self.zone = zoneinfo.ZoneInfo(timezone)
+        self._offsets: dict[datetime.date, Optional[str]] = {}
+        days = school_year(year).days
+        midnights = [
+            self.exact_offset(datetime.datetime(day.year, day.month, day.day))
+            for day in days + [days[-1] + datetime.timedelta(days=1)]
+        ]
+        for day, offset, next_offset in zip(days, midnights, midnights[1:]):
+            # None : the offset changes during the day
+            self._offsets[day] = offset if offset == next_offset else None
+
+    def exact_offset(self, time_of_event: datetime.datetime) -> str:
+        """
+        Returns the offset of a naive local time, computed by zoneinfo.
+
+        @param time_of_event: (datetime.datetime) naive local time
+        @return: (str) like "+02:00"
+        """
+        return format_offset(time_of_event.replace(tzinfo=self.zone).utcoffset())
+
+    def offset(self, time_of_event: datetime.datetime) -> str:
+        """
+        Returns the offset of a naive local time, from the table if possible.
+
+        @param time_of_event: (datetime.datetime) naive local time
+        @return: (str) like "+02:00"
+        """
+        offset = self._offsets.get(time_of_event.date())
+        if offset is None:
+            return self.exact_offset(time_of_event)
+        return offset
+
+    def format(self, time_of_event: datetime.datetime) -> str:
+        """
+        Format a naive local time for the API, seconds are dropped.
+
+        datetime.datetime(2019, 8, 9, 15, 0) -----> '2019-08-09T15:00:00+02:00'
+
+        @param time_of_event: (datetime.datetime) naive local time
+        @return: (str)
+        """
+        return (
+            f"{time_of_event.year:04d}-{time_of_event.month:02d}-"
+            f"{time_of_event.day:02d}T{time_of_event.hour:02d}:"
+            f"{time_of_event.minute:02d}:00{self.offset(time_of_event)}"
+        )
+
+
+@lru_cache(maxsize=None)
+def offset_table(timezone: str, year: int = CURRENT_YEAR) -> OffsetTable:
+    """
+    Returns the offset table of a timezone for a school year, built on first
+    use.
+
+    @param timezone: (str) an IANA timezone like "Europe/Paris"
+    @param year: (int) the school year, 2023 for 2023-2024
+    @return: (OffsetTable)
+    """
+    return OffsetTable(timezone, year)
@@ -64,14 +64,15 @@ PERIOD_LIST = range(1, 6)
 # DEFAULT_PATH_MD = PERIOD_PATH + "semaine_{}.md"
 
 
-def build_period_path(agenda_path: str) -> str:
+def build_period_path(agenda_path: str, year: int = CURRENT_YEAR) -> str:
     """
     Returns the formatable root path where 'periode' are stored.
 
     @param agenda_path: (str) where are files stored.
+    @param year: (int) the school year
     @return: (str) formatable period path.
     """
-    return f"{agenda_path}{CURRENT_YEAR}/" + "periode_{}/"
+    return f"{agenda_path}{year}/" + "periode_{}/"
 
 
 def build_default_path_md(period_path: str) -> str:
@@ -125,12 +126,14 @@ def get_md_path_from_args_or_user(
     root_path: str,
     arguments: argparse.Namespace,
     reset_path=False,
+    year: int = CURRENT_YEAR,
 ) -> tuple[Union[str, Any], list[Union[int, Any]]]:
     """
     Create the path from the args and ask the user what he wants to do.
 
     @param root_path: (str) formatable path where periods are stored.
     @param reset_path: (bool) do we have to reset the path ?
+    @param year: (int) the school year
     @return: tuple[Union(str, Any), list[Union[int, Any]]] a pair with period number (1-5) and corresponding weeks
     """
     print(color_text(WARNING_MSG, "DARKCYAN"))
@@ -139,7 +142,7 @@ def get_md_path_from_args_or_user(
         # no parameters were given by the user
         mode = "Interactive"
         period_number = ask_user_period()
-        period_path = build_period_path(root_path).format(period_number)
+        period_path = build_period_path(root_path, year).format(period_number)
         week_list = ask_user_week(period_path)
 
     elif len(sys.argv) < 2:
@@ -260,27 +263,65 @@ def warn_and_get_path(arguments: argparse.Namespace, agenda: Agenda) -> list[str
     ):
         print("Interactive mode")
         path_list = interactive_mode(
-            agenda.git_repo_path, path_list, reset_path, input_warning, arguments
+            agenda.git_repo_path,
+            path_list,
+            reset_path,
+            input_warning,
+            arguments,
+            agenda.year,
         )
     else:
-        period_path = build_period_path(agenda.git_repo_path)
+        period_path = build_period_path(agenda.git_repo_path, agenda.year)
         default_path_md = build_default_path_md(period_path)
         path_list = convert_numbers_to_path(
             default_path_md, arguments.period_number, arguments.week_numbers, arguments
         )
         if not arguments.yes:
             path_list = interactive_mode(
-                agenda.git_repo_path, path_list, reset_path, input_warning, arguments
+                agenda.git_repo_path,
+                path_list,
+                reset_path,
+                input_warning,
+                arguments,
+                agenda.year,
             )
     return path_list
 
 
+def warn_and_get_paths(
+    arguments: argparse.Namespace, agendas: list[Agenda]
+) -> list[list[str]]:
+    """
+    Warn the user once and return the paths of every agenda.
+    The user chooses the period and weeks for the first agenda, the other
+    agendas get the same weeks in their own folders, without being asked again.
+
+    @param arguments: (argparse.Namespace) provided args
+    @param agendas: (list[Agenda]) the selected agendas, at least one
+    @return: (list[list[str]]) the paths to the md files of every agenda
+    """
+    first_path_list = warn_and_get_path(arguments, agendas[0])
+    period_number = first_path_list[0].rstrip("/").split("/")[-2].split("_")[1]
+    week_list = [
+        extract_number_from_path(path.split("/")[-1]) for path in first_path_list
+    ]
+    path_lists = [first_path_list]
+    for agenda in agendas[1:]:
+        period_path = build_period_path(agenda.git_repo_path, agenda.year)
+        default_path_md = build_default_path_md(period_path)
+        path_lists.append(
+            [default_path_md.format(period_number, week) for week in week_list]
+        )
+    return path_lists
+
+
 def interactive_mode(
     root_path: str,
     path_list: list[str],
     reset_path: bool,
     input_warning: str,
     arguments: argparse.Namespace,
+    year: int = CURRENT_YEAR,
 ) -> list[str]:
     """
     Used when no path could be read from arguments.
@@ -289,13 +330,14 @@ def interactive_mode(
     @param path_list: (list[str]) provided path list. Could be empty.
     @param reset_path: (bool) should we reset this path ?
     @param arguments: (argparse.Namespace) provided args
+    @param year: (int) the school year
     @return: (list[str]) the paths
     """
     while user_provides_invalid_input(path_list, input_warning):
         period_number, week_list = get_md_path_from_args_or_user(
-            root_path, arguments, reset_path=reset_path
+            root_path, arguments, reset_path=reset_path, year=year
         )
-        period_path = build_period_path(root_path)
+        period_path = build_period_path(root_path, year)
         default_path_md = build_default_path_md(period_path)
         path_list = convert_numbers_to_path(
             default_path_md, period_number, week_list, arguments
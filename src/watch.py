@@ -0,0 +1,426 @@
+"""
+title: watch
+author: qkzk
+
+Keep one process running and sync the week files as soon as they're saved.
+
+* the period folders `<git_repo_path>/<year>/periode_*/` of the school year
+    of every agenda are watched with inotify, or polled if inotify isn't available,
+* the year folder is watched too : a period folder created while watching
+    is watched as soon as it appears,
+* folders are compared by their real path, an agenda sharing its folders
+    with another one is synced too,
+* the bursts of events produced by a single save are debounced,
+* a file is synced only if its content changed, with the service built once.
+"""
+from __future__ import annotations
+
+from glob import glob
+from hashlib import sha1
+from typing import Optional, Union
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import time
+
+from googleapiclient.discovery import Resource
+
+from .colors import color_text
+from .config import Agenda
+from .google_interaction import build_service, sync_event_from_md
+from .journal import SyncJournal
+from .logger import logger
+from .report import SyncReport
+
+WEEK_FILE_PATTERN = "semaine_*.md"
+PERIOD_FOLDER_PATTERN = "periode_*"
+DEBOUNCE_DELAY = 0.5
+POLL_INTERVAL = 1.0
+
+WATCHING_MSG = "Watching {} - press Ctrl+C to stop"
+WATCH_SYNCED_MSG = "{} - {}"
+WATCH_FAILED_MSG = "{} - FAILED : {}"
+WATCH_STOPPED_MSG = "Watch stopped"
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def is_week_file(path: str) -> bool:
+    """True if the path is a week file, like ".../semaine_36.md"."""
+    return fnmatch.fnmatch(os.path.basename(path), WEEK_FILE_PATTERN)
+
+
+def is_period_folder(path: str) -> bool:
+    """True if the path is a period folder, like ".../periode_1"."""
+    return fnmatch.fnmatch(os.path.basename(path.rstrip("/")), PERIOD_FOLDER_PATTERN)
+
+
+def year_directory(agenda: Agenda) -> str:
+    """
+    Returns the folder of the school year of an agenda.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (str) like ".../2023/"
+    """
+    return f"{agenda.git_repo_path}{agenda.year}/"
+
+
+def watched_directories(agenda: Agenda) -> list[str]:
+    """
+    Returns the period folders of the school year of an agenda.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @return: (list[str]) like [".../2023/periode_1/", ...]
+    """
+    return sorted(glob(f"{year_directory(agenda)}{PERIOD_FOLDER_PATTERN}/"))
+
+
+class AgendaDirectories:
+    """
+    The agendas of the watched folders, by real path : several agendas may
+    share a folder, and a folder may be reached through a symbolic link.
+
+    @param agendas: (list[Agenda]) the watched agendas
+    """
+
+    def __init__(self, agendas: list[Agenda]):
+        self._periods: dict[str, list[Agenda]] = {}
+        self._years: dict[str, list[Agenda]] = {}
+        for agenda in agendas:
+            if os.path.isdir(year_directory(agenda)):
+                self._years.setdefault(
+                    os.path.realpath(year_directory(agenda)), []
+                ).append(agenda)
+            for directory in watched_directories(agenda):
+                self._periods.setdefault(os.path.realpath(directory), []).append(
+                    agenda
+                )
+
+    @property
+    def directories(self) -> list[str]:
+        """The period folders known at start."""
+        return list(self._periods)
+
+    @property
+    def roots(self) -> list[str]:
+        """The year folders, where new period folders may appear."""
+        return list(self._years)
+
+    def agendas_of(self, path: str) -> list[Agenda]:
+        """
+        Returns the agendas of a week file, empty if it isn't in a watched
+        folder. A period folder created while watching belongs to the
+        agendas of its year folder.
+
+        @param path: (str) a week file
+        @return: (list[Agenda])
+        """
+        directory = os.path.realpath(os.path.dirname(path))
+        if directory in self._periods:
+            return self._periods[directory]
+        if is_period_folder(directory):
+            return self._years.get(os.path.dirname(directory), [])
+        return []
+
+
+def file_hash(path: str) -> Optional[str]:
+    """
+    Returns a hash of the content of a file, None if it can't be read.
+
+    @param path: (str)
+    @return: (Optional[str]) hexadecimal digest
+    """
+    try:
+        with open(path, "rb") as week_file:
+            return sha1(week_file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class InotifyWatcher:
+    """
+    Report the week files written or moved into the watched folders.
+    The period folders created in a root folder are watched too.
+    Raise OSError if inotify isn't available.
+
+    @param directories: (list[str]) the watched folders
+    @param roots: (list[str]) folders where new period folders may appear
+    """
+
+    def __init__(self, directories: list[str], roots: list[str] = ()):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: dict[int, str] = {}
+        self._roots: set[int] = set()
+        try:
+            for directory in directories:
+                self._add_watch(directory)
+            for root in roots:
+                self._roots.add(self._add_watch(root))
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, directory: str) -> int:
+        """Watch a folder and returns its watch descriptor."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"can't watch {directory}")
+        self._directories[wd] = directory
+        return wd
+
+    def wait(self, timeout: Optional[float] = None) -> set[str]:
+        """
+        Wait for changes.
+
+        @param timeout: (Optional[float]) in seconds, None to wait forever
+        @return: (set[str]) the changed week files, empty after a timeout
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        buffer = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+            path = os.path.join(self._directories.get(wd, ""), name)
+            if wd in self._roots:
+                if mask & IN_ISDIR and is_period_folder(path):
+                    changed |= self._watch_new_folder(path)
+            elif is_week_file(path):
+                changed.add(path)
+        return changed
+
+    def _watch_new_folder(self, directory: str) -> set[str]:
+        """
+        Watch a new period folder. Returns the week files already written in
+        it : they may have been written before the folder was watched.
+        """
+        try:
+            self._add_watch(directory)
+        except OSError as error:
+            logger.warning(f"{error}, its week files won't be synced")
+            return set()
+        return set(glob(os.path.join(directory, WEEK_FILE_PATTERN)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Report the week files whose modification time changed, by scanning the
+    watched folders periodically. The period folders created in a root folder
+    are scanned too.
+
+    @param directories: (list[str]) the watched folders
+    @param roots: (list[str]) folders where new period folders may appear
+    @param interval: (float) seconds between two scans
+    """
+
+    def __init__(
+        self,
+        directories: list[str],
+        roots: list[str] = (),
+        interval: float = POLL_INTERVAL,
+    ):
+        self.directories = directories
+        self.roots = roots
+        self.interval = interval
+        self._mtimes = self._scan()
+
+    def _scan(self) -> dict[str, float]:
+        mtimes = {}
+        directories = set(self.directories)
+        for root in self.roots:
+            directories.update(glob(os.path.join(root, PERIOD_FOLDER_PATTERN)))
+        for directory in directories:
+            for path in glob(os.path.join(directory, WEEK_FILE_PATTERN)):
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except OSError:
+                    continue
+        return mtimes
+
+    def wait(self, timeout: Optional[float] = None) -> set[str]:
+        """
+        Wait for changes.
+
+        @param timeout: (Optional[float]) in seconds, None to wait forever
+        @return: (set[str]) the changed week files, empty after a timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+            mtimes = self._scan()
+            changed = {
+                path for path, mtime in mtimes.items() if self._mtimes.get(path) != mtime
+            }
+            self._mtimes = mtimes
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(
+    directories: list[str],
+    roots: list[str] = (),
+) -> Union[InotifyWatcher, PollingWatcher]:
+    """
+    Returns an inotify watcher, or a polling one if inotify isn't available.
+
+    @param directories: (list[str]) the watched folders
+    @param roots: (list[str]) folders where new period folders may appear
+    @return: (Union[InotifyWatcher, PollingWatcher])
+    """
+    try:
+        return InotifyWatcher(directories, roots)
+    except (OSError, AttributeError) as error:
+        logger.warning(f"inotify unavailable ({error}), polling the week files")
+        return PollingWatcher(directories, roots)
+
+
+def debounced_changes(
+    watcher: Union[InotifyWatcher, PollingWatcher],
+    delay: float = DEBOUNCE_DELAY,
+) -> set[str]:
+    """
+    Wait for a change, then collect the following ones until nothing changed
+    for `delay` seconds.
+
+    @param watcher: (Union[InotifyWatcher, PollingWatcher])
+    @param delay: (float) seconds without change ending a burst
+    @return: (set[str]) the changed week files
+    """
+    changed = watcher.wait()
+    while True:
+        more = watcher.wait(delay)
+        if not more:
+            return changed
+        changed |= more
+
+
+def watch_agendas(agendas: list[Agenda], arguments: argparse.Namespace) -> SyncReport:
+    """
+    Sync the week files of the agendas every time they change, until the user
+    stops with Ctrl+C.
+
+    @param agendas: (list[Agenda]) the watched agendas
+    @param arguments: (argparse.Namespace) provided args
+    @return: (SyncReport) everything done while watching
+    """
+    folders = AgendaDirectories(agendas)
+    services: dict[str, Resource] = {
+        agenda.longname: build_service(agenda) for agenda in agendas
+    }
+    journals: dict[str, SyncJournal] = {}
+    if arguments.journal:
+        journals = {agenda.longname: SyncJournal(agenda) for agenda in agendas}
+    hashes = {
+        os.path.realpath(path): file_hash(path)
+        for directory in folders.directories
+        for path in glob(os.path.join(directory, WEEK_FILE_PATTERN))
+    }
+
+    report = SyncReport()
+    watcher = make_watcher(folders.directories, folders.roots)
+    watching_msg = WATCHING_MSG.format(", ".join(folders.directories + folders.roots))
+    print(color_text(watching_msg, "DARKCYAN"))
+    logger.warning(watching_msg)
+    try:
+        while True:
+            for path in sorted(debounced_changes(watcher)):
+                real_path = os.path.realpath(path)
+                content_hash = file_hash(path)
+                if content_hash is None or content_hash == hashes.get(real_path):
+                    continue
+                synced = True
+                for agenda in folders.agendas_of(path):
+                    file_report = sync_changed_file(
+                        agenda,
+                        services[agenda.longname],
+                        path,
+                        arguments,
+                        journals.get(agenda.longname),
+                    )
+                    if file_report is None:
+                        synced = False
+                    else:
+                        report += file_report
+                        # a failed write is retried on the next save
+                        synced = synced and not file_report.failed
+                if synced:
+                    hashes[real_path] = content_hash
+    except KeyboardInterrupt:
+        print(color_text(WATCH_STOPPED_MSG, "DARKCYAN"))
+    finally:
+        watcher.close()
+        for journal in journals.values():
+            journal.close()
+    return report
+
+
+def sync_changed_file(
+    agenda: Agenda,
+    service: Resource,
+    path: str,
+    arguments: argparse.Namespace,
+    journal: Optional[SyncJournal] = None,
+) -> Optional[SyncReport]:
+    """
+    Sync a changed week file. A file saved while being edited may be
+    malformed : the error is reported and the watch goes on.
+
+    @param agenda: (Agenda) holds info about the agenda
+    @param service: (Resource) the google api ressource
+    @param path: (str) the week file
+    @param arguments: (argparse.Namespace) provided args
+    @param journal: (Optional[SyncJournal]) the journal of the agenda, if any
+    @return: (Optional[SyncReport]) what was done for this file, None if
+        the sync failed
+    """
+    try:
+        report = sync_event_from_md(
+            agenda,
+            service,
+            path,
+            prefetch=arguments.prefetch,
+            upsert=arguments.upsert,
+            journal=journal,
+            parse_cache=arguments.parse_cache,
+        )
+    except Exception as error:
+        failed_msg = WATCH_FAILED_MSG.format(path, error)
+        print(color_text(failed_msg, "RED"))
+        logger.error(failed_msg)
+        return None
+    synced_msg = WATCH_SYNCED_MSG.format(path, report.summary())
+    print(color_text(synced_msg, "DARKCYAN"))
+    logger.warning(synced_msg)
+    return report
@@ -0,0 +1,17 @@
+"""
+Tests run in a temporary working directory : the modules read `config.yml`,
+write their logs to `log/` and their files to `tokens/` and `cache/`, all
+relative to the current directory.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="calpy-tests-")
+shutil.copy(os.path.join(ROOT, "config.yml"), WORKDIR)
+os.makedirs(os.path.join(WORKDIR, "log"))
+os.chdir(WORKDIR)
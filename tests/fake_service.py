@@ -0,0 +1,205 @@
+"""
+An in memory stand-in of the Calendar API service : events().list, insert,
+update, delete and batch requests, answering 404, 409 and 412 like the API.
+Listings are paginated and projected on the asked fields. Their last page
+gives a sync token : a listing with it returns the events changed since, the
+deleted ones as cancelled.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import copy
+import datetime
+import itertools
+import json
+
+from googleapiclient.errors import HttpError
+
+
+class Response(dict):
+    """The http response attached to an HttpError."""
+
+    def __init__(self, status: int):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = ""
+
+
+def http_error(status: int, reason: str) -> HttpError:
+    content = json.dumps({"error": {"errors": [{"reason": reason}]}})
+    return HttpError(Response(status), content.encode("utf-8"))
+
+
+def as_datetime(time_dict: dict) -> datetime.datetime:
+    if "dateTime" in time_dict:
+        return datetime.datetime.fromisoformat(
+            time_dict["dateTime"].replace("Z", "+00:00")
+        )
+    return datetime.datetime.combine(
+        datetime.date.fromisoformat(time_dict["date"]),
+        datetime.time(),
+        datetime.timezone.utc,
+    )
+
+
+def project(item: dict, fields: Optional[str]) -> dict:
+    """Keep the fields of an item asked by a projection like "items(id,summary)"."""
+    item = copy.deepcopy(item)
+    if fields is None or "items(" not in fields:
+        return item
+    kept = fields.split("items(", 1)[1].split(")", 1)[0].split(",")
+    return {key: value for key, value in item.items() if key in kept}
+
+
+class Request:
+    def __init__(self, service: FakeService, kind: str, call, method="GET", body=None):
+        self.service = service
+        self.kind = kind
+        self.method = method
+        self.body = json.dumps(body) if body is not None else None
+        self.headers: dict[str, str] = {}
+        self._call = call
+
+    def call(self):
+        self.service.raise_planned_error(self.kind)
+        return self._call(self)
+
+    def execute(self, *args, **kwargs):
+        self.service.calls.append(self.kind)
+        return self.call()
+
+
+class Batch:
+    def __init__(self, service: FakeService, callback):
+        self.service = service
+        self.callback = callback
+        self.requests: list[tuple[str, Request]] = []
+
+    def add(self, request: Request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self, *args, **kwargs):
+        self.service.calls.append("batch")
+        self.service.raise_planned_error("batch")
+        for request_id, request in self.requests:
+            try:
+                response, error = request.call(), None
+            except HttpError as exception:
+                response, error = None, exception
+            self.callback(request_id, response, error)
+
+
+class Events:
+    def __init__(self, service: FakeService):
+        self.service = service
+
+    def list(
+        self,
+        calendarId,
+        timeMin=None,
+        timeMax=None,
+        pageToken=None,
+        syncToken=None,
+        maxResults=250,
+        fields=None,
+        **kwargs,
+    ):
+        def call(request):
+            if syncToken is not None:
+                changes = self.service.changes[int(syncToken) :]
+                items = list({item["id"]: item for item in changes}.values())
+            else:
+                items = list(self.service.store.values())
+            if timeMin is not None:
+                low = as_datetime({"dateTime": timeMin})
+                high = as_datetime({"dateTime": timeMax})
+                items = [
+                    item
+                    for item in items
+                    if as_datetime(item["start"]) < high
+                    and as_datetime(item["end"]) > low
+                ]
+            if syncToken is None:
+                items.sort(key=lambda item: as_datetime(item["start"]))
+            offset = int(pageToken or 0)
+            page = {
+                "items": [
+                    project(item, fields)
+                    for item in items[offset : offset + maxResults]
+                ]
+            }
+            if offset + maxResults < len(items):
+                page["nextPageToken"] = str(offset + maxResults)
+            else:
+                page["nextSyncToken"] = self.service.sync_token()
+            return page
+
+        return Request(self.service, "list", call)
+
+    def insert(self, calendarId, body, **kwargs):
+        def call(request):
+            event = copy.deepcopy(body)
+            if event.get("id") in self.service.store:
+                raise http_error(409, "duplicate")
+            event["id"] = event.get("id") or f"google{next(self.service.ids)}"
+            return self.service.save(event)
+
+        return Request(self.service, "insert", call, "POST", body)
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def call(request):
+            self.service.check(eventId, request)
+            return self.service.save(dict(copy.deepcopy(body), id=eventId))
+
+        return Request(self.service, "update", call, "PUT", body)
+
+    def delete(self, calendarId, eventId, **kwargs):
+        def call(request):
+            self.service.check(eventId, request)
+            del self.service.store[eventId]
+            self.service.changes.append({"id": eventId, "status": "cancelled"})
+            return ""
+
+        return Request(self.service, "delete", call, "DELETE")
+
+
+class FakeService:
+    def __init__(self):
+        self.store: dict[str, dict] = {}
+        self.calls: list[str] = []
+        self.ids = itertools.count()
+        self.versions = itertools.count(1)
+        # http statuses to answer to the next requests of a kind
+        self.errors: dict[str, list[int]] = {}
+        # every written or deleted event, the sync token is a position
+        self.changes: list[dict] = []
+
+    def raise_planned_error(self, kind: str) -> None:
+        if self.errors.get(kind):
+            raise http_error(self.errors[kind].pop(0), "backendError")
+
+    def check(self, event_id: str, request: Request) -> None:
+        """Raise the error of a missing event, or of a stale If-Match."""
+        if event_id not in self.store:
+            raise http_error(404, "notFound")
+        etag = request.headers.get("If-Match")
+        if etag is not None and etag != self.store[event_id]["etag"]:
+            raise http_error(412, "conditionNotMet")
+
+    def save(self, event: dict) -> dict:
+        event["htmlLink"] = f"https://calendar/{event['id']}"
+        event["etag"] = f'"{next(self.versions)}"'
+        event.pop("status", None)
+        self.store[event["id"]] = event
+        self.changes.append(event)
+        return copy.deepcopy(event)
+
+    def sync_token(self) -> str:
+        return str(len(self.changes))
+
+    def events(self) -> Events:
+        return Events(self)
+
+    def new_batch_http_request(self, callback=None) -> Batch:
+        return Batch(self, callback)
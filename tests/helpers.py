@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+from src.config import agendas
+from src.model import Event
+
+AGENDA = replace(agendas[0], year=2023)
+
+
+def timed_event(start: str, end: str, summary: str = "tnsi", **fields) -> Event:
+    """A timed event, start and end like "2023-09-04T08:55:00+02:00"."""
+    return Event.from_dict(
+        {
+            "start": {"dateTime": start, "timeZone": "Europe/Paris"},
+            "end": {"dateTime": end, "timeZone": "Europe/Paris"},
+            "summary": summary,
+            **fields,
+        }
+    )
+
+
+def day_event(start: str, end: str, summary: str, **fields) -> Event:
+    """An all day event, start and end like "2023-09-04"."""
+    return Event.from_dict(
+        {"start": {"date": start}, "end": {"date": end}, "summary": summary, **fields}
+    )
@@ -0,0 +1,31 @@
+import sys
+
+import pytest
+
+from src.arguments_parser import read_arguments
+
+
+def parse(monkeypatch, *argv: str):
+    monkeypatch.setattr(sys, "argv", ["calpy", *argv])
+    return read_arguments()
+
+
+@pytest.mark.parametrize("option", ["-r", "-m"])
+@pytest.mark.parametrize("mode", ["--watch", "--changed-since", "--daemon", "--apply"])
+def test_options_ignored_by_a_mode_are_rejected(monkeypatch, capsys, option, mode):
+    with pytest.raises(SystemExit):
+        parse(monkeypatch, option, mode)
+    assert "can't be combined with" in capsys.readouterr().err
+
+
+def test_compatible_options_are_accepted(monkeypatch):
+    arguments = parse(monkeypatch, "-r", "-m", "1", "36")
+    assert arguments.reconcile and arguments.mirror
+    assert parse(monkeypatch, "-j", "--changed-since").changed_since == ""
+
+
+@pytest.mark.parametrize("option", ["-u", "-j"])
+def test_options_ignored_by_the_pipeline_are_rejected(monkeypatch, capsys, option):
+    with pytest.raises(SystemExit):
+        parse(monkeypatch, option, "1", "36", "37", "-w", "1", "2", "2", "1")
+    assert "can't be combined with --workers" in capsys.readouterr().err
@@ -0,0 +1,45 @@
+import asyncio
+
+from src.async_calendar import AsyncCalendarClient
+from src.async_sync import sync_weeks_async
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+SEMAINE_36 = """# Semaine 36
+
+## Lundi 04 septembre
+
+- 8h55-9h50 - B204 - tnsi
+- lycée - Rentrée
+"""
+
+SEMAINE_37 = """# Semaine 37
+
+## Mardi 12 septembre
+
+- 10h00-11h55 - B107 - 2nd
+"""
+
+
+def sync(service: FakeService, paths: list[str]):
+    client = AsyncCalendarClient(AGENDA, concurrency=4, service_factory=lambda: service)
+    try:
+        return asyncio.run(sync_weeks_async(AGENDA, client, paths))
+    finally:
+        client.close()
+
+
+def test_async_sync_goes_through_the_service(tmp_path):
+    paths = []
+    for name, content in (("semaine_36.md", SEMAINE_36), ("semaine_37.md", SEMAINE_37)):
+        path = tmp_path / name
+        path.write_text(content, encoding="utf-8")
+        paths.append(str(path))
+    service = FakeService()
+
+    assert sync(service, paths).created == 3
+    report = sync(service, paths)
+
+    assert (report.created, report.unchanged) == (0, 3)
+    assert len(service.store) == 3
@@ -0,0 +1,47 @@
+from dataclasses import replace
+
+from src.color_rules import ColorClassifier, classifier_for, trie_pattern
+
+from helpers import AGENDA
+
+
+def first_matching_rule(rules: dict[str, list[str]], default: str, summary: str) -> str:
+    """The color rules read in order, like before they were compiled."""
+    for color_id, keywords in rules.items():
+        if any(keyword.lower() in summary.lower() for keyword in keywords):
+            return color_id
+    return default
+
+
+def test_the_rules_are_read_by_priority():
+    rules = {"1": ["tnsi"], "2": ["1ere", "nsi"], "3": ["DS"]}
+    classifier = ColorClassifier(rules, "8")
+    for summary in ["tnsi", "1ere NSI", "DS de tnsi", "nsi DS", "ds", "Rentrée", ""]:
+        assert classifier.color_of(summary) == first_matching_rule(rules, "8", summary)
+
+
+def test_a_keyword_has_the_priority_of_its_prefixes():
+    rules = {"1": ["cp"], "2": ["cp1"]}
+    assert ColorClassifier(rules, "8").color_of("cp1 maths") == "1"
+    rules = {"1": ["cp1"], "2": ["cp"]}
+    classifier = ColorClassifier(rules, "8")
+    assert classifier.color_of("cp1 maths") == "1"
+    assert classifier.color_of("cp2 maths") == "2"
+
+
+def test_without_rules_every_event_gets_the_default_color():
+    assert ColorClassifier({}, "8").color_of("tnsi") == "8"
+    assert ColorClassifier({"1": [""]}, "8").color_of("tnsi") == "8"
+
+
+def test_trie_pattern():
+    assert trie_pattern(["cp1", "cp2", "cdr"]) == "c(?:p(?:1|2)|dr)"
+    assert trie_pattern(["a.b"]) == "a\\.b"
+
+
+def test_the_classifier_is_compiled_again_when_the_rules_change():
+    agenda = replace(AGENDA, colors={"1": ["tnsi"]}, default_color="8")
+    classifier = classifier_for(agenda)
+    assert classifier_for(agenda) is classifier
+    recolored = replace(agenda, colors={"2": ["tnsi"]})
+    assert classifier_for(recolored).color_of("tnsi") == "2"
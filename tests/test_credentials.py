@@ -0,0 +1,107 @@
+import datetime
+import json
+import os
+import pickle
+
+import httplib2
+import pytest
+from google.oauth2.credentials import Credentials
+
+from src.credentials import (
+    PICKLE_TOKEN_PATH,
+    REFRESH_MARGIN,
+    TOKEN_PATH,
+    CredentialsManager,
+    TokenSavingHttp,
+    expires_soon,
+)
+
+from helpers import AGENDA
+
+
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def credentials(token="access", expires_in=datetime.timedelta(hours=1)):
+    creds = Credentials(
+        token,
+        refresh_token="refresh",
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id="client",
+        client_secret="secret",
+        scopes=["https://www.googleapis.com/auth/calendar"],
+    )
+    creds.expiry = utcnow() + expires_in
+    return creds
+
+
+@pytest.fixture
+def tokens():
+    os.makedirs(f"tokens/{AGENDA.longname}", exist_ok=True)
+    for path in (TOKEN_PATH, PICKLE_TOKEN_PATH):
+        if os.path.exists(path.format(AGENDA.longname)):
+            os.remove(path.format(AGENDA.longname))
+
+
+def refresh_with(token: str):
+    def refresh(creds, request):
+        creds.token = token
+        creds.expiry = utcnow() + datetime.timedelta(hours=1)
+
+    return refresh
+
+
+def test_a_pickled_token_is_converted_to_json(tokens):
+    with open(PICKLE_TOKEN_PATH.format(AGENDA.longname), "wb") as token:
+        pickle.dump(credentials(), token)
+
+    creds = CredentialsManager().load(AGENDA)
+
+    assert creds.token == "access"
+    with open(TOKEN_PATH.format(AGENDA.longname), encoding="utf-8") as token:
+        info = json.load(token)
+    assert info["token"] == "access"
+    assert info["refresh_token"] == "refresh"
+    reloaded = CredentialsManager().load(AGENDA)
+    assert reloaded.expiry == creds.expiry
+    assert not expires_soon(reloaded)
+
+
+def test_the_token_is_refreshed_within_the_margin():
+    assert expires_soon(credentials(expires_in=REFRESH_MARGIN / 2))
+    assert not expires_soon(credentials(expires_in=REFRESH_MARGIN * 2))
+    assert expires_soon(credentials(token=None))
+
+
+def test_a_token_about_to_expire_is_refreshed_and_saved(tokens, monkeypatch):
+    manager = CredentialsManager()
+    manager.save(AGENDA, credentials(expires_in=REFRESH_MARGIN / 2))
+    monkeypatch.setattr(Credentials, "refresh", refresh_with("fresh"))
+
+    assert manager.get(AGENDA).token == "fresh"
+    assert CredentialsManager().load(AGENDA).token == "fresh"
+
+
+class UnauthorizedOnce:
+    """An httplib2.Http answering 401 to the first request."""
+
+    def __init__(self):
+        self.statuses = [401, 200]
+
+    def request(self, uri, method="GET", **kwargs):
+        return httplib2.Response({"status": self.statuses.pop(0)}), b"{}"
+
+
+def test_a_token_refreshed_by_the_session_is_saved(tokens, monkeypatch):
+    manager = CredentialsManager()
+    creds = credentials()
+    monkeypatch.setattr(Credentials, "refresh", refresh_with("fresh"))
+    http = TokenSavingHttp(
+        creds, lambda creds: manager.refreshed(AGENDA, creds), http=UnauthorizedOnce()
+    )
+
+    response, _ = http.request("https://www.googleapis.com/calendar/v3")
+
+    assert response.status == 200
+    assert CredentialsManager().load(AGENDA).token == "fresh"
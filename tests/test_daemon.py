@@ -0,0 +1,41 @@
+import argparse
+import socket
+import threading
+
+import src.daemon
+from src.daemon import SyncDaemon, is_listening
+
+from helpers import AGENDA
+
+
+def test_a_live_socket_is_detected(tmp_path):
+    socket_path = str(tmp_path / "calpy.sock")
+    assert not is_listening(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        assert is_listening(socket_path)
+    # the file of a stopped server is left behind
+    assert not is_listening(socket_path)
+
+
+def test_jobs_fail_when_the_service_cant_be_built(monkeypatch):
+    def broken_service(agenda, shared=True):
+        raise RuntimeError("no token")
+
+    monkeypatch.setattr(src.daemon, "build_service", broken_service)
+    arguments = argparse.Namespace(journal=False)
+    daemon = SyncDaemon([AGENDA], arguments)
+    threading.Thread(target=daemon.work, args=(AGENDA,), daemon=True).start()
+
+    for path in ("/semaine_36.md", "/semaine_37.md"):
+        job, _ = daemon.submit(AGENDA, path)
+        assert job._done.wait(timeout=5)
+        assert job.result == {"status": "failed", "path": path, "error": "no token"}
+
+
+def test_requests_which_arent_json_objects_are_refused():
+    daemon = SyncDaemon([AGENDA], argparse.Namespace(journal=False))
+    for request in ([], "semaine_36.md", 36, None, {"path": 36}, {"agenda": "q"}):
+        assert daemon.handle(request)["status"] == "refused"
+    assert not daemon._pending
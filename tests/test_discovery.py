@@ -0,0 +1,76 @@
+import json
+import time
+
+import httplib2
+import pytest
+
+from src import discovery
+from src.discovery import (
+    DISCOVERY_CACHE_PATH,
+    DISCOVERY_MAX_AGE,
+    client_version,
+    load_discovery_document,
+    read_cache,
+    write_cache,
+)
+
+API, VERSION = "testapi", "v1"
+PATH = DISCOVERY_CACHE_PATH.format(api=API, version=VERSION)
+CACHED = {"revision": "cached"}
+BUNDLED = {"revision": "bundled"}
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    """Records the documents asked to the client library and to the network."""
+    asked = []
+
+    def static(api, version):
+        asked.append("static")
+        return BUNDLED
+
+    def fetch(api, version):
+        asked.append("fetch")
+        raise httplib2.HttpLib2Error("offline")
+
+    monkeypatch.setattr(discovery, "static_discovery_document", static)
+    monkeypatch.setattr(discovery, "fetch_discovery_document", fetch)
+    return asked
+
+
+def cache(**metadata):
+    write_cache(PATH, CACHED)
+    with open(PATH, "r", encoding="utf-8") as cache_file:
+        content = json.load(cache_file)
+    content.update(metadata)
+    with open(PATH, "w", encoding="utf-8") as cache_file:
+        json.dump(content, cache_file)
+
+
+def test_a_fresh_cached_document_is_read_from_disk(sources):
+    cache()
+    assert load_discovery_document(API, VERSION) == CACHED
+    assert sources == []
+
+
+def test_a_document_cached_by_another_client_version_is_replaced(sources):
+    cache(client_version="0.0.1")
+    assert load_discovery_document(API, VERSION) == BUNDLED
+    assert sources == ["static"]
+    assert read_cache(PATH)["client_version"] == client_version()
+
+
+def test_a_document_older_than_the_max_age_is_replaced(sources):
+    cache(fetched_at=time.time() - DISCOVERY_MAX_AGE - 60)
+    assert load_discovery_document(API, VERSION) == BUNDLED
+    assert sources == ["static"]
+    assert time.time() - read_cache(PATH)["fetched_at"] < 60
+
+
+def test_an_outdated_document_is_used_when_the_api_is_unreachable(
+    sources, monkeypatch
+):
+    monkeypatch.setattr(discovery, "static_discovery_document", lambda *_: None)
+    cache(fetched_at=time.time() - DISCOVERY_MAX_AGE - 60)
+    assert load_discovery_document(API, VERSION) == CACHED
+    assert sources == ["fetch"]
@@ -0,0 +1,60 @@
+from src.event_index import EventIndex
+from src.google_interaction import sync_event_from_md
+
+from fake_service import FakeService
+from helpers import AGENDA, day_event, timed_event
+
+
+def at(hour: int, minute: int = 0, day: int = 4) -> str:
+    return f"2023-09-{day:02d}T{hour:02d}:{minute:02d}:00+02:00"
+
+
+def test_find_timed_returns_the_first_overlaping_event():
+    first = timed_event(at(8), at(10), id="first")
+    second = timed_event(at(9), at(11), id="second")
+    index = EventIndex([second, first])
+    assert index.find_timed(timed_event(at(9, 30), at(9, 45))) is first
+    assert index.find_timed(timed_event(at(10), at(10, 30))) is second
+    assert index.find_timed(timed_event(at(11), at(12))) is None
+
+
+def test_find_timed_sees_a_long_event_started_long_before():
+    long_event = timed_event(at(8, day=1), at(18, day=8), id="long")
+    index = EventIndex([long_event, timed_event(at(8), at(9), id="short")])
+    assert index.find_timed(timed_event(at(7, day=6), at(7, 30, day=6))) is long_event
+
+
+def test_find_timed_only_scans_the_candidate_events():
+    class CountingList(list):
+        scanned = 0
+
+        def __getitem__(self, position):
+            CountingList.scanned += 1
+            return super().__getitem__(position)
+
+    index = EventIndex(
+        timed_event(at(8, day=day), at(9, day=day), id=str(day)) for day in range(1, 29)
+    )
+    index._timed = CountingList(index._timed)
+    assert index.find_timed(timed_event(at(8, 30, day=28), at(9, day=28))).id == "28"
+    assert CountingList.scanned == 1
+
+
+def test_recorded_events_replace_the_indexed_ones():
+    old = timed_event(at(8), at(9), id="event")
+    index = EventIndex([old, day_event("2023-09-04", "2023-09-05", "Rentrée", id="day")])
+    index.record(timed_event(at(14), at(15), id="event"))
+    assert index.find_timed(timed_event(at(8), at(9))) is None
+    assert index.find_timed(timed_event(at(14), at(15))).id == "event"
+    assert sorted(event.id for event in index.events()) == ["day", "event"]
+
+
+def test_a_shared_index_knows_the_events_written_by_the_previous_files():
+    lines = ["# Semaine 36\n", "## Lundi 04 septembre\n", "- 8h55-9h50 - B204 - tnsi\n"]
+    service = FakeService()
+    index = EventIndex()
+    first = sync_event_from_md(AGENDA, service, "a.md", index=index, lines=lines)
+    moved = [line.replace("B204", "B107") for line in lines]
+    second = sync_event_from_md(AGENDA, service, "b.md", index=index, lines=moved)
+    assert (first.created, second.created, second.updated) == (1, 0, 1)
+    assert [event.location for event in index.events()] == ["B107"]
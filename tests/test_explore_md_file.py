@@ -0,0 +1,100 @@
+import itertools
+
+import markdown
+import pytest
+
+from src.explore_md_file import format_html, is_plain_text, iter_events, parse_lines
+from src.google_interaction import sync_event_from_md
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+
+def lines_of(content: str) -> list[str]:
+    return content.splitlines(keepends=True)
+
+
+def test_events_are_parsed_with_their_description():
+    events = parse_lines(
+        AGENDA,
+        lines_of(
+            "# Semaine 36\n\n## Lundi 04 septembre\n\n"
+            "- 8h55-9h50 - B204 - tnsi\n    cours sur les listes\n\n"
+            "- lycée - Rentrée\n"
+        ),
+    )
+    assert [event.summary for event in events] == ["tnsi", "Rentrée"]
+    assert events[0].start["dateTime"] == "2023-09-04T08:55:00+02:00"
+    assert events[0].location == "B204"
+    assert "cours sur les listes" in events[0].description
+    assert events[1].start["date"] == "2023-09-04"
+
+
+def test_a_day_written_twice_keeps_both_blocks_in_the_order_of_the_file():
+    events = parse_lines(
+        AGENDA,
+        lines_of(
+            "## Lundi 04 septembre\n- 8h55-9h50 - B204 - first\n"
+            "## Mardi 05 septembre\n- 8h55-9h50 - B204 - tuesday\n"
+            "## Lundi 04 septembre\n- 10h00-11h00 - B204 - last\n"
+        ),
+    )
+    assert [event.summary for event in events] == ["first", "tuesday", "last"]
+
+
+def test_events_are_yielded_as_soon_as_their_block_is_complete():
+    lines = iter(lines_of("## Lundi 04 septembre\n- 8h55-9h50 - B204 - tnsi\n"))
+    events = iter_events(AGENDA, itertools.chain(lines, ["## Lundi 45 septembre\n"]))
+    assert next(events).summary == "tnsi"
+    with pytest.raises(ValueError):
+        next(events)
+
+
+def test_a_malformed_line_stops_the_sync_before_any_write():
+    service = FakeService()
+    week = "".join(
+        f"- {hour}h00-{hour}h30 - B{room} - tnsi\n"
+        for hour in range(8, 18)
+        for room in range(6)
+    )
+    lines = lines_of(f"## Lundi 04 septembre\n{week}## Lundi 45 septembre\n")
+    with pytest.raises(ValueError):
+        sync_event_from_md(AGENDA, service, "semaine_36.md", lines=lines)
+    with pytest.raises(ValueError):
+        sync_event_from_md(AGENDA, service, "semaine_36.md", lines=lines, upsert=True)
+    assert service.calls == []
+
+
+PLAIN_DESCRIPTIONS = [
+    "B204",
+    "cours en salle B204",
+    "TP : les listes, les tuples ; la récursivité !",
+    "l'exercice 3 (page 42) vaut 20%.",
+    "12 élèves ?",
+]
+FORMATTED_DESCRIPTIONS = [
+    "**devoir** surveillé",
+    "le mot _important_",
+    "1. rendre le TP",
+    "- une liste",
+    "# un titre",
+    "un [lien](https://example.com)",
+    "a < b & c",
+    "`code`",
+    "deux\nlignes",
+    "snake_case",
+]
+
+
+@pytest.mark.parametrize("description", PLAIN_DESCRIPTIONS + FORMATTED_DESCRIPTIONS)
+def test_descriptions_are_rendered_like_markdown(description):
+    assert format_html(description) == markdown.markdown(description)
+
+
+@pytest.mark.parametrize(
+    "description, plain",
+    [(description, True) for description in PLAIN_DESCRIPTIONS]
+    + [(description, False) for description in FORMATTED_DESCRIPTIONS],
+)
+def test_only_plain_text_skips_markdown(description, plain):
+    assert is_plain_text(description) is plain
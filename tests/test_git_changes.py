@@ -0,0 +1,55 @@
+import os
+import subprocess
+
+import pytest
+
+from src.git_changes import changed_week_files, read_files_at, resolve_commit
+
+GIT_ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="test",
+    GIT_AUTHOR_EMAIL="test@example.com",
+    GIT_COMMITTER_NAME="test",
+    GIT_COMMITTER_EMAIL="test@example.com",
+)
+
+
+def git(repository, *args: str) -> None:
+    subprocess.run(["git", "-C", str(repository), *args], check=True, env=GIT_ENV)
+
+
+def write(path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+@pytest.fixture
+def agenda_repository(tmp_path):
+    """A repository whose agenda lives in the `cours/` subdirectory."""
+    git(tmp_path, "init", "-q")
+    agenda_path = tmp_path / "cours"
+    write(agenda_path / "2023/periode_1/semaine_36.md", "# Semaine 36\n")
+    write(agenda_path / "2023/periode_1/semaine_37.md", "# Semaine 37\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "first")
+    write(agenda_path / "2023/periode_1/semaine_37.md", "# Semaine 37\n\n## Mardi\n")
+    write(agenda_path / "2023/periode_1/notes.md", "notes\n")
+    write(agenda_path / "2022/periode_1/semaine_36.md", "# old\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "second")
+    return str(agenda_path) + "/"
+
+
+def test_changed_files_are_relative_to_the_agenda_path(agenda_repository):
+    changed = changed_week_files(agenda_repository, "HEAD~1", "HEAD", 2023)
+    assert changed == ["2023/periode_1/semaine_37.md"]
+    assert os.path.exists(os.path.join(agenda_repository, changed[0]))
+
+
+def test_files_are_read_at_the_commit(agenda_repository):
+    first = resolve_commit(agenda_repository, "HEAD~1")
+    path = "2023/periode_1/semaine_37.md"
+    assert read_files_at(agenda_repository, first, [path]) == {
+        path: ["# Semaine 37\n"]
+    }
+    assert read_files_at(agenda_repository, "HEAD", [path])[path][-1] == "## Mardi\n"
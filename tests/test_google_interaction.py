@@ -0,0 +1,107 @@
+from dataclasses import asdict
+from functools import partial
+
+import pytest
+
+from src.explore_md_file import parse_lines
+from src import google_interaction
+from src.google_interaction import iter_event_pages, sync_event_from_md
+from src.model import Event
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+SEMAINE_36 = """# Semaine 36
+
+## Lundi 04 septembre
+
+- 8h55-9h50 - B204 - tnsi
+- 8h55-9h50 - B107 - 1ere NSI
+- lycée - Rentrée
+"""
+
+
+def sync(service: FakeService, content: str = SEMAINE_36, **options):
+    return sync_event_from_md(
+        AGENDA,
+        service,
+        "semaine_36.md",
+        lines=content.splitlines(keepends=True),
+        **options,
+    )
+
+
+def summaries(service: FakeService) -> list[str]:
+    return sorted(event["summary"] for event in service.store.values())
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_events_sharing_a_slot_keep_their_own_remote_event(prefetch):
+    service = FakeService()
+    content = SEMAINE_36.replace("- lycée - Rentrée\n", "")
+    assert sync(service, content, prefetch=prefetch).created == 2
+    for _ in range(2):
+        report = sync(service, content, prefetch=prefetch)
+        assert (report.created, report.updated, report.unchanged) == (0, 0, 2)
+        assert summaries(service) == ["1ere NSI", "tnsi"]
+
+
+def test_legacy_events_sharing_a_slot_are_matched_by_summary():
+    service = FakeService()
+    events = parse_lines(AGENDA, SEMAINE_36.splitlines(keepends=True))
+    for number, event in enumerate(reversed(events)):
+        legacy = dict(asdict(event), id=f"legacy{number}")
+        service.store[legacy["id"]] = legacy
+    report = sync(service)
+    assert (report.created, report.updated) == (0, 0)
+    assert summaries(service) == ["1ere NSI", "Rentrée", "tnsi"]
+
+
+def test_syncing_an_unchanged_week_again_writes_nothing():
+    service = FakeService()
+    sync(service)
+    service.calls.clear()
+    report = sync(service)
+    assert (report.created, report.updated, report.unchanged) == (0, 0, 3)
+    assert service.calls == ["list"]
+
+
+def test_every_page_of_a_listing_is_read_lazily():
+    service = FakeService()
+    for hour in range(8, 18):
+        service.save(
+            {
+                "id": f"event{hour}",
+                "start": {"dateTime": f"2023-09-04T{hour:02d}:00:00+02:00"},
+                "end": {"dateTime": f"2023-09-04T{hour:02d}:30:00+02:00"},
+                "summary": f"cours {hour}",
+                "creator": {"email": "someone@example.com"},
+            }
+        )
+    pages = iter_event_pages(AGENDA, service, page_size=4)
+
+    first = next(pages)
+    assert service.calls == ["list"]
+    assert "nextSyncToken" not in first
+    rest = list(pages)
+
+    assert [len(page["items"]) for page in [first, *rest]] == [4, 4, 2]
+    assert "nextSyncToken" in rest[-1]
+    assert len(service.calls) == 3
+    item = first["items"][0]
+    assert "creator" not in item
+    assert Event.from_dict(item).summary == "cours 8"
+
+
+def test_retrieved_events_span_several_pages(monkeypatch):
+    service = FakeService()
+    sync(service)
+    monkeypatch.setattr(
+        google_interaction,
+        "iter_event_pages",
+        partial(google_interaction.iter_event_pages, page_size=1),
+    )
+    events = google_interaction.retrieve_events(
+        AGENDA, "2023-09-03T00:00:00+02:00", "2023-09-05T00:00:00+02:00", service
+    )
+    assert sorted(event.summary for event in events) == ["1ere NSI", "Rentrée", "tnsi"]
@@ -0,0 +1,68 @@
+from src.event_index import EventIndex
+from src.explore_md_file import parse_lines
+from src.google_interaction import sync_event_from_md
+from src.journal import SyncJournal
+from src.model import Event
+from src.plan import apply_plan, plan_weeks
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+SEMAINE_36 = """# Semaine 36
+
+## Lundi 04 septembre
+
+- 8h55-9h50 - B204 - tnsi
+- 10h00-11h55 - B107 - 2nd
+"""
+
+
+def lines_of(content: str) -> list[str]:
+    return content.splitlines(keepends=True)
+
+
+def sync(service, journal, content=SEMAINE_36):
+    return sync_event_from_md(
+        AGENDA, service, "semaine_36.md", journal=journal, lines=lines_of(content)
+    )
+
+
+def test_journaled_events_cost_no_request(tmp_path):
+    service = FakeService()
+    journal = SyncJournal(AGENDA, str(tmp_path / "journal.sqlite3"))
+    assert sync(service, journal).created == 2
+    service.calls.clear()
+
+    report = sync(service, journal)
+
+    assert report.unchanged == 2
+    assert service.calls == []
+
+
+def test_changed_events_are_updated_by_id(tmp_path):
+    service = FakeService()
+    journal = SyncJournal(AGENDA, str(tmp_path / "journal.sqlite3"))
+    sync(service, journal)
+    service.calls.clear()
+
+    described = SEMAINE_36 + "    contrôle\n"
+    report = sync(service, journal, described)
+
+    assert (report.updated, report.unchanged) == (1, 1)
+    assert service.calls == ["batch"]
+
+
+def test_reconcile_deletions_are_forgotten(tmp_path):
+    service = FakeService()
+    journal = SyncJournal(AGENDA, str(tmp_path / "journal.sqlite3"))
+    sync(service, journal)
+    removed = parse_lines(AGENDA, lines_of(SEMAINE_36))[1]
+    assert journal.get(removed) is not None
+
+    weeks = [("semaine_36.md", parse_lines(AGENDA, lines_of(SEMAINE_36)[:-1]))]
+    snapshot = EventIndex(Event.from_dict(item) for item in service.store.values())
+    plan = plan_weeks(AGENDA, weeks, snapshot, reconcile=True)
+    report = apply_plan(AGENDA, service, plan, journal=journal)
+
+    assert (report.deleted, report.unchanged) == (1, 1)
+    assert journal.get(removed) is None
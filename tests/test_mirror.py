@@ -0,0 +1,92 @@
+import json
+import os
+from dataclasses import asdict, replace
+
+import pytest
+
+from src.mirror import MIRROR_PATH, AgendaMirror, refreshed_mirror
+
+from fake_service import FakeService
+from helpers import AGENDA, timed_event
+
+
+@pytest.fixture
+def service():
+    os.makedirs(f"tokens/{AGENDA.longname}", exist_ok=True)
+    path = MIRROR_PATH.format(AGENDA.longname)
+    if os.path.exists(path):
+        os.remove(path)
+    service = FakeService()
+    for hour in (8, 9):
+        insert(service, f"2023-09-04T{hour:02d}:00:00+02:00", f"cours {hour}")
+    return service
+
+
+def insert(service: FakeService, start: str, summary: str) -> dict:
+    event = timed_event(start, start.replace(":00:00", ":30:00"), summary)
+    body = dict(asdict(event), id="")
+    return service.events().insert(calendarId="primary", body=body).execute()
+
+
+def summaries(mirror: AgendaMirror) -> list[str]:
+    return sorted(item["summary"] for item in mirror.events.values())
+
+
+def test_the_mirror_is_kept_current_with_the_sync_token(service):
+    mirror = refreshed_mirror(AGENDA, service)
+    assert summaries(mirror) == ["cours 8", "cours 9"]
+
+    insert(service, "2023-09-05T10:00:00+02:00", "cours 10")
+    deleted = next(iter(service.store))
+    service.events().delete(calendarId="primary", eventId=deleted).execute()
+    service.calls.clear()
+
+    mirror = refreshed_mirror(AGENDA, service)
+    assert summaries(mirror) == ["cours 10", "cours 9"]
+    assert deleted not in mirror.events
+    assert service.calls == ["list"]
+    assert summaries(AgendaMirror.load(AGENDA)) == ["cours 10", "cours 9"]
+
+
+def test_an_expired_sync_token_lists_everything_again(service):
+    refreshed_mirror(AGENDA, service)
+    service.store.clear()
+    insert(service, "2023-09-05T10:00:00+02:00", "cours 10")
+    service.errors["list"] = [410]
+
+    mirror = refreshed_mirror(AGENDA, service)
+
+    assert summaries(mirror) == ["cours 10"]
+
+
+def test_the_full_listing_covers_the_school_year(service):
+    insert(service, "2022-09-05T10:00:00+02:00", "last year")
+    insert(service, "2024-07-31T10:00:00+02:00", "end of the year")
+    mirror = refreshed_mirror(AGENDA, service)
+    assert summaries(mirror) == ["cours 8", "cours 9", "end of the year"]
+
+
+def test_an_interrupted_save_keeps_the_previous_mirror(service, monkeypatch):
+    mirror = refreshed_mirror(AGENDA, service)
+    mirror.events = {}
+
+    def interrupted(content, mirror_file):
+        mirror_file.write('{"year": ')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(json, "dump", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        mirror.save()
+    monkeypatch.undo()
+
+    assert summaries(AgendaMirror.load(AGENDA)) == ["cours 8", "cours 9"]
+    assert os.listdir(f"tokens/{AGENDA.longname}").count("mirror.json") == 1
+    assert not [
+        name for name in os.listdir(f"tokens/{AGENDA.longname}") if name.endswith(".tmp")
+    ]
+
+
+def test_the_mirror_of_another_school_year_is_listed_again(service):
+    refreshed_mirror(AGENDA, service)
+    other_year = AgendaMirror.load(replace(AGENDA, year=2022))
+    assert (other_year.events, other_year.sync_token) == ({}, None)
@@ -0,0 +1,44 @@
+from dataclasses import replace
+
+from src.model import stable_event_id
+
+from helpers import day_event, timed_event
+
+START, END = "2023-09-04T08:55:00+02:00", "2023-09-04T09:50:00+02:00"
+
+
+def test_stable_id_only_depends_on_the_slot():
+    event = timed_event(START, END, location="B204")
+    same_slot = timed_event(START, END, location="B204", description="cours")
+    assert stable_event_id("agenda", event) == stable_event_id("agenda", same_slot)
+    assert stable_event_id("agenda", event) != stable_event_id("other", event)
+
+
+def test_stable_id_of_the_same_instant_in_another_timezone():
+    event = timed_event(START, END)
+    in_utc = timed_event("2023-09-04T06:55:00+00:00", "2023-09-04T07:50:00+00:00")
+    assert stable_event_id("agenda", event) == stable_event_id("agenda", in_utc)
+
+
+def test_events_starting_at_the_same_time_get_distinct_ids():
+    event = timed_event(START, END, summary="tnsi", location="B204")
+    other_group = replace(event, summary="1ere NSI")
+    other_room = replace(event, location="B107")
+    ids = {
+        stable_event_id("agenda", event),
+        stable_event_id("agenda", other_group),
+        stable_event_id("agenda", other_room),
+    }
+    assert len(ids) == 3
+
+
+def test_all_day_events_of_a_day_get_distinct_ids():
+    rentree = day_event("2023-09-04", "2023-09-05", "Rentrée")
+    sortie = day_event("2023-09-04", "2023-09-05", "Sortie")
+    assert stable_event_id("agenda", rentree) != stable_event_id("agenda", sortie)
+
+
+def test_stable_id_is_a_valid_google_id():
+    event_id = stable_event_id("agenda", timed_event(START, END))
+    assert 5 <= len(event_id) <= 1024
+    assert set(event_id) <= set("0123456789abcdefghijklmnopqrstuv")
@@ -0,0 +1,82 @@
+import os
+import time
+from dataclasses import replace
+
+import src.parse_cache as parse_cache
+from src.parse_cache import PARSE_CACHE_DIR, entry_path, evict, parse_events_cached
+
+from helpers import AGENDA
+
+SEMAINE_36 = "## Lundi 04 septembre\n- 8h55-9h50 - B204 - tnsi\n"
+
+
+def week_file(tmp_path, content: str = SEMAINE_36) -> str:
+    """A week file modified long enough ago to be trusted from its stat."""
+    path = tmp_path / "semaine_36.md"
+    path.write_text(content, encoding="utf-8")
+    past = time.time() - 60
+    os.utime(path, (past, past))
+    return str(path)
+
+
+def forbid_parsing(monkeypatch):
+    def parse_lines(agenda, lines):
+        raise AssertionError("the week file was parsed again")
+
+    monkeypatch.setattr(parse_cache, "parse_lines", parse_lines)
+
+
+def test_an_unchanged_file_is_read_from_the_cache(tmp_path, monkeypatch):
+    path = week_file(tmp_path)
+    events = parse_events_cached(AGENDA, path)
+    forbid_parsing(monkeypatch)
+    assert parse_events_cached(AGENDA, path) == events
+
+
+def test_a_touched_file_with_the_same_content_is_not_parsed_again(
+    tmp_path, monkeypatch
+):
+    path = week_file(tmp_path)
+    events = parse_events_cached(AGENDA, path)
+    os.utime(path)
+    forbid_parsing(monkeypatch)
+    assert parse_events_cached(AGENDA, path) == events
+
+
+def test_a_changed_file_is_parsed_again(tmp_path):
+    path = week_file(tmp_path)
+    parse_events_cached(AGENDA, path)
+    week_file(tmp_path, SEMAINE_36.replace("tnsi", "tnsi DS"))
+    assert [event.summary for event in parse_events_cached(AGENDA, path)] == [
+        "tnsi DS"
+    ]
+
+
+def test_other_agenda_settings_use_another_entry(tmp_path):
+    path = week_file(tmp_path)
+    recolored = replace(AGENDA, default_color="1")
+    assert entry_path(AGENDA, path) != entry_path(recolored, path)
+    assert entry_path(AGENDA, path) != entry_path(replace(AGENDA, year=2024), path)
+
+
+def test_a_failed_write_is_a_cache_miss(tmp_path, monkeypatch):
+    path = week_file(tmp_path, SEMAINE_36.replace("tnsi", "snt"))
+
+    def replace_file(source, destination):
+        os.remove(source)
+        raise FileNotFoundError(source)
+
+    monkeypatch.setattr(parse_cache.os, "replace", replace_file)
+    events = parse_events_cached(AGENDA, path)
+    assert [event.summary for event in events] == ["snt"]
+    assert not os.path.exists(entry_path(AGENDA, path))
+
+
+def test_eviction_leaves_the_temporary_files_alone(tmp_path):
+    parse_events_cached(AGENDA, week_file(tmp_path))
+    temporary_path = os.path.join(PARSE_CACHE_DIR, "entry.json.1.2.tmp")
+    with open(temporary_path, "w", encoding="utf-8") as temporary_file:
+        temporary_file.write("{}")
+    evict(max_bytes=0)
+    assert os.listdir(PARSE_CACHE_DIR) == ["entry.json.1.2.tmp"]
+    os.remove(temporary_path)
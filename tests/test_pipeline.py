@@ -0,0 +1,84 @@
+from queue import Queue
+
+import pytest
+
+from src import pipeline
+from src.pipeline import END_OF_JOBS, PipelineWorkers, Stage, WeekJob, sync_weeks_pipelined
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+WEEKS = {
+    "semaine_36.md": "## Lundi 04 septembre\n- 8h55-9h50 - B204 - tnsi\n",
+    "semaine_37.md": "## Mardi 12 septembre\n- 10h00-11h55 - B107 - 2nd\n",
+    "semaine_38.md": "## Lundi 45 septembre\n- 8h55-9h50 - B204 - tnsi\n",
+    "semaine_39.md": "## Lundi 25 septembre\n- lycée - Sortie\n",
+}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(pipeline, "build_service", lambda agenda, shared=True: service)
+    return service
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = []
+    for name, content in WEEKS.items():
+        (tmp_path / name).write_text(content, encoding="utf-8")
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def test_the_jobs_come_back_in_the_order_of_the_files(service, paths):
+    workers = PipelineWorkers(read=2, parse=2, match=3, write=2, queue_size=1)
+    jobs = sync_weeks_pipelined(AGENDA, paths, workers=workers)
+
+    assert [job.path for job in jobs] == paths
+    assert [job.report.created for job in jobs] == [1, 1, 0, 1]
+    assert len(service.store) == 3
+
+
+def test_a_failing_job_skips_the_next_stages(service, paths):
+    jobs = sync_weeks_pipelined(AGENDA, paths)
+
+    failed = jobs[2]
+    assert isinstance(failed.error, ValueError)
+    assert (failed.events, failed.matches) == ([], [])
+    assert all(job.error is None for job in jobs if job is not failed)
+
+
+def test_the_parse_cache_is_used_when_asked(service, paths, monkeypatch):
+    cached = []
+
+    def parse_events_cached(agenda, path):
+        cached.append(path)
+        return []
+
+    monkeypatch.setattr(pipeline, "parse_events_cached", parse_events_cached)
+    sync_weeks_pipelined(AGENDA, paths, parse_cache=True)
+    assert sorted(cached) == paths
+    assert service.store == {}
+
+
+def test_a_stage_closes_its_outbox_once_every_worker_stopped():
+    inbox, outbox = Queue(), Queue()
+    processed = []
+    stage = Stage(
+        "test", lambda job, local: processed.append(job.path), inbox, outbox, 3, 2
+    )
+    stage.start()
+    for position in range(5):
+        inbox.put(WeekJob(position, f"week{position}"))
+    for _ in range(3):
+        inbox.put(END_OF_JOBS)
+    for thread in stage.threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in stage.threads)
+    received = [outbox.get_nowait() for _ in range(outbox.qsize())]
+    assert sorted(job.path for job in received[:5]) == sorted(processed)
+    assert len(processed) == 5
+    assert received[5:] == [END_OF_JOBS, END_OF_JOBS]
@@ -0,0 +1,161 @@
+import datetime
+import os
+
+import pytest
+
+from src.event_index import EventIndex, week_window
+from src.explore_md_file import parse_lines
+from src.model import Event
+from src.plan import (
+    CREATE,
+    DELETE,
+    NOOP,
+    UPDATE,
+    SyncPlan,
+    apply_plan,
+    plan_weeks,
+    reconcile_week,
+)
+
+from fake_service import FakeService
+from helpers import AGENDA, day_event, timed_event
+
+SEMAINE_36 = """# Semaine 36
+
+## Lundi 04 septembre
+
+- 8h55-9h50 - B204 - tnsi
+- Vacances - x - Lundi 18 septembre
+"""
+
+SEMAINE_37 = """# Semaine 37
+
+## Mardi 12 septembre
+
+- 10h00-11h55 - B107 - 2nd
+"""
+
+
+def parse(content: str):
+    return parse_lines(AGENDA, content.splitlines(keepends=True))
+
+
+def owns_everything(event: Event) -> bool:
+    return True
+
+
+def test_week_window_ignores_the_end_of_multi_day_events():
+    window = week_window(parse(SEMAINE_36))
+    assert [bound.date() for bound in window] == [
+        datetime.date(2023, 9, 4),
+        datetime.date(2023, 9, 11),
+    ]
+
+
+def test_reconcile_keeps_the_events_of_the_following_weeks():
+    events = parse(SEMAINE_36)
+    holiday = next(event for event in events if event.is_all_day)
+    remote_holiday = day_event(
+        holiday.start["date"], holiday.end["date"], holiday.summary, id="holiday"
+    )
+    orphan = timed_event(
+        "2023-09-05T14:00:00+02:00", "2023-09-05T15:00:00+02:00", "gone", id="orphan"
+    )
+    week_37 = timed_event(
+        "2023-09-12T10:00:00+02:00", "2023-09-12T11:55:00+02:00", "2nd", id="week37"
+    )
+    week_38 = day_event("2023-09-18", "2023-09-19", "sortie", id="week38")
+    # starts in the previous week, overlaps the week of the file
+    before = day_event("2023-08-28", "2023-09-06", "stage", id="before")
+    snapshot = EventIndex([remote_holiday, orphan, week_37, week_38, before])
+
+    operations = reconcile_week("semaine_36.md", events, snapshot, owns_everything)
+
+    actions = {
+        (operation.existing.id if operation.existing else None): operation.action
+        for operation in operations
+    }
+    assert actions == {"holiday": UPDATE, "orphan": DELETE, None: CREATE}
+
+
+def test_reconciled_files_never_delete_the_events_of_each_other():
+    weeks = [("semaine_36.md", parse(SEMAINE_36)), ("semaine_37.md", parse(SEMAINE_37))]
+    remote = [event for _, events in weeks for event in events]
+    for number, event in enumerate(remote):
+        event.id = f"remote{number}"
+    plan = plan_weeks(AGENDA, weeks, EventIndex(remote), reconcile=True)
+    assert [operation.action for operation in plan.operations] == [NOOP, NOOP, NOOP]
+
+
+def test_a_remote_event_is_used_by_a_single_file():
+    events = parse(SEMAINE_37)
+    remote = timed_event(
+        "2023-09-12T08:00:00+02:00", "2023-09-12T09:00:00+02:00", "old", id="old"
+    )
+    snapshot = EventIndex([remote])
+    claimed = set()
+    first = reconcile_week("a.md", events, snapshot, owns_everything, claimed)
+    second = reconcile_week("b.md", events, snapshot, owns_everything, claimed)
+    assert [operation.action for operation in first] == [CREATE, DELETE]
+    assert [operation.action for operation in second] == [CREATE]
+
+
+def test_reconcile_only_deletes_the_events_written_by_the_application():
+    removed = parse("## Mercredi 13 septembre\n- 8h00-9h00 - B1 - removed\n")[0]
+    by_hand = timed_event(
+        "2023-09-13T14:00:00+02:00", "2023-09-13T15:00:00+02:00", "réunion", id="hand"
+    )
+    journaled = timed_event(
+        "2023-09-14T14:00:00+02:00", "2023-09-14T15:00:00+02:00", "2nd", id="legacy"
+    )
+    snapshot = EventIndex([removed, by_hand, journaled])
+
+    plan = plan_weeks(
+        AGENDA,
+        [("semaine_37.md", parse(SEMAINE_37))],
+        snapshot,
+        reconcile=True,
+        journaled_ids={"legacy"},
+    )
+
+    deleted = {
+        operation.existing.id
+        for operation in plan.operations
+        if operation.action == DELETE
+    }
+    assert deleted == {removed.id, "legacy"}
+
+
+def remote_snapshot(service: FakeService) -> EventIndex:
+    return EventIndex(Event.from_dict(item) for item in service.store.values())
+
+
+def test_apply_leaves_the_events_edited_since_the_plan():
+    service = FakeService()
+    first_plan = plan_weeks(AGENDA, [("a.md", parse(SEMAINE_36))], EventIndex())
+    apply_plan(AGENDA, service, first_plan)
+    changed = SEMAINE_36.replace("tnsi", "tnsi DS").replace("Vacances", "Congés")
+    weeks = [("a.md", parse(changed))]
+    plan = plan_weeks(AGENDA, weeks, remote_snapshot(service), reconcile=True)
+    edited = next(
+        operation.existing
+        for operation in plan.operations
+        if operation.action == UPDATE
+    )
+    service.save(dict(service.store[edited.id], summary="edited by hand"))
+
+    report = apply_plan(AGENDA, service, plan)
+
+    assert report.failed == 1
+    assert service.store[edited.id]["summary"] == "edited by hand"
+
+
+def test_a_stored_plan_is_applied_once():
+    os.makedirs(f"tokens/{AGENDA.longname}", exist_ok=True)
+    plan = plan_weeks(AGENDA, [("a.md", parse(SEMAINE_36))], EventIndex())
+    plan.save()
+    loaded = SyncPlan.load(AGENDA)
+    assert loaded.counts()[CREATE] == 2
+    loaded.mark_applied()
+    with pytest.raises(FileNotFoundError):
+        SyncPlan.load(AGENDA)
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import threading
+import time
+
+import pytest
+
+from src.batch_writes import EventWriteBatch
+from src.rate_limiter import RequestScheduler, scheduler
+
+from fake_service import FakeService, http_error
+from helpers import AGENDA, timed_event
+
+
+@pytest.fixture(autouse=True)
+def quick_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, "base_delay", 0.001)
+
+
+def events(count: int, with_id: bool = True):
+    return [
+        timed_event(
+            f"2023-09-04T{8 + number:02d}:00:00+02:00",
+            f"2023-09-04T{8 + number:02d}:30:00+02:00",
+            id=f"event{number}" if with_id else "",
+        )
+        for number in range(count)
+    ]
+
+
+def test_a_cost_larger_than_the_bucket_takes_every_token():
+    limiter = RequestScheduler(rate=50, max_rate=50, burst=10)
+    start = time.monotonic()
+    limiter.run(lambda: None, cost=30)
+    # 10 tokens in the bucket, 20 more at 50 per second
+    assert time.monotonic() - start >= 0.35
+    assert limiter._tokens < 1
+
+
+def test_the_latency_of_a_batch_is_compared_per_request():
+    limiter = RequestScheduler(rate=5, target_latency=2.0)
+    limiter.succeeded(10.0, cost=50)
+    assert limiter.rate > 5
+    limiter.succeeded(3.0)
+    assert limiter.rate < 5
+
+
+def test_server_errors_are_only_retried_for_idempotent_calls():
+    limiter = RequestScheduler(base_delay=0.001)
+    calls = []
+
+    def failing_call():
+        calls.append(1)
+        raise http_error(503, "backendError")
+
+    with pytest.raises(Exception):
+        limiter.run(failing_call, idempotent=False)
+    assert len(calls) == 1
+    with pytest.raises(Exception):
+        limiter.run(failing_call)
+    assert len(calls) == 2 + limiter.max_retries
+
+
+def test_only_the_failed_requests_of_a_batch_are_sent_again():
+    service = FakeService()
+    service.errors["insert"] = [503]
+    batch = EventWriteBatch(AGENDA, service)
+    for event in events(3):
+        batch.insert(event)
+    batch.flush()
+    assert service.calls == ["batch", "batch"]
+    assert len(service.store) == 3
+
+
+def test_creations_without_id_are_not_sent_again_after_a_server_error():
+    service = FakeService()
+    service.errors["insert"] = [503]
+    batch = EventWriteBatch(AGENDA, service)
+    for event in events(3, with_id=False):
+        batch.insert(event)
+    batch.flush()
+    assert service.calls == ["batch"]
+    assert len(service.store) == 2
+    assert len(batch.failures) == 1
+
+
+def test_a_failed_batch_only_sends_the_idempotent_requests_again():
+    service = FakeService()
+    service.errors["batch"] = [503]
+    batch = EventWriteBatch(AGENDA, service)
+    for event in events(2) + events(1, with_id=False):
+        batch.insert(event)
+    batch.flush()
+    assert service.calls == ["batch", "batch"]
+    assert sorted(service.store) == ["event0", "event1"]
+    assert len(batch.failures) == 1
+
+
+def test_a_client_can_size_the_concurrency():
+    limiter = RequestScheduler(rate=1000, max_rate=1000, burst=100)
+    limiter.set_concurrency(20)
+    barrier = threading.Barrier(20, timeout=5)
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(lambda _: limiter.run(barrier.wait), range(20)))
+    assert sorted(results) == list(range(20))
+    assert limiter.max_concurrency == 20
@@ -0,0 +1,32 @@
+import datetime
+
+import pytest
+
+from src.school_year import SchoolYear, school_year
+
+
+def test_the_months_after_december_belong_to_the_next_civil_year():
+    year = SchoolYear(2023)
+    assert year.date_of(4, "septembre") == datetime.datetime(2023, 9, 4)
+    assert year.date_of(31, "Décembre") == datetime.datetime(2023, 12, 31)
+    assert year.date_of(8, "janvier") == datetime.datetime(2024, 1, 8)
+    assert year.date_of(31, "juillet") == datetime.datetime(2024, 7, 31)
+
+
+def test_the_school_year_starts_in_august():
+    year = SchoolYear(2023)
+    assert year.days[0] == datetime.date(2023, 8, 1)
+    assert year.days[-1] == datetime.date(2024, 7, 31)
+    assert year.date_of(29, "février") == datetime.datetime(2024, 2, 29)
+
+
+def test_a_missing_day_or_an_unknown_month_raises():
+    year = SchoolYear(2022)
+    with pytest.raises(ValueError):
+        year.date_of(29, "février")
+    with pytest.raises(ValueError):
+        year.date_of(4, "september")
+
+
+def test_a_school_year_is_computed_once():
+    assert school_year(2023) is school_year(2023)
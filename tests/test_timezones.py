@@ -0,0 +1,41 @@
+import datetime
+import zoneinfo
+
+from src.timezones import OffsetTable, format_offset, offset_table
+
+
+def test_format_offset():
+    assert format_offset(datetime.timedelta(hours=2)) == "+02:00"
+    assert format_offset(datetime.timedelta(hours=-3, minutes=-30)) == "-03:30"
+    assert format_offset(datetime.timedelta(hours=5, minutes=45)) == "+05:45"
+    assert format_offset(None) == "+00:00"
+
+
+def test_the_table_agrees_with_zoneinfo_every_hour_of_the_year():
+    for timezone in ("Europe/Paris", "America/St_Johns", "Asia/Kathmandu"):
+        zone = zoneinfo.ZoneInfo(timezone)
+        table = OffsetTable(timezone, 2023)
+        time = datetime.datetime(2023, 8, 1)
+        while time < datetime.datetime(2024, 8, 1):
+            expected = format_offset(time.replace(tzinfo=zone).utcoffset())
+            assert table.offset(time) == expected, (timezone, time)
+            time += datetime.timedelta(minutes=30)
+
+
+def test_the_days_of_a_dst_transition_are_computed_exactly():
+    table = OffsetTable("Europe/Paris", 2023)
+    assert table.format(datetime.datetime(2023, 10, 29, 1, 30)) == (
+        "2023-10-29T01:30:00+02:00"
+    )
+    assert table.format(datetime.datetime(2023, 10, 29, 9, 0)) == (
+        "2023-10-29T09:00:00+01:00"
+    )
+    assert table.format(datetime.datetime(2024, 3, 31, 8, 0, 45)) == (
+        "2024-03-31T08:00:00+02:00"
+    )
+
+
+def test_a_day_outside_the_school_year():
+    table = offset_table("Europe/Paris", 2023)
+    assert table.offset(datetime.datetime(2025, 1, 10, 8)) == "+01:00"
+    assert offset_table("Europe/Paris", 2023) is table
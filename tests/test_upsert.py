@@ -0,0 +1,64 @@
+from dataclasses import asdict
+
+from src.explore_md_file import parse_lines
+from src.google_interaction import sync_event_from_md
+
+from fake_service import FakeService
+from helpers import AGENDA
+
+SEMAINE_36 = """# Semaine 36
+
+## Lundi 04 septembre
+
+- 8h55-9h50 - B204 - tnsi
+- 8h55-9h50 - B107 - 1ere NSI
+- lycée - Rentrée
+"""
+
+
+def upsert(service: FakeService, content: str = SEMAINE_36):
+    return sync_event_from_md(
+        AGENDA,
+        service,
+        "semaine_36.md",
+        upsert=True,
+        lines=content.splitlines(keepends=True),
+    )
+
+
+def parsed_ids(content: str = SEMAINE_36) -> set[str]:
+    return {event.id for event in parse_lines(AGENDA, content.splitlines(keepends=True))}
+
+
+def test_upsert_creates_events_starting_at_the_same_time():
+    service = FakeService()
+    report = upsert(service)
+    assert report.created == 3
+    assert set(service.store) == parsed_ids()
+
+
+def test_upsert_twice_updates_by_id():
+    service = FakeService()
+    upsert(service)
+    service.calls.clear()
+    report = upsert(service)
+    assert (report.created, report.updated) == (0, 3)
+    assert service.calls == ["batch"]
+    assert set(service.store) == parsed_ids()
+
+
+def test_upsert_migrates_events_without_stable_id():
+    service = FakeService()
+    for index, event in enumerate(parse_lines(AGENDA, SEMAINE_36.splitlines(keepends=True))):
+        legacy = dict(asdict(event), id=f"legacy{index}")
+        service.store[legacy["id"]] = legacy
+    upsert(service)
+    assert set(service.store) == parsed_ids()
+
+
+def test_upsert_replaces_a_renamed_event():
+    service = FakeService()
+    upsert(service)
+    renamed = SEMAINE_36.replace("B204 - tnsi", "B204 - tnsi DS")
+    upsert(service, renamed)
+    assert set(service.store) == parsed_ids(renamed)
@@ -0,0 +1,29 @@
+import argparse
+from dataclasses import replace
+
+from src.user_interaction import warn_and_get_paths
+
+from helpers import AGENDA
+
+
+def test_the_paths_of_every_agenda_are_asked_once(monkeypatch):
+    answers = []
+    monkeypatch.setattr("builtins.input", lambda prompt="": answers.append(prompt) or "n")
+    arguments = argparse.Namespace(
+        interactive=False,
+        period_number=1,
+        week_numbers=[36, 37],
+        view_content=True,
+        yes=True,
+    )
+    other = replace(AGENDA, git_repo_path="/other/", year=2024)
+    path_lists = warn_and_get_paths(arguments, [AGENDA, other])
+    assert len(answers) == 1
+    assert path_lists[1] == [
+        "/other/2024/periode_1/semaine_36.md",
+        "/other/2024/periode_1/semaine_37.md",
+    ]
+    assert [path.split("/")[-2:] for path in path_lists[0]] == [
+        ["periode_1", "semaine_36.md"],
+        ["periode_1", "semaine_37.md"],
+    ]
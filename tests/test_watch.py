@@ -0,0 +1,89 @@
+import argparse
+import os
+from dataclasses import replace
+
+import pytest
+
+from src import watch
+from src.report import SyncReport
+from src.watch import AgendaDirectories, InotifyWatcher, PollingWatcher
+
+from helpers import AGENDA
+
+
+@pytest.fixture
+def repository(tmp_path):
+    (tmp_path / "cours/2023/periode_1").mkdir(parents=True)
+    (tmp_path / "cours/2023/periode_1/semaine_36.md").write_text("# Semaine 36\n")
+    os.symlink(tmp_path / "cours", tmp_path / "link")
+    return tmp_path
+
+
+def test_agendas_sharing_a_folder_are_all_found(repository):
+    first = replace(AGENDA, longname="first", git_repo_path=f"{repository}/cours/")
+    second = replace(AGENDA, longname="second", git_repo_path=f"{repository}/link/")
+    folders = AgendaDirectories([first, second])
+
+    week = f"{repository}/link/2023/periode_1/semaine_36.md"
+    assert [agenda.longname for agenda in folders.agendas_of(week)] == [
+        "first",
+        "second",
+    ]
+    new_period = f"{repository}/cours/2023/periode_2/semaine_43.md"
+    assert len(folders.agendas_of(new_period)) == 2
+    assert folders.agendas_of(f"{repository}/cours/notes/semaine_1.md") == []
+
+
+@pytest.mark.parametrize("watcher_class", [InotifyWatcher, PollingWatcher])
+def test_new_period_folders_are_watched(repository, watcher_class):
+    year = repository / "cours/2023"
+    if watcher_class is PollingWatcher:
+        watcher = PollingWatcher([str(year / "periode_1")], [str(year)], interval=0.01)
+    else:
+        try:
+            watcher = InotifyWatcher([str(year / "periode_1")], [str(year)])
+        except (OSError, AttributeError):
+            pytest.skip("inotify unavailable")
+    try:
+        (year / "periode_2").mkdir()
+        # the new folder is found, it has no week file yet
+        assert watcher.wait(0.5) == set()
+        (year / "periode_2/semaine_43.md").write_text("# Semaine 43\n")
+        changed = watcher.wait(1.0)
+        assert {os.path.basename(path) for path in changed} == {"semaine_43.md"}
+    finally:
+        watcher.close()
+
+
+def test_a_file_whose_sync_failed_is_synced_again(repository, monkeypatch):
+    agenda = replace(AGENDA, git_repo_path=f"{repository}/cours/")
+    week = str(repository / "cours/2023/periode_1/semaine_36.md")
+    saves = [{week}, {week}, {week}]
+    reports = [SyncReport(failed=1), SyncReport(created=1), SyncReport(created=1)]
+    synced = []
+
+    class Watcher:
+        def wait(self, timeout=None):
+            if timeout is not None:
+                return set()
+            if not saves:
+                raise KeyboardInterrupt
+            with open(week, "a", encoding="utf-8") as week_file:
+                week_file.write("" if len(saves) < 3 else "\n")
+            return saves.pop(0)
+
+        def close(self):
+            pass
+
+    def sync_changed_file(agenda, service, path, arguments, journal=None):
+        synced.append(path)
+        return reports.pop(0)
+
+    monkeypatch.setattr(watch, "build_service", lambda agenda: None)
+    monkeypatch.setattr(watch, "make_watcher", lambda directories, roots: Watcher())
+    monkeypatch.setattr(watch, "sync_changed_file", sync_changed_file)
+
+    report = watch.watch_agendas([agenda], argparse.Namespace(journal=False))
+
+    assert synced == [week, week]
+    assert (report.created, report.failed) == (1, 1)